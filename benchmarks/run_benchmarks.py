@@ -0,0 +1,326 @@
+import argparse
+import builtins
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+
+import src.database as database
+import src.math_class as math_class
+import src.snapshot as snapshot
+from benchmarks.synthetic_db import generate_database
+
+#Times the main MathClass operations against synthetic databases and writes the results as JSON, so runs on two commits
+#can be compared with --compare. Run from the repository root: python -m benchmarks.run_benchmarks --sizes 1000 100000
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+#A compare run flags operations that got slower than this ratio.
+REGRESSION_THRESHOLD = 1.2
+
+
+@contextlib.contextmanager
+def answering_prompts(*answers):
+    #Stubs input() with fixed answers and hides printed output, so interactive methods can be timed.
+    replies = iter(answers)
+    original_input = builtins.input
+    builtins.input = lambda *args: next(replies)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        builtins.input = original_input
+
+
+class Workspace:
+    #Holds the generated database for one size. Operations that write get a fresh copy in their own directory,
+    #named like the default database so the interactive methods, which always use the default path, write to it.
+    def __init__(self, root, rows) -> None:
+        self.root = root
+        self.rows = rows
+        self.source = os.path.join(root, f"source-{rows}.db")
+        self.class_id = generate_database(self.source, rows)[0]
+        database.get_database(self.source).close()
+        self._copies = 0
+
+    def fresh_copy(self):
+        self._copies += 1
+        directory = os.path.join(self.root, f"run-{self.rows}-{self._copies}")
+        os.makedirs(directory)
+        path = os.path.join(directory, database.DEFAULT_DB_PATH)
+        shutil.copyfile(self.source, path)
+        os.chdir(directory)
+        return path
+
+    def load_class(self, db_path, lazy=False):
+        current_class = math_class.MathClass(self.class_id, "Synthetic")
+        current_class.load_exercises_from_database(db_path, lazy=lazy)
+        return current_class
+
+
+#Each benchmark does its untimed setup and returns the operation to time.
+def setup_load(workspace):
+    return lambda: workspace.load_class(workspace.source)
+
+
+def setup_load_lazy(workspace):
+    return lambda: workspace.load_class(workspace.source, lazy=True)
+
+
+def setup_get_due_exercises(workspace):
+    current_class = workspace.load_class(workspace.source, lazy=True)
+    return current_class.get_due_exercises
+
+
+def setup_save_changed(workspace):
+    #One percent of the class changed since the last save.
+    db_path = workspace.fresh_copy()
+    current_class = workspace.load_class(db_path, lazy=True)
+    for exercise in current_class.exercises[::100]:
+        exercise.start(datetime.date.today())
+    return lambda: current_class.save_to_db(db_path)
+
+
+def setup_save_all_new(workspace):
+    #Writes the whole class into an empty database.
+    current_class = workspace.load_class(workspace.source)
+    for exercise in current_class.exercises:
+        exercise.is_new = True
+        current_class._unit_of_work.register_new(exercise)
+    db_path = os.path.join(workspace.fresh_copy() + "-empty")
+    return lambda: current_class.save_to_db(db_path)
+
+
+def setup_mark_reviews_done(workspace):
+    db_path = workspace.fresh_copy()
+    current_class = workspace.load_class(db_path, lazy=True)
+
+    def operation():
+        with answering_prompts("0", "y"):
+            current_class.mark_reviews_done()
+    return operation
+
+
+def setup_start_next_exercise(workspace):
+    db_path = workspace.fresh_copy()
+    current_class = workspace.load_class(db_path, lazy=True)
+
+    def operation():
+        with answering_prompts("y"):
+            current_class.start_next_exercise()
+    return operation
+
+
+def setup_delete_exercise_from_db(workspace):
+    db_path = workspace.fresh_copy()
+    current_class = workspace.load_class(db_path, lazy=True)
+    exercise = current_class.exercises[len(current_class.exercises) // 2]
+    current_class._detach_exercise(exercise)
+
+    def operation():
+        with answering_prompts():
+            current_class.delete_exercise_from_db(*exercise.get_key(), dbpath=db_path)
+    return operation
+
+
+def setup_print_all_exercises(workspace):
+    #Full status listing of the class, written to a discarded stream so the timing covers formatting and writing.
+    current_class = workspace.load_class(workspace.source)
+    return lambda: current_class.print_all_exercises(out=io.StringIO())
+
+
+def setup_print_all_exercises_cached(workspace):
+    #The same listing again, with every line already formatted.
+    current_class = workspace.load_class(workspace.source)
+    current_class.print_all_exercises(out=io.StringIO())
+    return lambda: current_class.print_all_exercises(out=io.StringIO())
+
+
+def setup_status_page(workspace):
+    #First page of the stage 1 exercises of a lazily loaded class.
+    current_class = workspace.load_class(workspace.source, lazy=True)
+    return lambda: current_class.print_all_exercises(stages=[1], limit=50, out=io.StringIO())
+
+
+def setup_search_exercises(workspace):
+    #A name search and an ID prefix search in a lazily loaded class.
+    current_class = workspace.load_class(workspace.source, lazy=True)
+
+    def operation():
+        current_class.search_exercises("exercise 12", db_path=workspace.source)
+        current_class.search_exercises("3.2", db_path=workspace.source)
+    return operation
+
+
+def setup_due_dashboard(workspace):
+    #Due and problem counts of every class, as shown when the program starts.
+    return lambda: math_class.get_due_dashboard(db_path=workspace.source)
+
+
+def setup_snapshot_load(workspace):
+    #Opening a class whose snapshot is current, as main.py does on start.
+    db_path = workspace.fresh_copy()
+    snapshot.load_class(workspace.class_id, "Synthetic", db_path)
+    return lambda: snapshot.load_class(workspace.class_id, "Synthetic", db_path)
+
+
+def setup_snapshot_refresh(workspace):
+    #Opening a class after one day of reviews was saved since its snapshot was taken.
+    db_path = workspace.fresh_copy()
+    snapshot.load_class(workspace.class_id, "Synthetic", db_path)
+    math_class.bulk_advance_reviews(datetime.date.today(), [workspace.class_id], db_path)
+    return lambda: snapshot.load_class(workspace.class_id, "Synthetic", db_path)
+
+
+def setup_snapshot_rebuild(workspace):
+    #Opening a class with no snapshot yet, which reads the whole class and writes its snapshot.
+    db_path = workspace.fresh_copy()
+    return lambda: snapshot.load_class(workspace.class_id, "Synthetic", db_path)
+
+
+def setup_migrate_unversioned(workspace):
+    #Builds a copy of the data in the unversioned schema the database shipped with before migrations existed,
+    #with TEXT dates, so the timing covers every migration including the table rebuilds and index builds.
+    directory = os.path.dirname(workspace.fresh_copy())
+    db_path = os.path.join(directory, "unversioned.db")
+    conn = sqlite3.connect(db_path)
+    conn.executescript(f"""
+        CREATE TABLE classes (class_id INTEGER PRIMARY KEY, class_name TEXT NOT NULL);
+        CREATE TABLE exercises (chapter INTEGER, unit INTEGER, number INTEGER, name TEXT, web_link TEXT, class_id INTEGER,
+                                current_stage INTEGER, last_review_date TEXT, due_date TEXT,
+                                PRIMARY KEY (chapter, unit, number, class_id),
+                                FOREIGN KEY (class_id) REFERENCES classes(class_id));
+        ATTACH DATABASE '{workspace.source}' AS source;
+        INSERT INTO classes SELECT class_id, class_name FROM source.classes;
+        INSERT INTO exercises SELECT chapter, unit, number, name, web_link, class_id, current_stage,
+                                     date(last_review_date + 1721424.5), date(due_date + 1721424.5)
+                              FROM source.exercises;
+        DETACH DATABASE source;""")
+    conn.close()
+    return lambda: open_database(db_path)
+
+
+def setup_open_migrated(workspace):
+    #Startup cost of opening a database that is already at the latest schema version.
+    return lambda: open_database(workspace.source)
+
+
+def open_database(db_path):
+    #Opens the first connection, which checks and applies migrations, outside the shared registry.
+    db = database.Database(db_path)
+    db.connection
+    db.close()
+
+
+BENCHMARKS = {
+    "load_exercises_from_database": setup_load,
+    "load_exercises_from_database_lazy": setup_load_lazy,
+    "get_due_exercises": setup_get_due_exercises,
+    "save_to_db_1pct_changed": setup_save_changed,
+    "save_to_db_all_new": setup_save_all_new,
+    "mark_reviews_done": setup_mark_reviews_done,
+    "start_next_exercise": setup_start_next_exercise,
+    "delete_exercise_from_db": setup_delete_exercise_from_db,
+    "print_all_exercises": setup_print_all_exercises,
+    "print_all_exercises_cached": setup_print_all_exercises_cached,
+    "status_page": setup_status_page,
+    "search_exercises": setup_search_exercises,
+    "due_dashboard": setup_due_dashboard,
+    "snapshot_load": setup_snapshot_load,
+    "snapshot_refresh": setup_snapshot_refresh,
+    "snapshot_rebuild": setup_snapshot_rebuild,
+    "migrate_unversioned": setup_migrate_unversioned,
+    "open_migrated": setup_open_migrated,
+}
+
+
+def time_benchmark(workspace, setup, repeat):
+    timings = []
+    for _ in range(repeat):
+        operation = setup(workspace)
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+        os.chdir(workspace.root)
+    return timings
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeat, selected=None):
+    #Returns the results document for the given sizes.
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="smr-bench-") as root:
+        try:
+            for rows in sizes:
+                workspace = Workspace(root, rows)
+                for name, setup in BENCHMARKS.items():
+                    if selected and name not in selected:
+                        continue
+                    timings = time_benchmark(workspace, setup, repeat)
+                    results.append({"operation": name, "rows": rows, "repeat": repeat,
+                                    "min_s": min(timings), "median_s": statistics.median(timings)})
+                    print(f"{rows:>9} {name:36} min {min(timings) * 1000:10.2f} ms")
+                database.close_all_databases()
+        finally:
+            os.chdir(cwd)
+            database.close_all_databases()
+    return {"meta": {"commit": _git_commit(), "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                     "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform()},
+            "results": results}
+
+
+def compare(baseline, current):
+    #Prints the change in min time per operation and size. Returns the number of regressions.
+    previous = {(r["operation"], r["rows"]): r["min_s"] for r in baseline["results"]}
+    regressions = 0
+    print(f"\nCompared with {baseline['meta'].get('commit')}:")
+    for result in current["results"]:
+        before = previous.get((result["operation"], result["rows"]))
+        if not before:
+            continue
+        ratio = result["min_s"] / before
+        flag = ""
+        if ratio > REGRESSION_THRESHOLD:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{result['rows']:>9} {result['operation']:36} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run_benchmarks", description="Time MathClass operations.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="exercise counts, up to 1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--output", default="benchmark-results.json", help="JSON results file (default: %(default)s)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    current = run(args.sizes, args.repeat, args.only)
+    with open(args.output, "w", encoding="utf-8") as out:
+        json.dump(current, out, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(json.load(file), current)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
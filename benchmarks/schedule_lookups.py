@@ -0,0 +1,63 @@
+import argparse
+import datetime
+import time
+import tracemalloc
+
+import src.math_class as math_class
+
+#Compares the compiled schedule lookups with the dict literals the exercise methods used to build on every call,
+#by time and by memory allocated while running. Run from the repository root: python -m benchmarks.schedule_lookups
+
+
+def dict_literal_lookups(exercises):
+    #The old Exercise._get_due_date_modifier and get_num_of_exercises, which built their dict on every call.
+    #The interval dict was keyed by the stage advanced into.
+    total = 0
+    for exercise in exercises:
+        total += {1:1, 2:3, 3:7, 4:14, 5:28}[exercise.current_stage + 1]
+        total += {1:5, 2:3, 3:2, 4:1, 5:1}[exercise.current_stage]
+    return total
+
+
+def compiled_lookups(exercises):
+    total = 0
+    for exercise in exercises:
+        schedule = exercise.get_schedule()
+        total += schedule.next_intervals[exercise.current_stage]
+        total += exercise.get_num_of_exercises()
+    return total
+
+
+def measure(lookups, exercises):
+    #Times one pass, then traces a second one. Returns (seconds, peak bytes allocated during the pass, bytes still held after it).
+    started = time.perf_counter()
+    lookups(exercises)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    lookups(exercises)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak - before, after - before
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.schedule_lookups", description="Time schedule lookups and trace their allocations.")
+    parser.add_argument("--calls", type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    current_class = math_class.MathClass(1, "Lookups")
+    #Stages 1 to 4, which are reviewed and do not retire the exercise when advanced.
+    for number in range(1, 5):
+        current_class.attach_exercise(math_class.Exercise(1, 1, number, "", "", 1, number, None, datetime.date(2023, 1, 1)))
+    exercises = current_class.exercises * (args.calls // 4)
+    print(f"{len(exercises)} exercises, one interval and one problem lookup each")
+    for name, lookups in (("dict literals", dict_literal_lookups), ("compiled schedule", compiled_lookups)):
+        elapsed, peak, retained = measure(lookups, exercises)
+        print(f"{name:18} {elapsed * 1000:9.2f} ms  peak allocated {peak:8} bytes  retained {retained:6} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
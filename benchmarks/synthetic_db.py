@@ -0,0 +1,74 @@
+import argparse
+import datetime
+import random
+
+import src.database as database
+import src.math_class as math_class
+
+#Share of exercises at each stage in a class that has been running for a while: a backlog not yet started,
+#a spread across the review stages, and a tail of retired exercises.
+STAGE_WEIGHTS = {0: 0.35, 1: 0.05, 2: 0.08, 3: 0.10, 4: 0.12, 5: 0.12, 6: 0.18}
+
+#Share of in-rotation exercises whose review was missed, so they are overdue by a few days.
+OVERDUE_SHARE = 0.1
+
+INSERT_BATCH_SIZE = 10000
+
+
+def iter_synthetic_exercises(class_id, count, today, rng, units_per_chapter=10, exercises_per_unit=50):
+    #Yields exercise rows for one class in (chapter, unit, number) order, with stages and dates consistent with the schedule.
+    stages = list(STAGE_WEIGHTS)
+    weights = list(STAGE_WEIGHTS.values())
+    for index in range(count):
+        chapter = index // (units_per_chapter * exercises_per_unit) + 1
+        unit = index // exercises_per_unit % units_per_chapter + 1
+        number = index % exercises_per_unit + 1
+        stage = rng.choices(stages, weights)[0]
+        last_review_date = due_date = None
+        if stage == math_class.RETIRED_STAGE:
+            last_review_date = today - datetime.timedelta(days=rng.randint(1, 365))
+        elif stage > 0:
+            interval = math_class.DUE_DATE_MODIFIERS[stage]
+            if rng.random() < OVERDUE_SHARE:
+                due_date = today - datetime.timedelta(days=rng.randint(1, 7))
+            else:
+                due_date = today + datetime.timedelta(days=rng.randint(0, interval))
+            if stage > 1:
+                last_review_date = due_date - datetime.timedelta(days=interval)
+        yield (chapter, unit, number, f"Exercise {chapter}.{unit}.{number}", f"https://example.com/{chapter}/{unit}/{number}",
+               class_id, stage, last_review_date, due_date)
+
+
+def generate_database(db_path, exercise_count, class_count=1, today=None, seed=0):
+    #Creates a database with class_count classes sharing exercise_count exercises. Returns the class IDs.
+    today = today or datetime.date.today()
+    rng = random.Random(seed)
+    db = database.get_database(db_path)
+    class_ids = [db.create_class(f"Synthetic class {index + 1}") for index in range(class_count)]
+    per_class = [exercise_count // class_count + (1 if index < exercise_count % class_count else 0) for index in range(class_count)]
+    for class_id, count in zip(class_ids, per_class):
+        rows = iter_synthetic_exercises(class_id, count, today, rng)
+        while True:
+            batch = [row for _, row in zip(range(INSERT_BATCH_SIZE), rows)]
+            if not batch:
+                break
+            with db.transaction() as cursor:
+                cursor.executemany(database.INSERT_EXERCISE, batch)
+    #Rows inserted directly are not in the search index yet.
+    db.rebuild_search_index()
+    return class_ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.synthetic_db", description="Generate a synthetic database.")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=100000, help="exercises in total (default: %(default)s)")
+    parser.add_argument("--classes", type=int, default=1, help="classes to spread them over (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    class_ids = generate_database(args.path, args.rows, args.classes, seed=args.seed)
+    print(f"Wrote {args.rows} exercises in {len(class_ids)} classes to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+import argparse
+import datetime
+import json
+import sys
+
+import src.database as database
+import src.math_class as math_class
+import src.rendering as rendering
+import src.scheduling as scheduling
+
+#Non-interactive entry point for scripts and cron jobs. Every command accepts many class IDs (or --all) and runs them
+#in one process over one shared database connection. Run as: python -m src.cli [--db PATH] [--json] COMMAND ...
+
+
+def _parse_date(value):
+    try:
+        return math_class.parse_date_string(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive whole number")
+    return number
+
+
+def _add_class_arguments(parser):
+    parser.add_argument("class_ids", metavar="CLASS_ID", type=int, nargs="*", help="classes to work on")
+    parser.add_argument("--all", action="store_true", help="work on every class in the database")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Spaced Math Review batch commands.")
+    parser.add_argument("--db", default=database.DEFAULT_DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    due = commands.add_parser("due", help="list exercises due on or before a date")
+    _add_class_arguments(due)
+    due.add_argument("--date", type=_parse_date, help="YYYY-MM-DD, default today")
+
+    advance = commands.add_parser("advance", help="mark reviews done and advance due exercises")
+    _add_class_arguments(advance)
+    advance.add_argument("--date", type=_parse_date, required=True, help="date the reviews were completed, YYYY-MM-DD")
+
+    start_next = commands.add_parser("start-next", help="put the next stage 0 exercises into rotation")
+    _add_class_arguments(start_next)
+    start_next.add_argument("-n", type=_positive_int, default=1, help="exercises to start per class (default: 1)")
+    start_next.add_argument("--date", type=_parse_date, help="start date, YYYY-MM-DD, default today")
+
+    status = commands.add_parser("status", help="show exercise counts per stage and due today")
+    _add_class_arguments(status)
+    status.add_argument("--date", type=_parse_date, help="date to count due exercises for, default today")
+    status.add_argument("--list", action="store_true", help="also list the exercises, a page at a time")
+    status.add_argument("--stage", type=int, nargs="+", help="list only exercises at these stages")
+    status.add_argument("--chapter", type=int, nargs="+", help="list only exercises in these chapters")
+    status.add_argument("--limit", type=int, default=50, help="exercises listed per page (default: %(default)s)")
+    status.add_argument("--page", type=int, default=1, help="page of the listing to show (default: %(default)s)")
+
+    dashboard = commands.add_parser("dashboard", help="show what is due in every class")
+    dashboard.add_argument("--date", type=_parse_date, help="count exercises due on or before this date, default today")
+
+    forecast = commands.add_parser("forecast", help="project reviews and problems per day from the current schedule")
+    _add_class_arguments(forecast)
+    forecast.add_argument("--days", type=_positive_int, default=14, help="days to forecast (default: %(default)s)")
+    forecast.add_argument("--date", type=_parse_date, help="first forecast day, YYYY-MM-DD, default today")
+
+    auto_start = commands.add_parser("auto-start", help="start as many stage 0 exercises as fit a daily problem budget")
+    _add_class_arguments(auto_start)
+    auto_start.add_argument("--budget", type=int, required=True, help="most problems to work on any one day")
+    auto_start.add_argument("--days", type=_positive_int, default=90, help="days the budget must hold for (default: %(default)s)")
+    auto_start.add_argument("--date", type=_parse_date, help="start date, YYYY-MM-DD, default today")
+
+    reviews = commands.add_parser("reviews", help="count reviews done per day from the review log")
+    _add_class_arguments(reviews)
+    reviews.add_argument("--days", type=_positive_int, default=365, help="days to count back from --date (default: %(default)s)")
+    reviews.add_argument("--date", type=_parse_date, help="last day to count, YYYY-MM-DD, default today")
+
+    compact = commands.add_parser("compact-reviews", help="roll old review log entries into per-day counts")
+    compact.add_argument("--keep-days", type=int, default=90, help="days of per-exercise history to keep (default: %(default)s)")
+    compact.add_argument("--date", type=_parse_date, help="count kept days back from this date, default today")
+
+    schedule = commands.add_parser("schedule", help="show or change the review schedule of a class")
+    schedule.add_argument("class_id", metavar="CLASS_ID", type=int)
+    schedule_choice = schedule.add_mutually_exclusive_group()
+    schedule_choice.add_argument("--intervals", type=int, nargs="+", metavar="DAYS",
+                                 help="days until the next review when advancing into each stage, from stage 1")
+    schedule_choice.add_argument("--sm2", type=float, metavar="EASE", help="SM-2 style intervals with this ease factor")
+    schedule_choice.add_argument("--default", action="store_true", help="go back to the default schedule")
+    schedule.add_argument("--problems", type=int, nargs="+", help="problems per stage, from stage 1 (default: the usual 5 3 2 1 1)")
+
+    search = commands.add_parser("search", help="find exercises by name or by the start of chapter.unit.number")
+    search.add_argument("class_id", metavar="CLASS_ID", type=int)
+    search.add_argument("query", nargs="+", help="words of the name, or an exercise number prefix such as 3.2")
+    search.add_argument("--limit", type=int, default=20, help="most exercises to show (default: %(default)s)")
+
+    import_parser = commands.add_parser("import", help="bulk import exercises from a CSV or JSONL file")
+    import_parser.add_argument("class_id", metavar="CLASS_ID", type=int)
+    import_parser.add_argument("path", help="file to import")
+    import_parser.add_argument("--format", choices=["csv", "jsonl"], help="file format, default from the extension")
+    import_parser.add_argument("--chunk-size", type=int, default=5000, help="rows per transaction (default: %(default)s)")
+
+    delete = commands.add_parser("delete", help="delete exercises by chapter.unit.number")
+    delete.add_argument("class_id", metavar="CLASS_ID", type=int)
+    delete.add_argument("exercise_ids", metavar="EXERCISE", nargs="+", help="exercise as chapter.unit.number")
+
+    return parser
+
+
+def _resolve_classes(args, db, parser):
+    #Returns [(class_id, class_name)] for the requested classes, failing on unknown IDs.
+    classes = dict(db.get_classes())
+    if args.all:
+        return list(classes.items())
+    if not args.class_ids:
+        parser.error("give at least one CLASS_ID or --all")
+    unknown = [class_id for class_id in args.class_ids if class_id not in classes]
+    if unknown:
+        parser.error(f"unknown class IDs: {', '.join(map(str, unknown))}")
+    return [(class_id, classes[class_id]) for class_id in args.class_ids]
+
+
+def _load_class(class_id, class_name, db_path):
+    #Loads only the scheduling columns. Names and links are fetched for the exercises that get printed.
+    current_class = math_class.MathClass(class_id, class_name)
+    current_class.load_exercises_from_database(db_path, lazy=True)
+    return current_class
+
+
+def _parse_exercise_id(value, parser):
+    parts = value.split(".")
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        parser.error(f"exercise {value!r} must be chapter.unit.number")
+    return tuple(int(part) for part in parts)
+
+
+def _exercise_to_dict(exercise):
+    return {"id": exercise.get_exercise_id_string(), "name": exercise.name, "web_link": exercise.web_link,
+            "stage": exercise.current_stage,
+            "last_review_date": exercise.last_review_date.isoformat() if exercise.last_review_date else None,
+            "due_date": exercise.due_date.isoformat() if exercise.due_date else None}
+
+
+def run_due(args, db, parser):
+    due_date = args.date or datetime.datetime.today().date()
+    results = []
+    for class_id, class_name in _resolve_classes(args, db, parser):
+        exercises = [math_class.Exercise(*row) for row in db.load_due_exercises(class_id, due_date)]
+        results.append({"class_id": class_id, "class_name": class_name, "date": due_date.isoformat(),
+                        "exercises": [_exercise_to_dict(exercise) for exercise in exercises]})
+    lines = []
+    for result in results:
+        lines.append(f"{result['class_id']}: {result['class_name']} - {len(result['exercises'])} due on or before {result['date']}")
+        lines.extend(f"  {e['id']:12}{(e['name'] or '')[:50]:50}{e['stage']:<7}{e['due_date']}" for e in result["exercises"])
+    return results, lines
+
+
+def run_advance(args, db, parser):
+    class_ids = [class_id for class_id, _ in _resolve_classes(args, db, parser)]
+    counts = math_class.bulk_advance_reviews(args.date, class_ids, args.db)
+    results = [{"class_id": class_id, "advanced": counts.get(class_id, 0)} for class_id in class_ids]
+    lines = [f"{result['class_id']}: {result['advanced']} exercises advanced using review date {args.date}" for result in results]
+    return results, lines
+
+
+def run_start_next(args, db, parser):
+    start_date = args.date or datetime.datetime.today().date()
+    results = []
+    for class_id, class_name in _resolve_classes(args, db, parser):
+        current_class = _load_class(class_id, class_name, args.db)
+        started = current_class.start_next_exercises(args.n, start_date, args.db)
+        results.append({"class_id": class_id, "started": [exercise.get_exercise_id_string() for exercise in started],
+                        "remaining_stage_0": current_class.get_stage_histogram()[0]})
+    lines = [f"{r['class_id']}: started {', '.join(r['started']) or 'nothing'} ({r['remaining_stage_0']} left at stage 0)"
+             for r in results]
+    return results, lines
+
+
+def run_status(args, db, parser):
+    due_date = args.date or datetime.datetime.today().date()
+    classes = _resolve_classes(args, db, parser)
+    stage_counts = db.count_stages([class_id for class_id, _ in classes])
+    results = []
+    for class_id, class_name in classes:
+        last_stage = max([math_class.RETIRED_STAGE, *stage_counts[class_id]])
+        stages = {stage: stage_counts[class_id].get(stage, 0) for stage in range(last_stage + 1)}
+        results.append({"class_id": class_id, "class_name": class_name, "exercises": sum(stages.values()),
+                        "stages": stages, "due": db.count_due(class_id, due_date)})
+    listings = {}
+    if args.list or args.stage or args.chapter:
+        if args.limit < 1 or args.page < 1:
+            parser.error("--limit and --page must be at least 1")
+        offset = (args.page - 1) * args.limit
+        for result in results:
+            matching, rows = db.load_exercise_page(result["class_id"], args.stage, args.chapter, args.limit, offset)
+            listings[result["class_id"]] = exercises = [math_class.Exercise(*row) for row in rows]
+            result["listing"] = {"matching": matching, "page": args.page, "offset": offset,
+                                 "exercises": [_exercise_to_dict(exercise) for exercise in exercises]}
+    lines = []
+    for r in results:
+        stages = " ".join(f"{stage}:{count}" for stage, count in r["stages"].items())
+        lines.append(f"{r['class_id']}: {r['class_name']} - {r['exercises']} exercises, {r['due']} due. Stages {stages}")
+        if "listing" in r:
+            listing = r["listing"]
+            shown = len(listing["exercises"])
+            lines.append(f"  Page {listing['page']}: exercises {listing['offset'] + 1 if shown else 0}-{listing['offset'] + shown} "
+                         f"of {listing['matching']} matching")
+            if shown:
+                lines.append(rendering.render_lines(listings[r["class_id"]], header=True).rstrip("\n"))
+    return results, lines
+
+
+def run_dashboard(args, db, parser):
+    due_date = args.date or datetime.datetime.today().date()
+    results = [{"class_id": class_id, "class_name": class_name, "due": due, "problems": problems, "stages": stages}
+               for class_id, class_name, due, problems, stages in math_class.get_due_dashboard(due_date, args.db)]
+    lines = [f"{r['class_id']}: {r['class_name']} - {r['due']} due, {r['problems']} problems on or before {due_date}"
+             for r in results]
+    return results, lines
+
+
+def run_forecast(args, db, parser):
+    results = []
+    for class_id, class_name in _resolve_classes(args, db, parser):
+        forecast = _load_class(class_id, class_name, args.db).forecast_workload(args.days, args.date)
+        results.append({"class_id": class_id, "class_name": class_name,
+                        "days": [{"date": date.isoformat(), "reviews": reviews, "problems": problems}
+                                 for date, reviews, problems in forecast]})
+    lines = []
+    for result in results:
+        lines.append(f"{result['class_id']}: {result['class_name']}")
+        lines.extend(f"  {day['date']}  {day['reviews']:>6} reviews {day['problems']:>7} problems" for day in result["days"])
+    return results, lines
+
+
+def run_auto_start(args, db, parser):
+    start_date = args.date or datetime.datetime.today().date()
+    results = []
+    for class_id, class_name in _resolve_classes(args, db, parser):
+        current_class = _load_class(class_id, class_name, args.db)
+        started = current_class.auto_schedule(args.budget, args.days, start_date, args.db)
+        results.append({"class_id": class_id, "started": [exercise.get_exercise_id_string() for exercise in started],
+                        "remaining_stage_0": current_class.get_stage_histogram()[0]})
+    lines = [f"{r['class_id']}: started {len(r['started'])} exercises within a budget of {args.budget} problems a day "
+             f"({r['remaining_stage_0']} left at stage 0)" for r in results]
+    return results, lines
+
+
+def run_reviews(args, db, parser):
+    end_date = args.date or datetime.datetime.today().date()
+    start_date = end_date - datetime.timedelta(days=args.days - 1)
+    results = []
+    for class_id, class_name in _resolve_classes(args, db, parser):
+        counts = {}
+        for review_date, stage, count in db.count_reviews_per_day(class_id, start_date, end_date):
+            day = counts.setdefault(review_date.isoformat(), {"date": review_date.isoformat(), "reviews": 0, "stages": {}})
+            day["reviews"] += count
+            day["stages"][stage] = count
+        results.append({"class_id": class_id, "class_name": class_name, "days": list(counts.values())})
+    lines = []
+    for result in results:
+        lines.append(f"{result['class_id']}: {result['class_name']} - {sum(day['reviews'] for day in result['days'])} reviews "
+                     f"from {start_date} to {end_date}")
+        lines.extend(f"  {day['date']}  {day['reviews']:>6}" for day in result["days"])
+    return results, lines
+
+
+def run_compact_reviews(args, db, parser):
+    before_date = (args.date or datetime.datetime.today().date()) - datetime.timedelta(days=args.keep_days)
+    compacted = db.compact_reviews(before_date)
+    return {"before": before_date.isoformat(), "compacted": compacted}, [f"Compacted {compacted} reviews from before {before_date}."]
+
+
+def run_schedule(args, db, parser):
+    classes = dict(db.get_classes())
+    if args.class_id not in classes:
+        parser.error(f"unknown class ID: {args.class_id}")
+    current_class = _load_class(args.class_id, classes[args.class_id], args.db)
+    problems = args.problems or [math_class.PROBLEMS_PER_STAGE[stage] for stage in range(1, math_class.RETIRED_STAGE)]
+    if args.intervals:
+        current_class.set_schedule(scheduling.fixed_schedule(args.intervals, problems), args.db)
+    elif args.sm2:
+        current_class.set_schedule(scheduling.sm2_schedule(args.sm2, problems), args.db)
+    elif args.default:
+        current_class.set_schedule(scheduling.DEFAULT_SCHEDULE, args.db)
+    schedule = current_class.schedule
+    result = {"class_id": args.class_id, "spec": json.loads(schedule.spec), "terminal_stage": schedule.terminal_stage,
+              "intervals": list(schedule.next_intervals[1:-1]), "problems": list(schedule.problems[1:-1])}
+    return result, [f"{args.class_id}: {classes[args.class_id]} - {schedule.describe()}"]
+
+
+def run_search(args, db, parser):
+    classes = dict(db.get_classes())
+    if args.class_id not in classes:
+        parser.error(f"unknown class ID: {args.class_id}")
+    query = " ".join(args.query)
+    keys = db.search_exercises(args.class_id, query, args.limit)
+    exercises = [math_class.Exercise(*row) for row in db.load_exercises_by_key(args.class_id, keys)]
+    result = {"class_id": args.class_id, "query": query, "exercises": [_exercise_to_dict(exercise) for exercise in exercises]}
+    lines = [f"{args.class_id}: {classes[args.class_id]} - {len(exercises)} exercises matching {query!r}"]
+    if exercises:
+        lines.append(rendering.render_lines(exercises, header=True).rstrip("\n"))
+    return result, lines
+
+
+def run_import(args, db, parser):
+    classes = dict(db.get_classes())
+    if args.class_id not in classes:
+        parser.error(f"unknown class ID: {args.class_id}")
+    current_class = _load_class(args.class_id, classes[args.class_id], args.db)
+    report = current_class.import_exercises(args.path, args.format, args.chunk_size, args.db)
+    result = {"class_id": args.class_id, "path": args.path, "rows_read": report.rows_read, "imported": report.imported,
+              "rejected": report.rejected, "rejected_rows": [{"line": line, "reason": reason} for line, reason in report.rejected_rows],
+              "seconds": report.elapsed, "rows_per_second": report.rows_per_second()}
+    return result, [report.summary()]
+
+
+def run_delete(args, db, parser):
+    classes = dict(db.get_classes())
+    if args.class_id not in classes:
+        parser.error(f"unknown class ID: {args.class_id}")
+    keys = [_parse_exercise_id(value, parser) for value in args.exercise_ids]
+    current_class = _load_class(args.class_id, classes[args.class_id], args.db)
+    results = [{"class_id": args.class_id, "exercise": ".".join(map(str, key)),
+                "deleted": current_class.remove_exercise(*key, db_path=args.db)} for key in keys]
+    lines = [f"Exercise {r['exercise']} {'deleted' if r['deleted'] else 'not found'}." for r in results]
+    return results, lines
+
+
+COMMANDS = {"due": run_due, "advance": run_advance, "start-next": run_start_next, "status": run_status, "dashboard": run_dashboard,
+            "forecast": run_forecast, "auto-start": run_auto_start,
+            "reviews": run_reviews, "compact-reviews": run_compact_reviews,
+            "schedule": run_schedule, "search": run_search, "import": run_import, "delete": run_delete}
+
+
+def main(argv=None, out=None):
+    out = out or sys.stdout
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    db = database.get_database(args.db)
+    try:
+        results, lines = COMMANDS[args.command](args, db, parser)
+    except (OSError, ValueError) as e:
+        print(f"{parser.prog} {args.command}: error: {e}", file=sys.stderr)
+        return 1
+    if args.json:
+        json.dump(results, out, indent=2)
+        out.write("\n")
+    else:
+        out.write("\n".join(lines) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,550 @@
+import atexit
+import contextlib
+import datetime
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+import src.instrumentation as instrumentation
+import src.migrations as migrations
+
+DEFAULT_DB_PATH = 'spaced-math-review.db'
+
+#Dates are stored as integer day numbers, date.toordinal(), in columns declared as DAY. Date parameters are converted
+#by this adapter instead of sqlite3's deprecated default one, and columns selected as "name [DAY]" come back as dates.
+#Exercise loads read the plain day numbers and convert them through math_class.day_to_date.
+sqlite3.register_adapter(datetime.date, datetime.date.toordinal)
+sqlite3.register_converter("DAY", lambda value: datetime.date.fromordinal(int(value)))
+
+#Statements are kept as module constants so sqlite3's per-connection statement cache reuses the prepared statement.
+SELECT_CLASSES = "SELECT class_id, class_name FROM classes ORDER BY class_id"
+INSERT_CLASS = "INSERT INTO classes (class_name) VALUES (?)"
+
+EXERCISE_COLUMNS = "chapter, unit, number, name, web_link, class_id, current_stage, last_review_date, due_date, version"
+
+SELECT_EXERCISES = '''SELECT chapter, unit, number, name, web_link, class_id, current_stage, last_review_date, due_date, version
+                      FROM exercises WHERE class_id = ? ORDER BY chapter, unit, number'''
+
+#Lazy loading reads only the columns needed for scheduling. Names and links are fetched by key when needed.
+SELECT_EXERCISE_SCHEDULES = '''SELECT chapter, unit, number, class_id, current_stage, last_review_date, due_date, version
+                               FROM exercises WHERE class_id = ? ORDER BY chapter, unit, number'''
+
+SELECT_DUE_EXERCISES = '''SELECT chapter, unit, number, name, web_link, class_id, current_stage, last_review_date, due_date, version
+                          FROM exercises WHERE class_id = ? AND due_date <= ? ORDER BY chapter, unit, number'''
+
+DELETE_EXERCISE = "DELETE FROM exercises WHERE chapter = ? AND unit = ? AND number = ? AND class_id = ?"
+
+#New rows start at version 0. An exercise another writer already created is left alone and reported as a conflict.
+INSERT_EXERCISE = '''INSERT INTO exercises
+                     (chapter, unit, number, name, web_link, class_id, current_stage, last_review_date, due_date)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     ON CONFLICT (chapter, unit, number, class_id) DO NOTHING'''
+
+#The full-text index of names follows exercise inserts and deletes in the same transaction, see migration 7.
+#New rows get rowids above the largest one present, so the rows inserted by a save are those above the largest rowid
+#left after its deletes.
+SELECT_MAX_ROWID = "SELECT COALESCE(MAX(rowid), 0) FROM exercises"
+INDEX_NEW_EXERCISES = "INSERT INTO exercise_search (rowid, name, class_id) SELECT rowid, name, class_id FROM exercises WHERE rowid > ?"
+UNINDEX_EXERCISE = '''DELETE FROM exercise_search WHERE rowid =
+                      (SELECT rowid FROM exercises WHERE chapter = ? AND unit = ? AND number = ? AND class_id = ?)'''
+
+#Rows of a class as kept in a snapshot. Rows are matched by rowid together with their key and version, because SQLite
+#hands the rowid of a deleted last row to the next row added, which starts again at version 0.
+SNAPSHOT_COLUMNS = "rowid, chapter, unit, number, name, web_link, current_stage, last_review_date, due_date, version"
+
+#Names matching a full-text query in one class, best match first. Column weights leave the class_id column out of the rank.
+SEARCH_NAMES = '''SELECT e.chapter, e.unit, e.number FROM exercise_search JOIN exercises AS e ON e.rowid = exercise_search.rowid
+                  WHERE exercise_search MATCH ? ORDER BY bm25(exercise_search, 1.0, 0.0) LIMIT ?'''
+
+#IDs starting with a "chapter.unit.number" prefix, answered from the exercises_id_string index as a range scan.
+SEARCH_ID_PREFIX = '''SELECT chapter, unit, number FROM exercises
+                      WHERE class_id = ? AND (chapter || '.' || unit || '.' || number) >= ?
+                        AND (chapter || '.' || unit || '.' || number) < ?
+                      ORDER BY chapter, unit, number LIMIT ?'''
+
+#Only scheduling columns change after an exercise is created, so updates never need the name or link.
+#Compare-and-swap on version: the update only applies if nobody else saved the row since it was loaded.
+UPDATE_EXERCISE = '''UPDATE exercises SET current_stage = ?, last_review_date = ?, due_date = ?, version = version + 1
+                     WHERE chapter = ? AND unit = ? AND number = ? AND class_id = ? AND version = ?'''
+
+INSERT_REVIEW = "INSERT INTO reviews (class_id, chapter, unit, number, review_date, stage) VALUES (?, ?, ?, ?, ?, ?)"
+
+SELECT_REVIEW_HISTORY = '''SELECT review_date AS "review_date [DAY]", stage FROM reviews
+                           WHERE class_id = ? AND chapter = ? AND unit = ? AND number = ? ORDER BY review_date'''
+
+#Compacted days come from review_daily_counts and the rest from the log, both read through their primary key or covering index.
+SELECT_REVIEWS_PER_DAY = '''SELECT review_date AS "review_date [DAY]", stage, SUM(review_count) FROM (
+                                SELECT review_date, stage, review_count FROM review_daily_counts
+                                WHERE class_id = ? AND review_date BETWEEN ? AND ?
+                                UNION ALL
+                                SELECT review_date, stage, COUNT(*) FROM reviews
+                                WHERE class_id = ? AND review_date BETWEEN ? AND ? GROUP BY review_date, stage)
+                            GROUP BY review_date, stage ORDER BY review_date, stage'''
+
+COMPACT_REVIEWS = '''INSERT INTO review_daily_counts (class_id, review_date, stage, review_count)
+                     SELECT class_id, review_date, stage, COUNT(*) FROM reviews WHERE review_date < ?
+                     GROUP BY class_id, review_date, stage
+                     ON CONFLICT (class_id, review_date, stage) DO UPDATE SET review_count = review_count + excluded.review_count'''
+
+#Writes that still find the database locked after the busy timeout are retried this many times,
+#waiting LOCK_RETRY_DELAY seconds before the first retry and doubling the wait each time, plus random jitter.
+LOCK_RETRIES = 4
+LOCK_RETRY_DELAY = 0.05
+
+#Keys per details query, keeping the bound parameters well under SQLite's limit.
+DETAILS_CHUNK_SIZE = 500
+
+
+class Database:
+    #Repository that owns the connections to one database file and routes all of the program's SQL.
+    #Each thread gets one long-lived connection, so threaded callers share a small pool instead of reconnecting per call.
+    #Note that ':memory:' databases are per connection, so they are only shared within a single thread.
+    def __init__(self, db_path=DEFAULT_DB_PATH, busy_timeout_ms=5000, cache_size_kib=20000) -> None:
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kib = cache_size_kib
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._write_listeners = []
+
+    @property
+    def connection(self):
+        #Returns this thread's connection, opening it on first use.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.traced = False
+        if self._local.traced is not instrumentation.ENABLED:
+            #Statement counting only costs anything while instrumentation is on.
+            conn.set_trace_callback(instrumentation.count_statement if instrumentation.ENABLED else None)
+            self._local.traced = instrumentation.ENABLED
+        return conn
+
+    def _connect(self):
+        #Autocommit mode lets transaction() control BEGIN/COMMIT explicitly.
+        instrumentation.increment("sqlite_connections_opened")
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False, cached_statements=256,
+                               detect_types=sqlite3.PARSE_COLNAMES)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            self._connections.append(conn)
+            if not self._schema_ready:
+                #Schema changes are checked once per process, on the first connection. See src/migrations.py.
+                migrations.migrate(conn)
+                self._schema_ready = True
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self, mode=""):
+        #Runs the enclosed statements in a single transaction. Rolls back if anything raises.
+        #mode can be "IMMEDIATE" to take the write lock up front, for reads that must agree with the writes that follow.
+        conn = self.connection
+        cursor = conn.cursor()
+        cursor.execute(f"BEGIN {mode}")
+        try:
+            yield cursor
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            cursor.execute("COMMIT")
+        finally:
+            cursor.close()
+
+    def write_transaction(self, write):
+        #Runs write(cursor) in an IMMEDIATE transaction and returns its result. The write lock is taken up front, so
+        #the busy timeout applies to waiting for it. If the database is still locked or busy after that, the whole
+        #transaction is retried with exponential backoff, so write must be safe to run again from the start.
+        delay = LOCK_RETRY_DELAY
+        for attempt in range(LOCK_RETRIES + 1):
+            try:
+                with self.transaction("IMMEDIATE") as cursor:
+                    return write(cursor)
+            except sqlite3.OperationalError as e:
+                if attempt == LOCK_RETRIES or not _is_lock_error(e):
+                    raise
+            instrumentation.increment("sqlite_lock_retries")
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
+
+    def add_write_listener(self, listener):
+        #Registers a callback run after a commit that changed exercises, with the IDs of the affected classes.
+        #Lets in-process caches drop stale classes. Writes made by other processes show up in data_version instead.
+        self._write_listeners.append(listener)
+
+    def remove_write_listener(self, listener):
+        self._write_listeners.remove(listener)
+
+    def _notify_write(self, class_ids):
+        for listener in list(self._write_listeners):
+            listener(class_ids)
+
+    def data_version(self):
+        #Changes whenever another connection commits to the database. See SQLite's PRAGMA data_version.
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def execute(self, sql, parameters=()):
+        return self.connection.execute(sql, parameters)
+
+    def get_classes(self):
+        return self.execute(SELECT_CLASSES).fetchall()
+
+    def create_class(self, class_name):
+        class_id = self.write_transaction(lambda cursor: cursor.execute(INSERT_CLASS, (class_name,)).lastrowid)
+        self._notify_write([class_id])
+        return class_id
+
+    def load_exercises(self, class_id):
+        return self.execute(SELECT_EXERCISES, (class_id,)).fetchall()
+
+    def iter_exercises(self, class_id, schedule_only=False, chunk_size=1000):
+        #Streams the exercises of a class in chunks so the whole result set is never held in memory at once.
+        #With schedule_only the rows are (chapter, unit, number, class_id, current_stage, last_review_date, due_date).
+        cursor = self.connection.execute(SELECT_EXERCISE_SCHEDULES if schedule_only else SELECT_EXERCISES, (class_id,))
+        try:
+            rows = cursor.fetchmany(chunk_size)
+            while rows:
+                yield from rows
+                rows = cursor.fetchmany(chunk_size)
+        finally:
+            cursor.close()
+
+    def _select_by_keys(self, columns, class_id, keys):
+        #Selects the columns for the given (chapter, unit, number) keys of a class, DETAILS_CHUNK_SIZE keys per query.
+        #The keys are joined to the table rather than tested with IN, so each one is a primary key lookup instead of
+        #SQLite scanning the whole class through the class_id index.
+        keys = list(keys)
+        columns = ", ".join(f"e.{column.strip()}" for column in columns.split(","))
+        rows = []
+        for start in range(0, len(keys), DETAILS_CHUNK_SIZE):
+            chunk = keys[start:start + DETAILS_CHUNK_SIZE]
+            placeholders = ", ".join(["(?, ?, ?)"] * len(chunk))
+            query = (f"SELECT {columns} FROM (VALUES {placeholders}) AS k JOIN exercises AS e "
+                     "ON e.chapter = k.column1 AND e.unit = k.column2 AND e.number = k.column3 AND e.class_id = ?")
+            rows.extend(self.execute(query, (*(value for key in chunk for value in key), class_id)).fetchall())
+        return rows
+
+    def load_exercise_details(self, class_id, keys):
+        #Returns (chapter, unit, number, name, web_link) for the given exercise keys.
+        return self._select_by_keys("chapter, unit, number, name, web_link", class_id, keys)
+
+    def load_exercises_by_key(self, class_id, keys):
+        #Returns full exercise rows, like load_exercises, for the given exercise keys in the order of the keys.
+        rows = {tuple(row[:3]): row for row in self._select_by_keys(EXERCISE_COLUMNS, class_id, keys)}
+        return [rows[key] for key in keys if key in rows]
+
+    def load_due_exercises(self, class_id, due_date):
+        #Answers "due on or before" from the (class_id, due_date) index without loading the whole class.
+        return self.execute(SELECT_DUE_EXERCISES, (class_id, due_date)).fetchall()
+
+    def load_exercise_page(self, class_id, stages=None, chapters=None, limit=None, offset=0):
+        #Returns (total matching, rows) for one page of a class's exercises in (chapter, unit, number) order, keeping only
+        #those at the given stages and in the given chapters. Only the page's rows are read, so listings of large classes stay fast.
+        where = "class_id = ?"
+        parameters = [class_id]
+        for column, values in (("current_stage", stages), ("chapter", chapters)):
+            if values is not None:
+                values = sorted(set(values))
+                where += f" AND {column} IN ({', '.join('?' * len(values))})"
+                parameters.extend(values)
+        total = self.execute(f"SELECT COUNT(*) FROM exercises WHERE {where}", parameters).fetchone()[0]
+        rows = self.execute(f"SELECT {EXERCISE_COLUMNS} FROM exercises WHERE {where} "
+                            "ORDER BY chapter, unit, number LIMIT ? OFFSET ?",
+                            (*parameters, -1 if limit is None else limit, offset)).fetchall()
+        return total, rows
+
+    def search_exercises(self, class_id, query, limit=20):
+        #Returns the (chapter, unit, number) keys of a class's exercises matching the query, best first: exercises whose
+        #"chapter.unit.number" ID starts with the query, the exact ID first, then exercises whose names contain every
+        #word of the query, ranked by relevance. The last word may be the start of a word.
+        keys = []
+        query = query.strip()
+        if query and all(part.isdigit() for part in query.rstrip(".").split(".")):
+            end = query[:-1] + chr(ord(query[-1]) + 1)
+            keys.extend(sorted(self.execute(SEARCH_ID_PREFIX, (class_id, query, end, limit)).fetchall(),
+                               key=lambda key: ".".join(map(str, key)) != query))
+        words = re.findall(r"\w+", query)
+        if words and len(keys) < limit:
+            terms = " ".join(f'"{word}"' for word in words) + "*"
+            found = set(keys)
+            for key in self.execute(SEARCH_NAMES, (f'class_id:"{class_id}" AND name:({terms})', limit + len(keys))).fetchall():
+                if key not in found and len(keys) < limit:
+                    keys.append(key)
+        return keys
+
+    def rebuild_search_index(self):
+        #Refills the full-text index from the exercises table, for after a VACUUM renumbered the exercise rowids.
+        def write(cursor):
+            cursor.execute("DELETE FROM exercise_search")
+            cursor.execute("INSERT INTO exercise_search (rowid, name, class_id) SELECT rowid, name, class_id FROM exercises")
+        self.write_transaction(write)
+
+    def count_stages(self, class_ids):
+        #Returns {class_id: {stage: count}} for the given classes, straight from the exercises table.
+        counts = {class_id: {} for class_id in class_ids}
+        if not counts:
+            return counts
+        placeholders = ", ".join("?" * len(counts))
+        rows = self.execute(f"SELECT class_id, current_stage, COUNT(*) FROM exercises WHERE class_id IN ({placeholders}) "
+                            "GROUP BY class_id, current_stage", list(counts)).fetchall()
+        for class_id, stage, count in rows:
+            counts[class_id][stage] = count
+        return counts
+
+    def load_due_summary(self, due_date):
+        #Returns {class_id: {stage: count}} of the exercises due on or before the date in every class, read from
+        #the trigger-maintained due_summary table rather than the exercises.
+        summary = {}
+        rows = self.execute("SELECT class_id, stage, SUM(due_count) FROM due_summary WHERE due_date <= ? "
+                            "GROUP BY class_id, stage", (due_date,))
+        for class_id, stage, count in rows:
+            summary.setdefault(class_id, {})[stage] = count
+        return summary
+
+    def count_due(self, class_id, due_date):
+        return self.execute("SELECT COUNT(*) FROM exercises WHERE class_id = ? AND due_date <= ?",
+                            (class_id, due_date)).fetchone()[0]
+
+    def save_exercises(self, class_id, deleted_keys, new_exercises, dirty_exercises, reviews=()):
+        #Writes pending deletes, inserts and updates for one class in a single transaction, and appends reviews,
+        #a list of (chapter, unit, number, review_date, stage), to the review log.
+        #Deletes run first so an exercise deleted then re-added in the same session is inserted again.
+        #The search index gains and loses the same exercises in the same transaction.
+        #Updates only apply to rows still at the version the exercise was loaded with. Returns the keys of the new and
+        #changed exercises that were not written because another writer created or changed them first. Their reviews
+        #are not logged either.
+        deleted_rows = [(*key, class_id) for key in deleted_keys]
+        new_rows = [(exercise.chapter, exercise.unit, exercise.number, exercise.name, exercise.web_link, exercise.class_id,
+                     exercise.current_stage, exercise.last_review_date, exercise.due_date) for exercise in new_exercises]
+        update_rows = [(exercise.current_stage, exercise.last_review_date, exercise.due_date,
+                        exercise.chapter, exercise.unit, exercise.number, exercise.class_id, exercise.version)
+                       for exercise in dirty_exercises]
+        reviews = list(reviews)
+
+        def write(cursor):
+            cursor.executemany(UNINDEX_EXERCISE, deleted_rows)
+            cursor.executemany(DELETE_EXERCISE, deleted_rows)
+            last_rowid = cursor.execute(SELECT_MAX_ROWID).fetchone()[0]
+            conflicts = self._insert_new_rows(cursor, new_rows)
+            cursor.execute(INDEX_NEW_EXERCISES, (last_rowid,))
+            for row in update_rows:
+                if cursor.execute(UPDATE_EXERCISE, row).rowcount == 0:
+                    conflicts.append(row[3:6])
+            skipped = set(conflicts)
+            cursor.executemany(INSERT_REVIEW, [(class_id, chapter, unit, number, review_date, stage)
+                                               for chapter, unit, number, review_date, stage in reviews
+                                               if (chapter, unit, number) not in skipped])
+            self._count_changes(cursor, [class_id])
+            return conflicts
+
+        conflicts = self.write_transaction(write)
+        self._notify_write([class_id])
+        return conflicts
+
+    def _count_changes(self, cursor, class_ids):
+        #Marks the classes as changed, as part of the write transaction that changed them.
+        class_ids = list(class_ids)
+        if class_ids:
+            cursor.execute(f"UPDATE classes SET change_count = change_count + 1 WHERE class_id IN ({', '.join('?' * len(class_ids))})",
+                           class_ids)
+
+    def _insert_new_rows(self, cursor, rows):
+        #Inserts the rows in one batch. Only if some already existed are they inserted again one by one,
+        #to find which. Returns the keys of the rows that already existed.
+        cursor.execute("SAVEPOINT new_rows")
+        if cursor.executemany(INSERT_EXERCISE, rows).rowcount == len(rows):
+            cursor.execute("RELEASE new_rows")
+            return []
+        cursor.execute("ROLLBACK TO new_rows")
+        conflicts = [row[:3] for row in rows if cursor.execute(INSERT_EXERCISE, row).rowcount == 0]
+        cursor.execute("RELEASE new_rows")
+        return conflicts
+
+    def advance_due_reviews(self, review_date, plans):
+        #Advances every exercise due on or before the review date one stage, entirely inside SQLite, in one transaction.
+        #plans is a list of (next_intervals, class_ids), one per review schedule in use: next_intervals gives, by the
+        #stage an exercise is advanced from, the days until its next review or None to retire it. Returns {class_id: count}.
+        review_day = review_date.toordinal()
+
+        def write(cursor):
+            counts = {}
+            for next_intervals, class_ids in plans:
+                class_ids = list(class_ids)
+                if not class_ids:
+                    continue
+                where = f"due_date <= ? AND class_id IN ({', '.join('?' * len(class_ids))})"
+                where_parameters = [review_day, *class_ids]
+                plan_counts = dict(cursor.execute(f"SELECT class_id, COUNT(*) FROM exercises WHERE {where} GROUP BY class_id",
+                                                  where_parameters).fetchall())
+                if not plan_counts:
+                    continue
+                counts.update(plan_counts)
+                cases = " ".join("WHEN ? THEN ?" for _ in next_intervals)
+                case_parameters = [value for stage, interval in enumerate(next_intervals)
+                                   for value in (stage, None if interval is None else review_day + interval)]
+                cursor.execute(f"INSERT INTO reviews (class_id, chapter, unit, number, review_date, stage) "
+                               f"SELECT class_id, chapter, unit, number, ?, current_stage FROM exercises WHERE {where}",
+                               [review_day, *where_parameters])
+                cursor.execute(f"""UPDATE exercises SET current_stage = current_stage + 1, last_review_date = ?,
+                                   due_date = CASE current_stage {cases} ELSE NULL END, version = version + 1
+                                   WHERE {where}""", [review_day, *case_parameters, *where_parameters])
+            self._count_changes(cursor, counts)
+            return counts
+
+        counts = self.write_transaction(write)
+        if counts:
+            self._notify_write(list(counts))
+        return counts
+
+    def get_class_schedules(self, class_ids=None):
+        #Returns {class_id: stored schedule spec, or None for the default schedule} for the given classes,
+        #or without class_ids for every class that has exercises.
+        if class_ids is None:
+            class_ids = [row[0] for row in self.execute("SELECT DISTINCT class_id FROM exercises")]
+        schedules = dict.fromkeys(class_ids)
+        for class_id, spec in self.execute("SELECT class_id, schedule FROM classes WHERE schedule IS NOT NULL"):
+            if class_id in schedules:
+                schedules[class_id] = spec
+        return schedules
+
+    def set_class_schedule(self, class_id, spec, retired_stages=None):
+        #Stores a class's schedule spec, or None for the default schedule. Raises ValueError for an unknown class.
+        #retired_stages is (old terminal stage, new terminal stage), and moves the retired exercises of the class to the
+        #new terminal stage in the same transaction.
+        def write(cursor):
+            updated = cursor.execute("UPDATE classes SET schedule = ?, change_count = change_count + 1 WHERE class_id = ?",
+                                     (spec, class_id)).rowcount
+            if updated and retired_stages is not None:
+                old_stage, new_stage = retired_stages
+                cursor.execute("UPDATE exercises SET current_stage = ?, version = version + 1 WHERE class_id = ? AND current_stage = ?",
+                               (new_stage, class_id, old_stage))
+            return updated
+
+        updated = self.write_transaction(write)
+        if not updated:
+            raise ValueError(f"No class with ID {class_id}")
+        self._notify_write([class_id])
+
+    def get_change_count(self, class_id):
+        #Returns the number of writes made to the class so far, or None for an unknown class.
+        row = self.execute("SELECT change_count FROM classes WHERE class_id = ?", (class_id,)).fetchone()
+        return row[0] if row else None
+
+    def load_snapshot_rows(self, class_id, known_rows=None):
+        #Reads a class for a snapshot, in one read transaction so the rows agree with the change count.
+        #Returns (change count, schedule spec, rows, rowids gone), with rows as SNAPSHOT_COLUMNS in
+        #(chapter, unit, number) order. Without known_rows every row is read. known_rows is
+        #{rowid: (chapter, unit, number, version)} of the rows a stale snapshot holds, and then only new and changed rows
+        #are read, along with the rowids of the rows that were deleted.
+        with self.transaction() as cursor:
+            row = cursor.execute("SELECT change_count, schedule FROM classes WHERE class_id = ?", (class_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"No class with ID {class_id}")
+            change_count, spec = row
+            if known_rows is None:
+                rows = cursor.execute(f"SELECT {SNAPSHOT_COLUMNS} FROM exercises WHERE class_id = ? "
+                                      "ORDER BY chapter, unit, number", (class_id,)).fetchall()
+                return change_count, spec, rows, []
+            current = {rowid: (chapter, unit, number, version) for rowid, chapter, unit, number, version in cursor.execute(
+                "SELECT rowid, chapter, unit, number, version FROM exercises WHERE class_id = ?", (class_id,))}
+            changed = [rowid for rowid, stamp in current.items() if known_rows.get(rowid) != stamp]
+            gone = [rowid for rowid in known_rows if rowid not in current]
+            rows = []
+            for start in range(0, len(changed), DETAILS_CHUNK_SIZE):
+                chunk = changed[start:start + DETAILS_CHUNK_SIZE]
+                rows.extend(cursor.execute(f"SELECT {SNAPSHOT_COLUMNS} FROM exercises WHERE rowid IN ({', '.join('?' * len(chunk))})",
+                                           chunk).fetchall())
+            rows.sort(key=lambda row: row[1:4])
+            return change_count, spec, rows, gone
+
+    def load_review_history(self, class_id, key):
+        #Returns [(review_date, stage)] for one exercise, oldest first. Compacted reviews are no longer listed.
+        return self.execute(SELECT_REVIEW_HISTORY, (class_id, *key)).fetchall()
+
+    def count_reviews_per_day(self, class_id, start_date, end_date):
+        #Returns [(date, stage, reviews)] for every day and stage with reviews between the dates, inclusive.
+        return self.execute(SELECT_REVIEWS_PER_DAY, (class_id, start_date, end_date, class_id, start_date, end_date)).fetchall()
+
+    def compact_reviews(self, before_date):
+        #Rolls every logged review before the date into review_daily_counts and removes it from the log, in one transaction.
+        #Per-day counts are unchanged, only the per-exercise history of those days is given up. Returns the reviews compacted.
+        cutoff = before_date.toordinal()
+
+        def write(cursor):
+            cursor.execute(COMPACT_REVIEWS, (cutoff,))
+            return cursor.execute("DELETE FROM reviews WHERE review_date < ?", (cutoff,)).rowcount
+
+        return self.write_transaction(write)
+
+    def load_exercise_schedules(self, class_id, keys):
+        #Returns (chapter, unit, number, current_stage, last_review_date, due_date, version) for the given exercise keys,
+        #as currently saved. Keys with no saved row are left out.
+        return self._select_by_keys("chapter, unit, number, current_stage, last_review_date, due_date, version", class_id, keys)
+
+    def close(self):
+        #Closes every connection opened by any thread.
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._schema_ready = False
+        self._local = threading.local()
+
+
+def _is_lock_error(error):
+    #SQLITE_BUSY and SQLITE_LOCKED only reach Python as OperationalError messages.
+    message = str(error)
+    return "locked" in message or "busy" in message
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_path=DEFAULT_DB_PATH):
+    #Returns the shared repository for a database file, creating it on first use.
+    #Relative paths are resolved first, so the same name in two working directories gets two repositories.
+    #Path objects are accepted like strings, as sqlite3.connect accepts them.
+    db_path = os.fspath(db_path)
+    if db_path != ":memory:" and not db_path.startswith("file:"):
+        db_path = os.path.abspath(db_path)
+    with _databases_lock:
+        database = _databases.get(db_path)
+        if database is None:
+            database = Database(db_path)
+            _databases[db_path] = database
+        return database
+
+
+#Databases inherited by a forked child, such as a process pool worker. SQLite connections must not be used
+#across a fork, so the child starts with an empty registry. The old objects are kept so they are never closed from the child.
+_inherited_databases = []
+
+
+def _forget_databases_after_fork():
+    global _databases, _databases_lock
+    _inherited_databases.extend(_databases.values())
+    _databases = {}
+    _databases_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_databases_after_fork)
+
+
+@atexit.register
+def close_all_databases():
+    with _databases_lock:
+        for database in _databases.values():
+            database.close()
+        _databases.clear()
@@ -0,0 +1,196 @@
+import array
+import sys
+
+from src.math_class import BaseExercise, NOT_LOADED, day_to_date
+
+#Day ordinals start at 1, so 0 marks a missing date in the date columns.
+_NO_DAY = 0
+
+
+def _intern(value):
+    #Names and links repeat a lot across a catalog, so only one copy of each string is kept.
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+class ExerciseTable:
+    #Columnar storage for the exercises of a class. Numbers and stages are kept in typed arrays, dates as day ordinals,
+    #and names and links as interned strings. Each row has one ExerciseRow view that MathClass holds in place of an Exercise.
+    def __init__(self) -> None:
+        self.chapters = array.array('i')
+        self.units = array.array('i')
+        self.numbers = array.array('i')
+        self.class_ids = array.array('q')
+        self.stages = array.array('b')
+        self.last_review_days = array.array('i')
+        self.due_days = array.array('i')
+        self.versions = array.array('q')
+        self.names = []
+        self.web_links = []
+        self._views = []
+
+    def __len__(self):
+        return len(self._views)
+
+    def __iter__(self):
+        return iter(self._views)
+
+    def row(self, index):
+        return self._views[index]
+
+    def append(self, chapter, unit, number, name, web_link, class_id=0, current_stage=0, last_review_date=None, due_date=None,
+               version=0):
+        #Adds a row using the same arguments as Exercise, with dates as date objects, date strings or None.
+        #Returns the row's view, which starts out new like a freshly built Exercise.
+        self.chapters.append(chapter)
+        self.units.append(unit)
+        self.numbers.append(number)
+        self.class_ids.append(class_id)
+        self.stages.append(current_stage)
+        self.last_review_days.append(_date_to_day(last_review_date))
+        self.due_days.append(_date_to_day(due_date))
+        self.versions.append(version)
+        self.names.append(_intern(name))
+        self.web_links.append(_intern(web_link))
+        view = ExerciseRow(self, len(self._views))
+        self._views.append(view)
+        return view
+
+    def load_columns(self, chapters, units, numbers, class_id, stages, last_review_days, due_days, versions, names, web_links):
+        #Fills an empty table from whole columns at once, for restoring a saved class: numbers, stages and days as arrays
+        #of the table's types, with 0 for no date, and names and links as lists. Every row belongs to class_id and
+        #starts out clean. Returns the row views in column order.
+        if self._views:
+            raise ValueError("Columns can only be loaded into an empty table")
+        count = len(chapters)
+        self.chapters = chapters[:]
+        self.units = units[:]
+        self.numbers = numbers[:]
+        self.class_ids = array.array('q', [class_id]) * count
+        self.stages = stages[:]
+        self.last_review_days = last_review_days[:]
+        self.due_days = due_days[:]
+        self.versions = versions[:]
+        self.names = list(names)
+        self.web_links = list(web_links)
+        self._views = [ExerciseRow(self, row, is_new=False) for row in range(count)]
+        return list(self._views)
+
+    def append_exercise(self, exercise):
+        #Copies an exercise object into a new row, keeping its new and dirty state.
+        view = self.append(exercise.chapter, exercise.unit, exercise.number, exercise.name, exercise.web_link,
+                           exercise.class_id, exercise.current_stage, exercise.last_review_date, exercise.due_date,
+                           exercise.version)
+        view.is_new = exercise.is_new
+        view.is_dirty = exercise.is_dirty
+        return view
+
+    def remove(self, view):
+        #Removes a row by moving the last row into its place, so removal is O(1). Row order carries no meaning.
+        index = view._row
+        last = len(self._views) - 1
+        for column in (self.chapters, self.units, self.numbers, self.class_ids, self.stages,
+                       self.last_review_days, self.due_days, self.versions, self.names, self.web_links):
+            column[index] = column[last]
+            column.pop()
+        moved = self._views.pop()
+        if moved is not view:
+            moved._row = index
+            self._views[index] = moved
+        view._table = None
+
+    def advance_rows(self, views, review_day, next_intervals):
+        #Advances every given row one stage in a single pass over the columns. next_intervals is a compiled
+        #Schedule.next_intervals: the days until the next review by the stage advanced from, or None to retire the row.
+        #Returns the stages the rows were at before advancing.
+        stages = self.stages
+        last_review_days = self.last_review_days
+        due_days = self.due_days
+        rows = [view._row for view in views]
+        old_stages = [stages[row] for row in rows]
+        for row, stage in zip(rows, old_stages):
+            interval = next_intervals[stage]
+            stages[row] = stage + 1
+            last_review_days[row] = review_day
+            due_days[row] = _NO_DAY if interval is None else review_day + interval
+        return old_stages
+
+
+def _date_to_day(value):
+    if not value:
+        return _NO_DAY
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = BaseExercise._date_string_to_object(value)
+    return value.toordinal()
+
+
+def _day_to_date(day):
+    if day == _NO_DAY:
+        return None
+    return day_to_date(day)
+
+
+def _column_property(column_name, to_value=None, from_value=None):
+    #Builds a property that reads and writes one column of the view's table at the view's row.
+    def getter(self):
+        value = getattr(self._table, column_name)[self._row]
+        return to_value(value) if to_value else value
+
+    def setter(self, value):
+        getattr(self._table, column_name)[self._row] = from_value(value) if from_value else value
+
+    return property(getter, setter)
+
+
+def _lazy_column_property(column_name):
+    #Like _column_property, but fetches the row's details first if they were not loaded.
+    def getter(self):
+        value = getattr(self._table, column_name)[self._row]
+        if value is NOT_LOADED:
+            self._load_details()
+            value = getattr(self._table, column_name)[self._row]
+        return value
+
+    def setter(self, value):
+        getattr(self._table, column_name)[self._row] = _intern(value)
+
+    return property(getter, setter)
+
+
+class ExerciseRow(BaseExercise):
+    #Lightweight view over one row of an ExerciseTable. Has the same attributes and methods as Exercise,
+    #so code written against Exercise works unchanged.
+    __slots__ = ('_table', '_row', 'is_new', 'is_dirty', '_owner')
+
+    def __init__(self, table, row, is_new=True) -> None:
+        self._table = table
+        self._row = row
+        self.is_new = is_new
+        self.is_dirty = False
+        self._owner = None
+
+    chapter = _column_property('chapters')
+    unit = _column_property('units')
+    number = _column_property('numbers')
+    class_id = _column_property('class_ids')
+    current_stage = _column_property('stages')
+    name = _lazy_column_property('names')
+    web_link = _lazy_column_property('web_links')
+    last_review_date = _column_property('last_review_days', _day_to_date, _date_to_day)
+    due_date = _column_property('due_days', _day_to_date, _date_to_day)
+    version = _column_property('versions')
+
+    def _get_raw_name(self):
+        return self._table.names[self._row]
+
+    def get_key(self):
+        table, row = self._table, self._row
+        return (table.chapters[row], table.units[row], table.numbers[row])
+
+    def get_due_day(self):
+        due_day = self._table.due_days[self._row]
+        if due_day != _NO_DAY:
+            return due_day
@@ -0,0 +1,107 @@
+import csv
+import json
+import os
+import time
+
+#Fields read from each record. web_link is optional and defaults to an empty string.
+REQUIRED_FIELDS = ("chapter", "unit", "number", "name")
+
+#Only the first rejected rows are kept with their reasons, so a bad multi-million row file cannot exhaust memory.
+MAX_REJECTED_DETAILS = 100
+
+
+class ImportReport:
+    #Summary of a bulk import: how many rows were read, imported and rejected, and how fast it ran.
+    def __init__(self, path) -> None:
+        self.path = path
+        self.rows_read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.rejected_rows = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def reject(self, line_number, reason):
+        self.rejected += 1
+        if len(self.rejected_rows) < MAX_REJECTED_DETAILS:
+            self.rejected_rows.append((line_number, reason))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def rows_per_second(self):
+        if self.elapsed <= 0:
+            return 0.0
+        return self.rows_read / self.elapsed
+
+    def summary(self):
+        lines = [f"Imported {self.imported} of {self.rows_read} rows from {self.path} in {self.elapsed:.2f}s "
+                 f"({self.rows_per_second():.0f} rows/s). {self.rejected} rows rejected."]
+        for line_number, reason in self.rejected_rows:
+            lines.append(f"  line {line_number}: {reason}")
+        if self.rejected > len(self.rejected_rows):
+            lines.append(f"  ... and {self.rejected - len(self.rejected_rows)} more")
+        return "\n".join(lines)
+
+
+def detect_format(path):
+    #Works out the file format from its extension.
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the format of {path}. Use a .csv or .jsonl file, or give the format explicitly.")
+
+
+def iter_records(path, file_format=None):
+    #Streams (line_number, record) pairs from a CSV file with a header row or a JSON lines file.
+    #Records are dictionaries, or None for a line that could not be parsed.
+    if file_format is None:
+        file_format = detect_format(path)
+    if file_format == "csv":
+        return _iter_csv_records(path)
+    if file_format == "jsonl":
+        return _iter_jsonl_records(path)
+    raise ValueError(f"Unknown import format {file_format}, expected 'csv' or 'jsonl'")
+
+
+def _iter_csv_records(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        reader = csv.DictReader(file)
+        for record in reader:
+            yield reader.line_num, record
+
+
+def _iter_jsonl_records(path):
+    with open(path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+
+
+def parse_record(record):
+    #Validates one record and returns (chapter, unit, number, name, web_link).
+    #Raises ValueError with a reason for the report if the record cannot be used.
+    if record is None:
+        raise ValueError("not a valid record")
+    missing = [field for field in REQUIRED_FIELDS if record.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    chapter, unit, number = (_to_int(record[field], field) for field in ("chapter", "unit", "number"))
+    web_link = record.get("web_link") or ""
+    return chapter, unit, number, str(record["name"]), str(web_link)
+
+
+def _to_int(value, field):
+    #Same rule as interactive entry: a non-negative whole number.
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    raise ValueError(f"{field} must be a number, got {value!r}")
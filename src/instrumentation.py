@@ -0,0 +1,194 @@
+import atexit
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+#Opt-in timing, row and SQL statement counts for MathClass database methods and menu actions.
+#Off by default: instrumented functions then only pay for one global lookup. Turn it on with enable(), or by setting
+#SMR_METRICS to a .json or .prom file that the metrics are written to on exit.
+ENABLED = False
+
+_lock = threading.Lock()
+_operations = {}
+_counters = {}
+_local = threading.local()
+
+
+class OperationStats:
+    __slots__ = ("calls", "seconds", "max_seconds", "rows", "sql_statements")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.sql_statements = 0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _active():
+    #Operations running on this thread, innermost last. Rows and statements count towards all of them.
+    active = getattr(_local, "active", None)
+    if active is None:
+        active = _local.active = []
+    return active
+
+
+@contextlib.contextmanager
+def measure(name):
+    #Times the enclosed block as one call of the named operation.
+    if not ENABLED:
+        yield
+        return
+    stats = OperationStats()
+    active = _active()
+    active.append(stats)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        active.pop()
+        with _lock:
+            total = _operations.get(name)
+            if total is None:
+                total = _operations[name] = OperationStats()
+            total.calls += 1
+            total.seconds += elapsed
+            total.max_seconds = max(total.max_seconds, elapsed)
+            total.rows += stats.rows
+            total.sql_statements += stats.sql_statements
+
+
+def instrumented(name):
+    #Decorator that measures every call of the function as the named operation.
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with measure(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_rows(count):
+    #Records rows read or written by the operations running on this thread.
+    if ENABLED:
+        for stats in _active():
+            stats.rows += count
+
+
+def count_statement(statement=None):
+    #SQLite trace callback. Counts each executed statement towards the running operations.
+    for stats in _active():
+        stats.sql_statements += 1
+
+
+def increment(counter, amount=1):
+    #Increments a free-standing counter, such as connections opened.
+    if ENABLED:
+        with _lock:
+            _counters[counter] = _counters.get(counter, 0) + amount
+
+
+def enable(metrics_path=None):
+    #Turns instrumentation on. If metrics_path is given the metrics are written there when the program exits.
+    global ENABLED
+    ENABLED = True
+    if metrics_path:
+        atexit.register(write_metrics, metrics_path)
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    with _lock:
+        _operations.clear()
+        _counters.clear()
+
+
+def snapshot():
+    #Returns the collected metrics as plain data.
+    from src.math_class import parse_date_string
+    cache = parse_date_string.cache_info()
+    with _lock:
+        counters = dict(_counters)
+        operations = {name: stats.to_dict() for name, stats in sorted(_operations.items())}
+    counters["date_parse_cache_hits"] = cache.hits
+    counters["date_parse_cache_misses"] = cache.misses
+    return {"operations": operations, "counters": counters}
+
+
+def format_prometheus(metrics):
+    #Formats a snapshot in the Prometheus text exposition format.
+    lines = []
+    for field, metric, metric_type in (("calls", "smr_operation_calls_total", "counter"),
+                                       ("seconds", "smr_operation_seconds_total", "counter"),
+                                       ("max_seconds", "smr_operation_seconds_max", "gauge"),
+                                       ("rows", "smr_operation_rows_total", "counter"),
+                                       ("sql_statements", "smr_operation_sql_statements_total", "counter")):
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for name, stats in metrics["operations"].items():
+            lines.append(f'{metric}{{operation="{name}"}} {stats[field]}')
+    for name, value in sorted(metrics["counters"].items()):
+        lines.append(f"# TYPE smr_{name}_total counter")
+        lines.append(f"smr_{name}_total {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path):
+    #Writes the metrics as Prometheus text if the file ends in .prom, otherwise as JSON.
+    metrics = snapshot()
+    with open(path, "w", encoding="utf-8") as out:
+        if path.endswith(".prom"):
+            out.write(format_prometheus(metrics))
+        else:
+            json.dump(metrics, out, indent=2)
+
+
+@contextlib.contextmanager
+def profile(name, mode="cprofile", output_dir="."):
+    #Captures a cProfile profile or tracemalloc allocation statistics around the enclosed block.
+    #Writes profile-<name>.prof (open with pstats or snakeviz) or profile-<name>-memory.txt. Returns nothing.
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(output_dir, f"profile-{name}.prof"))
+    elif mode == "tracemalloc":
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if not already_tracing:
+                tracemalloc.stop()
+            with open(os.path.join(output_dir, f"profile-{name}-memory.txt"), "w", encoding="utf-8") as out:
+                out.write(f"Peak traced memory: {peak} bytes\n")
+                for stat in after.compare_to(before, "lineno")[:50]:
+                    out.write(f"{stat}\n")
+    else:
+        raise ValueError(f"Unknown profile mode {mode}, expected 'cprofile' or 'tracemalloc'")
+
+
+if os.environ.get("SMR_METRICS"):
+    enable(os.environ["SMR_METRICS"])
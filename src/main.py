@@ -1,30 +1,75 @@
+import contextlib
+import os
+
+import src.database as database
+import src.instrumentation as instrumentation
 import src.math_class as math_class
-import sqlite3
+import src.snapshot as snapshot
+import src.worksheet as worksheet
 
-def get_classes(db_path='spaced-math-review.db'):
+def get_classes(db_path=database.DEFAULT_DB_PATH):
     #Fetches all classes from the database and returns them as a list of tuples.
-    with sqlite3.connect(db_path) as conn:
-        cursor = conn.cursor()
+    return database.get_database(db_path).get_classes()
 
-        cursor.execute('''CREATE TABLE IF NOT EXISTS classes (
-                            class_id INTEGER PRIMARY KEY,
-                            class_name TEXT NOT NULL)''')
 
-        cursor.execute("SELECT class_id, class_name FROM classes ORDER BY class_id")
-        classes = cursor.fetchall()
-    return classes
+def get_classes_with_due_counts(db_path=database.DEFAULT_DB_PATH):
+    #Fetches all classes with the number of exercises and problems due today, from the due summary alone.
+    #Returns a list of (class_id, class_name, due count, problem count) tuples.
+    return [(class_id, class_name, due, problems)
+            for class_id, class_name, due, problems, _ in math_class.get_due_dashboard(db_path=db_path)]
 
 
-def create_new_class(class_name, db_path='spaced-math-review.db'):
+def create_new_class(class_name, db_path=database.DEFAULT_DB_PATH):
     #Creates a new class
-    with sqlite3.connect(db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO classes (class_name) VALUES (?)", (class_name,))
-        new_class_id = cursor.lastrowid
+    new_class_id = database.get_database(db_path).create_class(class_name)
     print(f"New class '{class_name}' created successfully with ID {new_class_id}.")
     return new_class_id, class_name  # Return both ID and name
 
 
+def import_exercises_from_file(current_class):
+    #Prompts for a file and bulk imports its exercises into the current class
+    path = input("Enter the path of a .csv or .jsonl file with chapter, unit, number, name and web_link columns.\n").strip()
+    try:
+        report = current_class.import_exercises(path)
+    except (OSError, ValueError) as e:
+        print(f"Import failed: {e}")
+        return
+    print(report.summary())
+
+
+def generate_worksheet(current_class):
+    #Prompts for a format and writes a worksheet of today's due exercises to a file
+    file_format = input("Enter worksheet format: text, html or markdown. Press enter for text.\n").strip().lower() or "text"
+    if file_format not in worksheet.FILE_EXTENSIONS:
+        print("Unknown format. Worksheet not generated.")
+        return
+    path, exercise_count, problem_total = worksheet.generate_worksheet(current_class, file_format=file_format)
+    print(f"Worksheet with {exercise_count} exercises and {problem_total} problems saved to {path}.")
+
+
+#Exercises listed per page before asking to continue, so long listings do not scroll past.
+LIST_PAGE_SIZE = 50
+
+#Names menu actions in metrics and profiles.
+MENU_ACTIONS = {'1': "print_due_exercises", '2': "start_next_exercise", '3': "generate_worksheet", '4': "mark_reviews_done",
+                '5': "print_all_exercises", '6': "add_exercises", '7': "delete_exercise", '8': "import_exercises",
+                '9': "search_exercises"}
+
+
+def menu_action_context(menu_choice):
+    #Measures a menu action when instrumentation is on. Setting SMR_PROFILE to a menu option, optionally followed by
+    #":tracemalloc", also captures a profile of that action.
+    stack = contextlib.ExitStack()
+    action = MENU_ACTIONS.get(menu_choice)
+    if action is None:
+        return stack
+    stack.enter_context(instrumentation.measure(f"menu.{action}"))
+    profile_choice, _, profile_mode = os.environ.get("SMR_PROFILE", "").partition(":")
+    if profile_choice == menu_choice:
+        stack.enter_context(instrumentation.profile(action, profile_mode or "cprofile"))
+    return stack
+
+
 def print_menu():
     #Prints the main selection menu
     print()
@@ -36,6 +81,8 @@ def print_menu():
         "5 - Print status of all exercises\n"
         "6 - Add new exercise to class\n"
         "7 - Delete exercise\n"
+        "8 - Import exercises from a CSV or JSONL file\n"
+        "9 - Search exercises by name or number\n"
         "q - Quit\n")
 
 if __name__ == "__main__":
@@ -46,13 +93,14 @@ if __name__ == "__main__":
         "Start by choosing a class.\n")
 
 
-    classes = get_classes()
+    classes_with_due_counts = get_classes_with_due_counts()
+    classes = [(class_id, class_name) for class_id, class_name, _, _ in classes_with_due_counts]
 
-    #Print currently available classes.
+    #Print currently available classes with what is due in each today.
     if classes:
         print("Available classes:")
-        for class_id, class_name in classes:
-            print(f"{class_id}: {class_name}")
+        for class_id, class_name, due, problems in classes_with_due_counts:
+            print(f"{class_id}: {class_name} - {due} due today, {problems} problems")
         # Further logic to select a class or create a new one
     else:
         print("No classes available.")
@@ -80,43 +128,48 @@ if __name__ == "__main__":
             print("Invalid choice. Please try again.")
 
 
-    #Load the class as a MathClass object
-    current_class = math_class.MathClass(selected_class_id, selected_class_name)
-
-    #Load exercises from the database
-    current_class.load_exercises_from_database()
+    #Load the class as a MathClass object, from its snapshot when the class has not changed since the last start.
+    #Table storage lets the snapshot's columns be used as they are.
+    current_class = snapshot.load_class(selected_class_id, selected_class_name)
 
 
     #Main user menu
     print_menu()
     menu_choice = input()
     while menu_choice != 'q':
-        if menu_choice == '1':
-            # Prints only exercises due today
-            current_class.print_due_exercises()
-        elif menu_choice == '2':
-            # Adds the next exercise to rotation by setting due date as today
-            current_class.start_next_exercise()
-        elif menu_choice == '3':
-            # Generates worksheet
-            pass
-        elif menu_choice == '4':
-            # Updates all exercises due before review date and advances them to the next stage
-            current_class.mark_reviews_done()
-        elif menu_choice == '5':
-            #Print info for all exercises
-            current_class.print_all_exercises()
-        elif menu_choice == '6':
-            #Add new exercise to class
-            current_class.add_exercises_until_done_then_save()
-        elif menu_choice == '7':
-            #Delete an exercise
-            current_class.delete_exercise()
-        elif menu_choice == 'm':
-            #Reprints the menu
-            print_menu()
-        else:
-            print("Input not valid")
-            print_menu()
+        with menu_action_context(menu_choice):
+            if menu_choice == '1':
+                # Prints only exercises due today
+                current_class.print_due_exercises(page_size=LIST_PAGE_SIZE)
+            elif menu_choice == '2':
+                # Adds the next exercise to rotation by setting due date as today
+                current_class.start_next_exercise()
+            elif menu_choice == '3':
+                # Generates worksheet
+                generate_worksheet(current_class)
+            elif menu_choice == '4':
+                # Updates all exercises due before review date and advances them to the next stage
+                current_class.mark_reviews_done()
+            elif menu_choice == '5':
+                #Print info for all exercises
+                current_class.print_all_exercises(page_size=LIST_PAGE_SIZE)
+            elif menu_choice == '6':
+                #Add new exercise to class
+                current_class.add_exercises_until_done_then_save()
+            elif menu_choice == '7':
+                #Delete an exercise
+                current_class.delete_exercise()
+            elif menu_choice == '8':
+                #Bulk import exercises from a file
+                import_exercises_from_file(current_class)
+            elif menu_choice == '9':
+                #Find exercises by name or number
+                current_class.prompt_and_search_exercises()
+            elif menu_choice == 'm':
+                #Reprints the menu
+                print_menu()
+            else:
+                print("Input not valid")
+                print_menu()
         menu_choice = input("\nEnter next option or q to quit. Enter m for menu.")
 
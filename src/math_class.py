@@ -1,152 +1,654 @@
+import bisect
+import collections
 import datetime
+import functools
+import itertools
+import re
 import sqlite3
+import sys
+
+import src.database as database
+import src.importer as importer
+import src.instrumentation as instrumentation
+import src.rendering as rendering
+import src.scheduling as scheduling
+
+
+#The default review schedule. Classes can use another one, see src/scheduling.py.
+DUE_DATE_MODIFIERS = scheduling.DUE_DATE_MODIFIERS
+RETIRED_STAGE = scheduling.RETIRED_STAGE
+PROBLEMS_PER_STAGE = scheduling.PROBLEMS_PER_STAGE
+
+
+@instrumentation.instrumented("bulk_advance_reviews")
+def bulk_advance_reviews(review_date, class_ids=None, db_path=database.DEFAULT_DB_PATH):
+    #Headless end-of-day advancement. Applies the same stage transition as Exercise.advance_stage to every exercise
+    #due on or before the review date, across all classes or only class_ids, in one transaction with one SQL statement
+    #per distinct class schedule. Returns {class_id: number advanced}. MathClass objects already loaded are not updated.
+    db = database.get_database(db_path)
+    classes_by_spec = {}
+    for class_id, spec in db.get_class_schedules(class_ids).items():
+        classes_by_spec.setdefault(spec, []).append(class_id)
+    plans = [(scheduling.from_spec(spec).next_intervals, spec_class_ids) for spec, spec_class_ids in classes_by_spec.items()]
+    return db.advance_due_reviews(review_date, plans)
+
+
+def get_due_dashboard(due_date=None, db_path=database.DEFAULT_DB_PATH):
+    #Due load of every class without loading any exercises: [(class_id, class_name, due count, problem count,
+    #{stage: due count})] for the exercises due on or before the date, today by default. Counts come from the
+    #due_summary table and problems from each class's schedule, as Exercise.get_num_of_exercises would give them.
+    if due_date is None:
+        due_date = datetime.datetime.today().date()
+    db = database.get_database(db_path)
+    classes = db.get_classes()
+    summary = db.load_due_summary(due_date)
+    schedules = db.get_class_schedules([class_id for class_id, _ in classes])
+    dashboard = []
+    for class_id, class_name in classes:
+        stages = dict(sorted(summary.get(class_id, {}).items()))
+        problems = scheduling.from_spec(schedules.get(class_id)).problems
+        dashboard.append((class_id, class_name, sum(stages.values()),
+                          sum(problems[stage] * count for stage, count in stages.items() if stage < len(problems)), stages))
+    return dashboard
+
+
+class _NotLoaded:
+    #Placeholder for the name and web link of exercises loaded lazily, until their details are fetched.
+    __slots__ = ()
+
+    def __repr__(self):
+        return "NOT_LOADED"
+
+    def __reduce__(self):
+        return "NOT_LOADED"
+
+
+NOT_LOADED = _NotLoaded()
+
+
+#Only strings of this form go to the C fromisoformat parser. It also accepts other ISO 8601 forms, such as 20230102
+#and 2023-W01-1, that are not valid dates here.
+_PADDED_DATE = re.compile(r"\d{4}-\d{2}-\d{2}", re.ASCII)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date_string(date_string):
+    #Parses a YYYY-MM-DD string into a date. Classes reuse a small set of dates, so results are memoized,
+    #and the C fromisoformat parser is tried before the slower strptime.
+    if _PADDED_DATE.fullmatch(date_string):
+        try:
+            return datetime.date.fromisoformat(date_string)
+        except ValueError:
+            pass
+    try: 
+        return datetime.datetime.strptime(date_string, "%Y-%m-%d").date()
+    except ValueError as e:
+        raise ValueError(f"Invalid date format for {date_string}, expected format: YYYY-MM-DD") from e
+
+
+@functools.lru_cache(maxsize=4096)
+def day_to_date(day):
+    #Converts a stored day number, date.toordinal(), back to a date. Memoized like parse_date_string.
+    return datetime.date.fromordinal(day)
+
+
+@functools.lru_cache(maxsize=4096)
+def format_date(date):
+    #Formats a date as YYYY-MM-DD for display, or "n/a" for no date. Printed lists repeat a few dates many times.
+    if not date:
+        return "n/a"
+    return date.isoformat()
+
+
+class UnitOfWork:
+    #Collects the exercises added, changed or deleted since the last save so that save_to_db only writes those rows.
+    #Pending exercises are keyed by (chapter, unit, number) so a queued delete can cancel a pending insert or update.
+    #Reviews done since the last save are kept in order and appended to the review log by the same save.
+    def __init__(self) -> None:
+        self.new = {}
+        self.dirty = {}
+        self.deleted = {}
+        self.reviews = []
+
+    def register_new(self, exercise):
+        #A queued delete of the same key stays queued. Inserts never replace a saved row, so the old row must be
+        #deleted before the new one is inserted.
+        self.new[exercise.get_key()] = exercise
+
+    def register_dirty(self, exercise):
+        key = exercise.get_key()
+        if key not in self.new:
+            self.dirty[key] = exercise
+
+    def register_deleted(self, key):
+        #An exercise that was never saved only needs to be dropped from the pending inserts.
+        self.dirty.pop(key, None)
+        if self.new.pop(key, None) is None:
+            self.deleted[key] = True
+
+    def register_review(self, exercise, review_date, stage):
+        self.reviews.append((exercise.chapter, exercise.unit, exercise.number, review_date, stage))
+
+    def has_changes(self):
+        return bool(self.new or self.dirty or self.deleted or self.reviews)
+
+    def mark_committed(self, conflicts=()):
+        #Called once the transaction has been committed. Clears the pending state of every written exercise.
+        #Updated rows are now one version on, except the conflicting ones, which were not written.
+        for exercise in self.new.values():
+            exercise.mark_clean()
+        for key, exercise in self.dirty.items():
+            exercise.mark_clean()
+            if key not in conflicts:
+                exercise.version += 1
+        self.clear()
+
+    def clear(self):
+        self.new = {}
+        self.dirty = {}
+        self.deleted = {}
+        self.reviews = []
+
+
+class DueIndex:
+    #Buckets exercises by due date so "due on or before a date" only visits the exercises that are due.
+    #Buckets are keyed by date ordinal and the ordinals are kept sorted, so a lookup costs O(log d + k) for d distinct due days.
+    def __init__(self) -> None:
+        self._buckets = {}
+        self._days = []
+
+    def add(self, exercise, due_day):
+        if due_day is None:
+            return
+        bucket = self._buckets.get(due_day)
+        if bucket is None:
+            bucket = self._buckets[due_day] = {}
+            bisect.insort(self._days, due_day)
+        bucket[exercise] = None
+
+    def remove(self, exercise, due_day):
+        if due_day is None:
+            return
+        bucket = self._buckets[due_day]
+        del bucket[exercise]
+        if not bucket:
+            del self._buckets[due_day]
+            del self._days[bisect.bisect_left(self._days, due_day)]
+
+    def move(self, exercise, old_due_day, new_due_day):
+        if old_due_day != new_due_day:
+            self.remove(exercise, old_due_day)
+            self.add(exercise, new_due_day)
+
+    def _count_due_days(self, date):
+        return bisect.bisect_right(self._days, date.toordinal())
+
+    def iter_due(self, date):
+        #Yields every exercise due on or before the date, earliest due date first.
+        for day in self._days[:self._count_due_days(date)]:
+            yield from self._buckets[day]
+
+    def count_due(self, date):
+        return sum(len(self._buckets[day]) for day in self._days[:self._count_due_days(date)])
+
+    def add_many(self, exercises, due_days):
+        #Adds exercises with their due day ordinals, None or 0 for no due date, sorting the days once at the end.
+        buckets = self._buckets
+        for exercise, due_day in zip(exercises, due_days):
+            if not due_day:
+                continue
+            bucket = buckets.get(due_day)
+            if bucket is None:
+                bucket = buckets[due_day] = {}
+            bucket[exercise] = None
+        self._days = sorted(buckets)
+
+    def iter_buckets(self, last_day):
+        #Yields (due day ordinal, exercises) for every due day up to and including last_day.
+        for day in self._days[:bisect.bisect_right(self._days, last_day)]:
+            yield day, self._buckets[day]
+
+    def pop_due(self, date):
+        #Removes and returns every exercise due on or before the date in one step, for bulk advancement.
+        end = self._count_due_days(date)
+        due_exercises = []
+        for day in self._days[:end]:
+            due_exercises.extend(self._buckets.pop(day))
+        del self._days[:end]
+        return due_exercises
+
+
+class StageIndex:
+    #Keeps a count of exercises per stage and the stage 0 exercises in (chapter, unit, number) order,
+    #so stage counts and the next exercise to start are available without scanning the class.
+    def __init__(self) -> None:
+        self.counts = collections.Counter()
+        self._queue_keys = []
+        self._queue = {}
+
+    def add(self, exercise, stage):
+        self.counts[stage] += 1
+        if stage == 0:
+            key = exercise.get_key()
+            bisect.insort(self._queue_keys, key)
+            self._queue[key] = exercise
+
+    def remove(self, exercise, stage):
+        self.counts[stage] -= 1
+        if stage == 0:
+            key = exercise.get_key()
+            del self._queue_keys[bisect.bisect_left(self._queue_keys, key)]
+            del self._queue[key]
+
+    def move(self, exercise, old_stage, new_stage):
+        if old_stage != new_stage:
+            self.remove(exercise, old_stage)
+            self.add(exercise, new_stage)
+
+    def add_many(self, exercises, keys, stages):
+        #Adds exercises with their keys and stages, sorting the stage 0 queue once at the end.
+        self.counts.update(stages)
+        queued = [(key, exercise) for key, exercise, stage in zip(keys, exercises, stages) if stage == 0]
+        self._queue.update(queued)
+        self._queue_keys.extend(key for key, _ in queued)
+        self._queue_keys.sort()
+
+    def count(self, stage):
+        return self.counts[stage]
+
+    def next_new(self, count=1):
+        #Returns up to count stage 0 exercises in the order they should be started.
+        return [self._queue[key] for key in self._queue_keys[:count]]
+
+
+class BaseExercise:
+    #Behaviour shared by every kind of exercise. Subclasses provide the attributes, either stored on the object
+    #(Exercise) or read from a column of an ExerciseTable (ExerciseRow).
+    __slots__ = ()
 
-class Exercise:
-    # Class for saving all exercise information as an object. 
-    def __init__(self, chapter, unit, number, name, web_link, class_id=0, current_stage=0, last_review_date=None, due_date=None) -> None:
-        self.chapter = chapter
-        self.unit = unit
-        self.number = number
-        self.name = name
-        self.web_link = web_link
-        self.class_id = class_id
-        self.current_stage = current_stage
-        self.last_review_date = self._return_date_or_none(last_review_date)
-        self.due_date = self._return_date_or_none(due_date)
-        
-    
     def print_exercise(self):
         #Prints standard exercise info to screen. 
+        print(self.format_line())
+
+    def format_line(self):
+        #Standard exercise info as one line of a listing, in the columns of rendering.HEADER.
         #Truncates long names to fit into column
-        #Does not print web link, class id because they aren't especially useful to the user and would clutter the display.
+        #Leaves out web link, class id because they aren't especially useful to the user and would clutter the display.
         exercise_id = self.get_exercise_id_string()
-        print(f"{exercise_id:12}{self.name[:50]:50}{self.current_stage:<7}{self._return_datestring_or_nastring(self.last_review_date):12}{self._return_datestring_or_nastring(self.due_date):12}")
+        return f"{exercise_id:12}{self.name[:50]:50}{self.current_stage:<7}{format_date(self.last_review_date):12}{format_date(self.due_date):12}"
 
-    def _return_date_or_none(self, date_string):
+    @staticmethod
+    def _return_date_or_none(date_string):
         #For classes not started date values will be null or None. This makes sure the right value is returned from the string.
+        #Also accepts the day numbers dates are stored as, and date objects.
         if not date_string:
             return None
+        elif isinstance(date_string, int):
+            return day_to_date(date_string)
+        elif isinstance(date_string, datetime.date):
+            return date_string
         else:
-            return self._date_string_to_object(date_string)
-        
+            return BaseExercise._date_string_to_object(date_string)
+
 
-    def _date_string_to_object(self, date_string):
+    @staticmethod
+    def _date_string_to_object(date_string):
         #Takes what should be a date string and returns a datetime object. If not a valid datetime object, an error is raised.
-        try: 
-            return datetime.datetime.strptime(date_string, "%Y-%m-%d").date()
-        except ValueError as e:
-            raise ValueError(f"Invalid date format for {date_string}, expected format: YYYY-MM-DD") from e
+        return parse_date_string(date_string)
     
     def _return_datestring_or_nastring(self, date):
         # Converts date object to string for printing. If no date value is assigned "n/a" is printed for the date.
-        if not date:
-            return "n/a"
-        else:
-            return date.strftime("%Y-%m-%d")
+        return format_date(date)
         
+    def has_details(self):
+        #False while the name and web link of a lazily loaded exercise have not been fetched yet.
+        return self._get_raw_name() is not NOT_LOADED
+
+    def _load_details(self):
+        #Fetches the name and web link of a lazily loaded exercise through its class.
+        if self._owner is None:
+            raise LookupError(f"Exercise {self.get_exercise_id_string()} was loaded lazily and is not attached to a class.")
+        self._owner.load_exercise_details([self])
+
     def get_exercise_id_string(self):
         return f"{self.chapter}.{self.unit}.{self.number}"
+
+    def get_key(self):
+        return (self.chapter, self.unit, self.number)
+
+    def get_due_day(self):
+        #Returns the due date as a day ordinal, or None when the exercise has no due date.
+        if self.due_date:
+            return self.due_date.toordinal()
+
+    def mark_dirty(self):
+        #Flags the exercise as changed and queues it with the owning class so the next save writes it.
+        if self.is_dirty:
+            return
+        self.is_dirty = True
+        if self._owner is not None:
+            self._owner._unit_of_work.register_dirty(self)
+
+    def mark_clean(self):
+        self.is_new = False
+        self.is_dirty = False
+
+    def _changed(self, old_stage, old_due_day):
+        #Lets the owning class update its indexes, then queues the exercise for saving.
+        if self._owner is not None:
+            self._owner._exercise_changed(self, old_stage, old_due_day)
+        self.mark_dirty()
+
+    def start(self, start_date):
+        #Puts the exercise into rotation at stage 1, due on the start date.
+        old_stage, old_due_day = self.current_stage, self.get_due_day()
+        self.current_stage = 1
+        self.due_date = start_date
+        self._changed(old_stage, old_due_day)
     
     def advance_stage(self, review_date):
-        self.current_stage += 1
+        old_stage, old_due_day = self.current_stage, self.get_due_day()
+        next_delta = self.get_schedule().next_deltas[old_stage]
+        self.current_stage = old_stage + 1
         self.last_review_date = review_date
-        if self.current_stage == 6:
-            self.due_date = None
-        else:
-            due_date_modifier = self._get_due_date_modifier()
-            self.due_date = review_date + datetime.timedelta(days=due_date_modifier)
+        #Exercises reaching the schedule's terminal stage retire and have no due date.
+        self.due_date = None if next_delta is None else review_date + next_delta
+        self._changed(old_stage, old_due_day)
+        if self._owner is not None:
+            self._owner._unit_of_work.register_review(self, review_date, old_stage)
+
+    def get_schedule(self):
+        #The owning class's schedule, or the default one for an exercise not attached to a class.
+        owner = self._owner
+        return owner.schedule if owner is not None else scheduling.DEFAULT_SCHEDULE
 
-    def _get_due_date_modifier(self):
-        due_date_modifiers = {1:1, 2:3, 3:7, 4:14, 5:28}
-        return due_date_modifiers[self.current_stage]
-    
     def get_num_of_exercises(self):
-        exercises_per_stage = {1:5, 2:3, 3:2, 4:1, 5:1}
-        return exercises_per_stage[self.current_stage]
-        
+        return self.get_schedule().problems[self.current_stage]
+
+
+class Exercise(BaseExercise):
+    # Class for saving all exercise information as an object. 
+    #Slots keep each exercise small, since large classes hold tens of thousands of them.
+    __slots__ = ('chapter', 'unit', 'number', '_name', '_web_link', 'class_id', 'current_stage', 'last_review_date', 'due_date',
+                 'version', 'is_new', 'is_dirty', '_owner')
+
+    def __init__(self, chapter, unit, number, name, web_link, class_id=0, current_stage=0, last_review_date=None, due_date=None,
+                 version=0) -> None:
+        self.chapter = chapter
+        self.unit = unit
+        self.number = number
+        self.name = name
+        self.web_link = web_link
+        self.class_id = class_id
+        self.current_stage = current_stage
+        self.last_review_date = self._return_date_or_none(last_review_date)
+        self.due_date = self._return_date_or_none(due_date)
+        #Version of the saved row this exercise was loaded from. Saves only apply if the row is still at this version.
+        self.version = version
+        #New exercises have never been written to the database. Dirty exercises have changed since they were last saved.
+        self.is_new = True
+        self.is_dirty = False
+        self._owner = None
+
+    def _get_raw_name(self):
+        return self._name
+
+    @property
+    def name(self):
+        if self._name is NOT_LOADED:
+            self._load_details()
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        self._name = value
+
+    @property
+    def web_link(self):
+        if self._web_link is NOT_LOADED:
+            self._load_details()
+        return self._web_link
+
+    @web_link.setter
+    def web_link(self, value):
+        self._web_link = value
+
 
 class MathClass:
     #Class for managing the class set of exercises.
-    def __init__(self, class_id=0, class_name="Default") -> None:
+    #With storage="table" the exercise data is kept in a columnar ExerciseTable and self.exercises holds lightweight
+    #row views, which uses far less memory for large classes and lets reviews be advanced in one batched pass.
+    def __init__(self, class_id=0, class_name="Default", storage="objects", schedule=None) -> None:
         self.exercises = []
         self.class_id = class_id
         self.class_name = class_name
+        #Review schedule of the class. Loading from the database replaces it with the class's stored schedule, if any.
+        self.schedule = schedule or scheduling.DEFAULT_SCHEDULE
+        if storage == "table":
+            from src.exercise_table import ExerciseTable
+            self.table = ExerciseTable()
+        elif storage == "objects":
+            self.table = None
+        else:
+            raise ValueError(f"Unknown storage mode {storage}, expected 'objects' or 'table'")
+        self._unit_of_work = UnitOfWork()
+        self._due_index = DueIndex()
+        self._stage_index = StageIndex()
+        #Exercises by (chapter, unit, number), and the sorted exercise numbers used in each (chapter, unit).
+        self._exercise_index = {}
+        self._numbers_by_unit = {}
+        #Database that lazily loaded exercises fetch their names and links from.
+        self._details_db_path = database.DEFAULT_DB_PATH
+        #Keys of the exercises the last save found changed by another writer.
+        self.conflicts = []
+        #Formatted listing lines, so printing the class again only formats the exercises that changed.
+        self._line_cache = rendering.LineCache()
 
     def add_exercise(self, chapter, unit, number, name, web_link):
         #Creates a new exercise then adds it to the class.
         #Note that stage number and date values are assigned by the program, so only the ID, name, and web link are provided by the user.
         new_exercise = Exercise(chapter, unit, number, name, web_link, self.class_id)
-        self.exercises.append(new_exercise)
+        self.attach_exercise(new_exercise)
 
-    def print_all_exercises(self):
-        #Prints all the exercises currently in the class. 
-        
+    def attach_exercise(self, exercise, keep_sorted=True):
+        #Adds an already built exercise to the class, keeping the exercise list in (chapter, unit, number) order.
+        #New exercises are queued for insertion on the next save. Returns the exercise held by the class,
+        #which in table storage is a row view rather than the object passed in.
+        #Bulk callers can pass keep_sorted=False and sort the list once when they are done.
+        key = exercise.get_key()
+        if key in self._exercise_index:
+            raise ValueError(f"Exercise {exercise.get_exercise_id_string()} already exists in this class.")
+        if self.table is not None and getattr(exercise, "_table", None) is not self.table:
+            exercise = self.table.append_exercise(exercise)
+        exercise._owner = self
+        self._exercise_index[key] = exercise
+        bisect.insort(self._numbers_by_unit.setdefault(key[:2], []), key[2])
+        #Exercises loaded from the database arrive in order, so this is normally an append.
+        if keep_sorted and self.exercises and self.exercises[-1].get_key() > key:
+            bisect.insort(self.exercises, exercise, key=BaseExercise.get_key)
+        else:
+            self.exercises.append(exercise)
+        self._due_index.add(exercise, exercise.get_due_day())
+        self._stage_index.add(exercise, exercise.current_stage)
+        if exercise.is_new:
+            self._unit_of_work.register_new(exercise)
+        elif exercise.is_dirty:
+            self._unit_of_work.register_dirty(exercise)
+        return exercise
+
+    def _attach_clean_exercises(self, exercises, keys=None, stages=None, due_days=None):
+        #Attaches saved exercises to a class that has none yet, building each index in one pass. The exercises must
+        #already be in (chapter, unit, number) order with unique keys, so the checks and sorted inserts of
+        #attach_exercise are skipped. Callers holding the keys, stages and due day ordinals as columns can pass them
+        #instead of having them read from every exercise.
         if self.exercises:
-            print(f'{"Number":12}{"Name":50}{"Stage":7}{"Last":12}{"Due":12}')
-            for exercise in self.exercises:
-                exercise.print_exercise()
+            raise ValueError("Exercises can only be attached in bulk to an empty class")
+        exercises = list(exercises)
+        keys = [exercise.get_key() for exercise in exercises] if keys is None else keys
+        stages = [exercise.current_stage for exercise in exercises] if stages is None else stages
+        due_days = [exercise.get_due_day() for exercise in exercises] if due_days is None else due_days
+        for exercise in exercises:
+            exercise._owner = self
+        self._exercise_index.update(zip(keys, exercises))
+        numbers_by_unit = self._numbers_by_unit
+        for chapter, unit, number in keys:
+            numbers = numbers_by_unit.get((chapter, unit))
+            if numbers is None:
+                numbers = numbers_by_unit[(chapter, unit)] = []
+            numbers.append(number)
+        self._due_index.add_many(exercises, due_days)
+        self._stage_index.add_many(exercises, keys, stages)
+        self.exercises.extend(exercises)
+
+    def _build_exercise(self, row):
+        #Builds an exercise from a database row, straight into the table when using table storage.
+        if self.table is not None:
+            return self.table.append(*row)
+        return Exercise(*row)
+
+    def _detach_exercise(self, exercise):
+        #Removes an exercise from the class and its indexes. The database delete is queued separately.
+        key = exercise.get_key()
+        del self.exercises[bisect.bisect_left(self.exercises, key, key=BaseExercise.get_key)]
+        del self._exercise_index[key]
+        numbers = self._numbers_by_unit[key[:2]]
+        del numbers[bisect.bisect_left(numbers, key[2])]
+        if not numbers:
+            del self._numbers_by_unit[key[:2]]
+        self._due_index.remove(exercise, exercise.get_due_day())
+        self._stage_index.remove(exercise, exercise.current_stage)
+        exercise._owner = None
+        self._line_cache.discard(exercise)
+        if self.table is not None:
+            self.table.remove(exercise)
+
+    def _exercise_changed(self, exercise, old_stage, old_due_day):
+        #Called by an exercise after its stage or due date changed so the indexes stay current.
+        self._due_index.move(exercise, old_due_day, exercise.get_due_day())
+        self._stage_index.move(exercise, old_stage, exercise.current_stage)
+
+    def get_exercise(self, chapter, unit, number):
+        #Returns the exercise with the given chapter, unit and number, or None if the class does not have it.
+        return self._exercise_index.get((chapter, unit, number))
+
+    def get_largest_exercise_number(self, chapter, unit):
+        #Returns the largest exercise number used in the chapter and unit, or None if there are none.
+        numbers = self._numbers_by_unit.get((chapter, unit))
+        if numbers:
+            return numbers[-1]
+
+    def get_stage_histogram(self):
+        #Returns the number of exercises at each stage, including stages with no exercises.
+        return {stage: self._stage_index.count(stage) for stage in range(self.schedule.terminal_stage + 1)}
+
+    def select_exercises(self, stages=None, chapters=None):
+        #Yields the exercises in (chapter, unit, number) order, keeping only those at one of the stages and in one of
+        #the chapters when given. Chapters are found by bisecting the sorted exercise list, so only their exercises are visited.
+        if chapters is None:
+            exercises = self.exercises
         else:
+            exercises = itertools.chain.from_iterable(self._get_chapter_exercises(chapter) for chapter in sorted(set(chapters)))
+        if stages is None:
+            return iter(exercises)
+        stages = set(stages)
+        return (exercise for exercise in exercises if exercise.current_stage in stages)
+
+    def _get_chapter_exercises(self, chapter):
+        start = bisect.bisect_left(self.exercises, (chapter,), key=BaseExercise.get_key)
+        end = bisect.bisect_left(self.exercises, (chapter + 1,), key=BaseExercise.get_key)
+        return self.exercises[start:end]
+
+    def print_all_exercises(self, stages=None, chapters=None, limit=None, page_size=None, out=None):
+        #Prints the exercises currently in the class, or those at the given stages and chapters, up to limit of them.
+        #With page_size, waits for the user after each page.
+        if not self.exercises:
             print("Class is empty. No exercises have been added. Type 6 to add exercises.")
-    
-    def print_due_exercises(self):
-        #Prints only those exercises that are due or past due today. 
+        elif not self.print_exercise_listing(self.select_exercises(stages, chapters), limit, page_size, out):
+            print("No exercises match.")
+
+    def print_due_exercises(self, stages=None, chapters=None, limit=None, page_size=None, out=None):
+        #Prints only those exercises that are due or past due today, optionally filtered and paged like print_all_exercises.
         due_exercises = self.get_due_exercises()
-        if due_exercises:
-            for exercise in due_exercises:
-                exercise.print_exercise()
-        else:
+        if stages is not None or chapters is not None:
+            chapters = None if chapters is None else set(chapters)
+            stages = None if stages is None else set(stages)
+            due_exercises = [exercise for exercise in due_exercises if (stages is None or exercise.current_stage in stages)
+                             and (chapters is None or exercise.chapter in chapters)]
+        if not self.print_exercise_listing(due_exercises, limit, page_size, out):
             print("No exercises due today")
 
-    def get_due_exercises(self):
-        #Creates a list of the exercises that are due or past due today.
-        due_exercises = []
-        today = datetime.datetime.today().date()
-        for exercise in self.exercises:
-            if exercise.due_date is None:
-                continue
+    def print_exercise_listing(self, exercises, limit=None, page_size=None, out=None):
+        #Writes a listing of the exercises to out, standard output by default. Lines are formatted a batch at a time,
+        #reusing cached lines of unchanged exercises, and each batch goes out in one write. Names of lazily loaded
+        #exercises are fetched per batch, so a limited listing of a large class only reads what it shows.
+        #With page_size, each batch is one page and the user is asked before the next one. Returns the number written.
+        out = out or sys.stdout
+        if limit is not None:
+            exercises = itertools.islice(exercises, limit)
+        batches = rendering.iter_batches(exercises, page_size or rendering.WRITE_BATCH_SIZE)
+        written = 0
+        batch = next(batches, None)
+        while batch:
+            self.load_exercise_details(batch)
+            out.write(rendering.render_lines(batch, self._line_cache, header=not written))
+            written += len(batch)
+            batch = next(batches, None)
+            if batch and page_size:
+                out.flush()
+                if input(f"{written} shown. Press enter for more or type q to stop.").strip().lower() == "q":
+                    break
+        return written
 
-            if exercise.due_date <= today:
-                due_exercises.append(exercise)
+    @instrumentation.instrumented("MathClass.get_due_exercises")
+    def get_due_exercises(self, due_date=None):
+        #Creates a list of the exercises that are due or past due today, in chapter, unit, number order.
+        if due_date is None:
+            due_date = datetime.datetime.today().date()
+        return sorted(self._due_index.iter_due(due_date), key=BaseExercise.get_key)
 
-        return due_exercises
+    @instrumentation.instrumented("MathClass.save_to_db")
+    def save_to_db(self, db_path=database.DEFAULT_DB_PATH):
+        #Saves exercises added, changed or deleted since the last save into the database.
+        #Only pending rows are written, batched with executemany inside a single transaction.
+        #Exercises that someone else saved first are not overwritten. They are reloaded from the database instead,
+        #and their keys are returned and kept in self.conflicts.
+        self.conflicts = []
+        if not self._unit_of_work.has_changes():
+            return self.conflicts
 
-    def save_to_db(self, db_path='spaced-math-review.db'):
-        #Saves current exercise data into the database
+        unit_of_work = self._unit_of_work
+        instrumentation.add_rows(len(unit_of_work.new) + len(unit_of_work.dirty) + len(unit_of_work.deleted) + len(unit_of_work.reviews))
         try: 
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-
-            # Ensure the table exists
-            cursor.execute('''CREATE TABLE IF NOT EXISTS exercises (
-                                chapter INTEGER,
-                                unit INTEGER,
-                                number INTEGER,
-                                name TEXT,
-                                web_link TEXT,
-                                class_id INTEGER,
-                                current_stage INTEGER,
-                                last_review_date TEXT,
-                                due_date TEXT,
-                                PRIMARY KEY (chapter, unit, number, class_id),
-                                FOREIGN KEY (class_id) REFERENCES classes(class_id))''')
-
-            # Insert or update exercises in the database
-            for exercise in self.exercises:
-                cursor.execute('''INSERT OR REPLACE INTO exercises 
-                                (chapter, unit, number, name, web_link, class_id, current_stage, last_review_date, due_date) 
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
-                            (exercise.chapter, exercise.unit, exercise.number, exercise.name, exercise.web_link, exercise.class_id, exercise.current_stage, 
-                                exercise.last_review_date, exercise.due_date))
-
-            conn.commit()
-            conn.close()
+            conflicts = database.get_database(db_path).save_exercises(self.class_id, unit_of_work.deleted, unit_of_work.new.values(),
+                                                                      unit_of_work.dirty.values(), unit_of_work.reviews)
+            self._unit_of_work.mark_committed(set(conflicts))
+            if conflicts:
+                self._reload_conflicts(conflicts, db_path)
 
         except sqlite3.Error as e:
             print(f"An error occurred while saving to the database: {e}")
-        
-        finally:
-            if conn:
-                conn.close()
+        return self.conflicts
+
+    def _reload_conflicts(self, conflicts, db_path):
+        #Replaces the schedule of each conflicting exercise with the saved one, or drops the exercise if it was deleted.
+        saved = {row[:3]: row[3:] for row in database.get_database(db_path).load_exercise_schedules(self.class_id, conflicts)}
+        for key in conflicts:
+            exercise = self._exercise_index.get(key)
+            if exercise is None:
+                continue
+            if key not in saved:
+                self._detach_exercise(exercise)
+                continue
+            old_stage, old_due_day = exercise.current_stage, exercise.get_due_day()
+            current_stage, last_review_date, due_date, version = saved[key]
+            exercise.current_stage = current_stage
+            exercise.last_review_date = BaseExercise._return_date_or_none(last_review_date)
+            exercise.due_date = BaseExercise._return_date_or_none(due_date)
+            exercise.version = version
+            self._exercise_changed(exercise, old_stage, old_due_day)
+        self.conflicts = list(conflicts)
+        ids = ", ".join(".".join(map(str, key)) for key in conflicts)
+        print(f"{len(conflicts)} exercises were changed by someone else and have been reloaded instead of saved: {ids}")
 
     def prompt_and_add_exercise(self):
         #Prompts the user to input values for a single new exercise
@@ -176,59 +678,114 @@ class MathClass:
         return int(num)
 
     def _verify_number_is_unique(self, chapter, unit, number):
-        existing_exercise_numbers = self._get_list_of_existing_exercise_numbers_for_chapter_and_unit(chapter, unit)
-        while number in existing_exercise_numbers:
-            largest_num = max(existing_exercise_numbers)
+        while (chapter, unit, number) in self._exercise_index:
+            largest_num = self.get_largest_exercise_number(chapter, unit)
             number = input(f"Number already exists. Please input new number. Largest existing number is {largest_num}.")
             number = self._user_input_to_int(number)
         return number
     
     def _get_list_of_existing_exercise_numbers_for_chapter_and_unit(self, chapter, unit):
-        existing_exercise_numbers = []
-        for exercise in self.exercises:
-            if exercise.chapter == chapter and exercise.unit == unit:
-                existing_exercise_numbers.append(exercise.number)
-        return existing_exercise_numbers
+        return list(self._numbers_by_unit.get((chapter, unit), []))
 
     def add_exercises_until_done_then_save(self):
         #Allows user to continue adding exercises until they are finished then saves to the database when finished.
+        #New exercises are inserted in order as they are added, so the list does not need re-sorting.
         menu_choice = "y"
         while menu_choice.lower() == "y":
             self.prompt_and_add_exercise()
             menu_choice = input('Add another? Type "y" to add another.')
         self.save_to_db()
-        self.exercises.sort(key=lambda x: (x.chapter, x.unit, x.number)) #Sorts new values into exercise list
 
-    def load_exercises_from_database(self, dbpath='spaced-math-review.db'):
-        #Loads all the exercises for the chosen class from the database into the program.
-        try: 
-            conn = sqlite3.connect(dbpath)
-            cursor = conn.cursor()
+    @instrumentation.instrumented("MathClass.import_exercises")
+    def import_exercises(self, path, file_format=None, chunk_size=5000, db_path=database.DEFAULT_DB_PATH):
+        #Bulk adds exercises from a CSV or JSON lines file with chapter, unit, number, name and web_link fields.
+        #The file is streamed, and every chunk_size accepted rows are written in one transaction.
+        #Rows that are invalid or duplicate an existing exercise are skipped and listed in the returned ImportReport.
+        #If reading the file fails partway, the rows accepted before the error are still sorted in and saved,
+        #like the chunks already written, and the error is raised.
+        report = importer.ImportReport(path)
+        pending = 0
+        out_of_order = False
+        try:
+            for line_number, record in importer.iter_records(path, file_format):
+                report.rows_read += 1
+                try:
+                    chapter, unit, number, name, web_link = importer.parse_record(record)
+                except ValueError as e:
+                    report.reject(line_number, str(e))
+                    continue
+                if (chapter, unit, number) in self._exercise_index:
+                    report.reject(line_number, f"exercise {chapter}.{unit}.{number} already exists")
+                    continue
 
-            query = "SELECT * FROM exercises WHERE class_id = ? ORDER BY chapter, unit, number"
+                if self.exercises and self.exercises[-1].get_key() > (chapter, unit, number):
+                    out_of_order = True
+                self.attach_exercise(Exercise(chapter, unit, number, name, web_link, self.class_id), keep_sorted=False)
+                report.imported += 1
+                pending += 1
+                if pending >= chunk_size:
+                    self.save_to_db(db_path)
+                    pending = 0
+        finally:
+            #Rows out of order are sorted into place once rather than inserted one at a time.
+            if out_of_order:
+                self.exercises.sort(key=BaseExercise.get_key)
+            self.save_to_db(db_path)
+        report.finish()
+        return report
 
-            cursor.execute(query, (self.class_id,))
+    @instrumentation.instrumented("MathClass.load_exercises_from_database")
+    def load_exercises_from_database(self, dbpath=database.DEFAULT_DB_PATH, lazy=False, chunk_size=1000):
+        #Loads all the exercises for the chosen class from the database into the program.
+        #Rows are streamed in chunks rather than fetched all at once. With lazy=True only the columns needed for
+        #scheduling are read, and names and web links are fetched when first used.
+        loaded_before = len(self.exercises)
+        try: 
+            db = database.get_database(dbpath)
+            spec = db.get_class_schedules([self.class_id])[self.class_id]
+            if spec is not None:
+                self.schedule = scheduling.from_spec(spec)
+            rows = db.iter_exercises(self.class_id, lazy, chunk_size)
+            self._details_db_path = dbpath
 
-            exercises = cursor.fetchall()
-           
-            conn.close()
-            
-            for exercise in exercises:
-                exercise_to_add = Exercise(*exercise)
-                self.exercises.append(exercise_to_add)
-                
-        except sqlite3.OperationalError:
-            # Silently handle the error if the 'exercises' table doesn't exist
-            pass
+            for row in rows:
+                if lazy:
+                    row = (row[0], row[1], row[2], NOT_LOADED, NOT_LOADED, row[3], row[4], row[5], row[6], row[7])
+                exercise_to_add = self._build_exercise(row)
+                exercise_to_add.mark_clean()
+                self.attach_exercise(exercise_to_add)
 
         except sqlite3.Error as e:
             print(f"An error occurred while loading from the database: {e}")
-        
-        finally:
-            if conn:
-                conn.close()
-    
 
+        instrumentation.add_rows(len(self.exercises) - loaded_before)
+
+    @instrumentation.instrumented("MathClass.load_exercise_details")
+    def load_exercise_details(self, exercises):
+        #Fetches names and web links for any of the exercises that were loaded lazily, in as few queries as possible.
+        pending = {exercise.get_key(): exercise for exercise in exercises if not exercise.has_details()}
+        if not pending:
+            return
+        rows = database.get_database(self._details_db_path).load_exercise_details(self.class_id, pending)
+        instrumentation.add_rows(len(rows))
+        for chapter, unit, number, name, web_link in rows:
+            exercise = pending[(chapter, unit, number)]
+            exercise.name = name
+            exercise.web_link = web_link
+
+    @instrumentation.instrumented("MathClass.search_exercises")
+    def search_exercises(self, query, limit=20, db_path=database.DEFAULT_DB_PATH):
+        #Returns up to limit exercises of the class matching the query, best match first: those whose chapter.unit.number
+        #starts with the query, then those whose names contain its words. Searches the saved exercises, so exercises
+        #added since the last save are not found.
+        keys = database.get_database(db_path).search_exercises(self.class_id, query, limit)
+        return [self._exercise_index[key] for key in keys if key in self._exercise_index]
+
+    def prompt_and_search_exercises(self):
+        #Prompts for a search and prints the matching exercises
+        query = input("Enter part of an exercise name, or the start of its number such as 3.2\n").strip()
+        if not self.print_exercise_listing(self.search_exercises(query)):
+            print("No exercises found.")
 
     def delete_exercise(self):
         #Deletes an already existing exercise
@@ -243,8 +800,7 @@ class MathClass:
         number = self._user_input_to_int(number)
 
         #Verify that the exercise to delete is actually an exercise
-        existing_exercises = self._get_list_of_existing_exercise_numbers_for_chapter_and_unit(chapter, unit)
-        while number not in existing_exercises:
+        while (chapter, unit, number) not in self._exercise_index:
             number = input("Exercise number not found. Please enter again or type a to abort.")
             if number.lower() == "a":
                 print("Delete exercise aborted.")
@@ -258,57 +814,56 @@ class MathClass:
             print("Delete exercise aborted.")
             return
         
-        #Find the exercise's position in the exercise list
-        for i in range(len(self.exercises)):
-            if self.exercises[i].chapter == chapter and self.exercises[i].unit == unit and self.exercises[i].number == number:
-                index = i
-
         #Delete the exercise first from the class then from the database
-        del self.exercises[i]
+        self._detach_exercise(self._exercise_index[(chapter, unit, number)])
         self.delete_exercise_from_db(chapter, unit, number)
-        
-            
 
-    def delete_exercise_from_db(self, chapter, unit, number, dbpath='spaced-math-review.db'):
-        #Deletes the specificed exercise from the database
-        conn = sqlite3.connect(dbpath)
-        cursor = conn.cursor()
 
-        try:
-            # Prepare and execute the DELETE statement
-            cursor.execute("DELETE FROM exercises WHERE chapter = ? AND unit = ? AND number = ? AND class_id = ?", (chapter, unit, number, self.class_id))
+    @instrumentation.instrumented("MathClass.remove_exercise")
+    def remove_exercise(self, chapter, unit, number, db_path=database.DEFAULT_DB_PATH):
+        #Deletes an exercise from the class and the database without prompting.
+        #Returns False if the class has no such exercise.
+        exercise = self.get_exercise(chapter, unit, number)
+        if exercise is None:
+            return False
+        self._detach_exercise(exercise)
+        self._unit_of_work.register_deleted((chapter, unit, number))
+        self.save_to_db(db_path)
+        return True
 
-            # Commit the changes
-            conn.commit()
+    @instrumentation.instrumented("MathClass.delete_exercise_from_db")
+    def delete_exercise_from_db(self, chapter, unit, number, dbpath=database.DEFAULT_DB_PATH):
+        #Queues the specified exercise for deletion and writes it along with any other pending changes.
+        self._unit_of_work.register_deleted((chapter, unit, number))
+        self.save_to_db(dbpath)
+        if not self._unit_of_work.has_changes():
             exercise_id = f"{chapter}.{unit}.{number}"
             print(f"Exercise {exercise_id} has been deleted.")
 
-        except sqlite3.Error as e:
-            # Handle any database errors
-            print(f"An error occurred: {e}")
-
-        finally:
-            # Ensure the connection is closed
-            conn.close()
-
     def _find_next_stage_0_exercise(self):
-        for i in range(len(self.exercises)):
-            if self.exercises[i].current_stage == 0:
-                return i
+        next_exercises = self._stage_index.next_new()
+        if next_exercises:
+            return next_exercises[0]
             
     def _find_number_of_stage_one_exercises(self):
-        count = 0
-        for exercise in self.exercises:
-            if exercise.current_stage == 1:
-                count += 1
-        return count
+        return self._stage_index.count(1)
     
     def _find_number_of_stage_zero_exercises(self):
-        count = 0
-        for exercise in self.exercises:
-            if exercise.current_stage == 0:
-                count += 1
-        return count
+        return self._stage_index.count(0)
+
+    @instrumentation.instrumented("MathClass.start_next_exercises")
+    def start_next_exercises(self, count=1, start_date=None, db_path=database.DEFAULT_DB_PATH):
+        #Puts the next count stage 0 exercises into rotation, due on the start date, and saves them in one write.
+        #Returns the started exercises, which may be fewer than count if the class runs out.
+        if count < 0:
+            raise ValueError("The number of exercises to start cannot be negative")
+        if start_date is None:
+            start_date = datetime.datetime.today().date()
+        started = self._stage_index.next_new(count)
+        for exercise in started:
+            exercise.start(start_date)
+        self.save_to_db(db_path)
+        return started
             
     def start_next_exercise(self):
         #Takes the next exercise at stage 0 and sets the stage to 1 and the due date to today.
@@ -321,34 +876,114 @@ class MathClass:
 
 
         #Gets information on the next exercise
-        next_exercise_index = self._find_next_stage_0_exercise()
-        next_exercise_id = self.exercises[next_exercise_index].get_exercise_id_string()
-        next_exercise_name = self.exercises[next_exercise_index].name
+        next_exercise = self._find_next_stage_0_exercise()
+        next_exercise_id = next_exercise.get_exercise_id_string()
+        next_exercise_name = next_exercise.name
 
         #Get number of exercises currently at stage 1 
         num_stage1_exercises = self._find_number_of_stage_one_exercises()
 
         #Confirm 
         print(f"\nExercise {next_exercise_id}: {next_exercise_name} will be changed to stage 1 and the due date will be set to today.")
-        print(f"{num_stage1_exercises} exercises are currently at stage 1.\n")
+        print(f"{num_stage1_exercises} exercises are currently at stage 1.")
+        busiest_date, _, busiest_problems = max(self.forecast_workload(28), key=lambda day: day[2])
+        print(f"The busiest day in the next 4 weeks is {busiest_date} with {busiest_problems} problems. "
+              f"This exercise adds {self.schedule.problems[1]} problems today and {self.schedule.problems[2]} "
+              f"{self.schedule.next_intervals[1]} days from now.\n")
         menu_choice = input("Would you like to proceed? Type y to proceed.")
         if menu_choice != "y":
             print("Adding next exercise aborted.")
             return
         
-        #Set stage to 1
-        self.exercises[next_exercise_index].current_stage = 1
-
-        #Set due date to today
-        today = datetime.datetime.today().date()
-        self.exercises[next_exercise_index].due_date = today
-
-        #Save new values to database
-        self.save_to_db()
+        #Set stage to 1, due date to today and save new values to database
+        self.start_next_exercises(1)
 
         #Notify user of success
         print(f"Exercise {next_exercise_id}: {next_exercise_name} added to rotation.")
 
+    def forecast_workload(self, days, start_date=None):
+        #Projects the reviews and problems due on each of the next days, from the current stages and due dates,
+        #assuming each review is done on its due date. Overdue exercises count as due on the start date.
+        #Returns a list of (date, reviews, problems), one per day starting with start_date (default today).
+        if days < 1:
+            raise ValueError("Forecasts cover at least one day")
+        if start_date is None:
+            start_date = datetime.datetime.today().date()
+        start_day = start_date.toordinal()
+        counts = collections.Counter()
+        for due_day, exercises in self._due_index.iter_buckets(start_day + days - 1):
+            offset = max(due_day - start_day, 0)
+            for exercise in exercises:
+                counts[(offset, exercise.current_stage)] += 1
+
+        reviews = [0] * days
+        problems = [0] * days
+        review_offsets, problems_per_stage = self.schedule.review_offsets, self.schedule.problems
+        for (offset, stage), count in counts.items():
+            for review_offset, review_stage in review_offsets[stage]:
+                day = offset + review_offset
+                if day >= days:
+                    break
+                reviews[day] += count
+                problems[day] += count * problems_per_stage[review_stage]
+        return [(start_date + datetime.timedelta(days=day), reviews[day], problems[day]) for day in range(days)]
+
+    def plan_new_exercises(self, daily_problem_budget, days=90, start_date=None):
+        #Returns how many stage 0 exercises can be started on the start date without the forecast problem count
+        #of any day in the horizon going over the daily budget.
+        forecast = self.forecast_workload(days, start_date)
+        fit = self._stage_index.count(0)
+        for review_offset, review_stage in self.schedule.review_offsets[1]:
+            if review_offset >= days:
+                break
+            if self.schedule.problems[review_stage]:
+                spare = max(daily_problem_budget - forecast[review_offset][2], 0)
+                fit = min(fit, spare // self.schedule.problems[review_stage])
+        return fit
+
+    def auto_schedule(self, daily_problem_budget, days=90, start_date=None, db_path=database.DEFAULT_DB_PATH):
+        #Starts as many stage 0 exercises as fit under the daily problem budget. Returns the started exercises.
+        count = self.plan_new_exercises(daily_problem_budget, days, start_date)
+        if count == 0:
+            return []
+        return self.start_next_exercises(count, start_date, db_path)
+
+    def set_schedule(self, schedule, db_path=database.DEFAULT_DB_PATH):
+        #Switches the class to another review schedule and stores it. Due dates already set are kept, the new
+        #intervals apply from each exercise's next review. Retired exercises move to the new terminal stage, saved in the
+        #same transaction as the schedule. Raises ValueError if a shorter schedule would leave exercises in rotation at
+        #or past its terminal stage.
+        old_terminal, new_terminal = self.schedule.terminal_stage, schedule.terminal_stage
+        if new_terminal < old_terminal:
+            stages_left_out = range(new_terminal, old_terminal)
+            if any(self._stage_index.count(stage) for stage in stages_left_out):
+                raise ValueError(f"Some exercises are at or past stage {new_terminal}, where this schedule retires them")
+        spec = None if schedule is scheduling.DEFAULT_SCHEDULE else schedule.spec
+        retired_stages = (old_terminal, new_terminal) if new_terminal != old_terminal else None
+        database.get_database(db_path).set_class_schedule(self.class_id, spec, retired_stages)
+        self.schedule = schedule
+        if retired_stages is not None and self._stage_index.count(old_terminal):
+            for exercise in self.select_exercises(stages=[old_terminal]):
+                exercise.current_stage = new_terminal
+                if exercise.is_new or exercise.is_dirty:
+                    #Not saved at this stage yet, so the next save writes the new stage.
+                    exercise._changed(old_terminal, None)
+                else:
+                    #Moved by the database update above, which also bumped the version.
+                    self._exercise_changed(exercise, old_terminal, None)
+                    exercise.version += 1
+
+    def get_review_history(self, chapter, unit, number, db_path=database.DEFAULT_DB_PATH):
+        #Returns the saved reviews of one exercise as [(review_date, stage reviewed at)], oldest first.
+        return database.get_database(db_path).load_review_history(self.class_id, (chapter, unit, number))
+
+    def get_reviews_per_day(self, start_date, end_date, db_path=database.DEFAULT_DB_PATH):
+        #Returns [(date, reviews)] for each day between the dates, inclusive, that has saved reviews.
+        totals = {}
+        for review_date, _, count in database.get_database(db_path).count_reviews_per_day(self.class_id, start_date, end_date):
+            totals[review_date] = totals.get(review_date, 0) + count
+        return list(totals.items())
+
     def get_review_date(self):
         date_choice = input("Enter date reviews were completed.\n"
                             "Type 0 for today, 1 for yesterday, or d to enter some other date.\n"
@@ -361,22 +996,38 @@ class MathClass:
             user_date = input("Enter date in format YYYY-MM-DD\n")
             while not self.is_date_valid(user_date):
                 user_date = input("Date format invalid. Enter date in format YYYY-MM-DD\n")
-            review_date = datetime.datetime.strptime(user_date, "%Y-%m-%d").date()
+            review_date = parse_date_string(user_date)
         else:
             return
         return review_date
 
     def count_reviews_to_advance(self, review_date):
-        count = 0
-        for exercise in self.exercises:
-            if exercise.due_date and exercise.due_date <= review_date:
-                count += 1
-        return count
+        return self._due_index.count_due(review_date)
+
+    @instrumentation.instrumented("MathClass.advance_due_exercises")
+    def advance_due_exercises(self, review_date):
+        #Advances every exercise due on or before the review date without prompting. Returns the number advanced.
+        #Changes are queued for the next save.
+        if self.table is None:
+            #The due list is copied because advancing moves exercises within the index.
+            due_exercises = list(self._due_index.iter_due(review_date))
+            for exercise in due_exercises:
+                exercise.advance_stage(review_date)
+            return len(due_exercises)
+
+        #Table storage advances all due rows in one batched pass over the columns, then re-indexes them.
+        due_exercises = self._due_index.pop_due(review_date)
+        old_stages = self.table.advance_rows(due_exercises, review_date.toordinal(), self.schedule.next_intervals)
+        for exercise, old_stage in zip(due_exercises, old_stages):
+            self._stage_index.move(exercise, old_stage, exercise.current_stage)
+            self._due_index.add(exercise, exercise.get_due_day())
+            exercise.mark_dirty()
+            self._unit_of_work.register_review(exercise, review_date, old_stage)
+        return len(due_exercises)
 
     def is_date_valid(self, date_string):
-        date_format = date_format = "%Y-%m-%d"
         try:
-            datetime.datetime.strptime(date_string, date_format)
+            parse_date_string(date_string)
             return True
         except ValueError:
             return False
@@ -405,9 +1056,7 @@ class MathClass:
             return
         
         #Updates exercises due before review date.
-        for exercise in self.exercises:
-            if exercise.due_date and exercise.due_date <= review_date:
-                exercise.advance_stage(review_date)
+        self.advance_due_exercises(review_date)
         print("All exercises due before review date have been advanced.")
 
         #Saves updates to the database
@@ -0,0 +1,215 @@
+import sqlite3
+
+
+def _to_day(value):
+    #Converts a stored YYYY-MM-DD date to its day number, date.toordinal(). Empty dates become NULL.
+    if not value:
+        return None
+    if isinstance(value, int):
+        return value
+    from src.math_class import parse_date_string
+    return parse_date_string(value).toordinal()
+
+
+def _dates_to_day_numbers(cursor):
+    #Rebuilds the tables with dates as INTEGER day numbers instead of TEXT. The column type has to change too,
+    #as a TEXT column would store the numbers back as strings. The declared type DAY has numeric affinity, so day
+    #numbers are stored as integers, and lets queries return dates through the converter registered in src/database.py.
+    cursor.connection.create_function("to_day", 1, _to_day, deterministic=True)
+    cursor.execute('''CREATE TABLE exercises_new (
+                          chapter INTEGER,
+                          unit INTEGER,
+                          number INTEGER,
+                          name TEXT,
+                          web_link TEXT,
+                          class_id INTEGER,
+                          current_stage INTEGER,
+                          last_review_date DAY,
+                          due_date DAY,
+                          version INTEGER NOT NULL DEFAULT 0,
+                          PRIMARY KEY (chapter, unit, number, class_id),
+                          FOREIGN KEY (class_id) REFERENCES classes(class_id))''')
+    cursor.execute('''INSERT INTO exercises_new
+                      SELECT chapter, unit, number, name, web_link, class_id, current_stage, to_day(last_review_date),
+                             to_day(due_date), version
+                      FROM exercises''')
+    cursor.execute("DROP TABLE exercises")
+    cursor.execute("ALTER TABLE exercises_new RENAME TO exercises")
+    cursor.execute("CREATE INDEX exercises_class_due ON exercises (class_id, due_date)")
+
+    cursor.execute('''CREATE TABLE reviews_new (
+                          review_id INTEGER PRIMARY KEY,
+                          class_id INTEGER NOT NULL,
+                          chapter INTEGER NOT NULL,
+                          unit INTEGER NOT NULL,
+                          number INTEGER NOT NULL,
+                          review_date DAY NOT NULL,
+                          stage INTEGER NOT NULL)''')
+    cursor.execute('''INSERT INTO reviews_new
+                      SELECT review_id, class_id, chapter, unit, number, to_day(review_date), stage FROM reviews''')
+    cursor.execute("DROP TABLE reviews")
+    cursor.execute("ALTER TABLE reviews_new RENAME TO reviews")
+    cursor.execute("CREATE INDEX reviews_class_day ON reviews (class_id, review_date, stage)")
+    cursor.execute("CREATE INDEX reviews_exercise ON reviews (class_id, chapter, unit, number, review_date, stage)")
+
+    cursor.execute('''CREATE TABLE review_daily_counts_new (
+                          class_id INTEGER NOT NULL,
+                          review_date DAY NOT NULL,
+                          stage INTEGER NOT NULL,
+                          review_count INTEGER NOT NULL,
+                          PRIMARY KEY (class_id, review_date, stage)) WITHOUT ROWID''')
+    cursor.execute('''INSERT INTO review_daily_counts_new
+                      SELECT class_id, to_day(review_date), stage, review_count FROM review_daily_counts''')
+    cursor.execute("DROP TABLE review_daily_counts")
+    cursor.execute("ALTER TABLE review_daily_counts_new RENAME TO review_daily_counts")
+
+
+#Schema changes, applied in order to bring a database up to date. The schema version of a database file is kept in
+#PRAGMA user_version, so opening an up-to-date database costs one pragma read and never runs any DDL.
+#Each migration is (version, description, steps). A step is an SQL statement, or a function called with the cursor
+#for changes that need Python. Add new migrations to the end with the next version number, and never edit old ones.
+#Databases from before versioning are at version 0 and may already have the tables, hence IF NOT EXISTS in the first ones.
+MIGRATIONS = [
+    (1, "classes and exercises tables", (
+        '''CREATE TABLE IF NOT EXISTS classes (
+               class_id INTEGER PRIMARY KEY,
+               class_name TEXT NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS exercises (
+               chapter INTEGER,
+               unit INTEGER,
+               number INTEGER,
+               name TEXT,
+               web_link TEXT,
+               class_id INTEGER,
+               current_stage INTEGER,
+               last_review_date TEXT,
+               due_date TEXT,
+               PRIMARY KEY (chapter, unit, number, class_id),
+               FOREIGN KEY (class_id) REFERENCES classes(class_id))''',
+    )),
+    (2, "due date index", (
+        "CREATE INDEX IF NOT EXISTS exercises_class_due ON exercises (class_id, due_date)",
+    )),
+    #Append-only log with one row per review: the exercise, the day it was reviewed and the stage it was reviewed at.
+    #Rows are only ever inserted, or rolled into review_daily_counts by Database.compact_reviews. The indexes cover
+    #per-day counts for a class and the history of one exercise, so both are answered from the index alone.
+    (3, "review log and daily review counts", (
+        '''CREATE TABLE IF NOT EXISTS reviews (
+               review_id INTEGER PRIMARY KEY,
+               class_id INTEGER NOT NULL,
+               chapter INTEGER NOT NULL,
+               unit INTEGER NOT NULL,
+               number INTEGER NOT NULL,
+               review_date TEXT NOT NULL,
+               stage INTEGER NOT NULL)''',
+        "CREATE INDEX IF NOT EXISTS reviews_class_day ON reviews (class_id, review_date, stage)",
+        "CREATE INDEX IF NOT EXISTS reviews_exercise ON reviews (class_id, chapter, unit, number, review_date, stage)",
+        '''CREATE TABLE IF NOT EXISTS review_daily_counts (
+               class_id INTEGER NOT NULL,
+               review_date TEXT NOT NULL,
+               stage INTEGER NOT NULL,
+               review_count INTEGER NOT NULL,
+               PRIMARY KEY (class_id, review_date, stage)) WITHOUT ROWID''',
+    )),
+    #Incremented by every update, so concurrent writers can detect that a row changed since they loaded it.
+    (4, "exercise row versions", (
+        "ALTER TABLE exercises ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+    )),
+    (5, "dates as day numbers", (
+        _dates_to_day_numbers,
+    )),
+    #Review schedule of each class as JSON, see src/scheduling.py. NULL means the default schedule.
+    (6, "class schedules", (
+        "ALTER TABLE classes ADD COLUMN schedule TEXT",
+    )),
+    #Full-text index of exercise names, keyed by the exercise's rowid, and an index on the "chapter.unit.number" string
+    #of each exercise for ID prefix searches. Database.save_exercises keeps the full-text index in step with the
+    #exercises table in the same transaction. It is not maintained by triggers, since FTS5 flushes its pending index
+    #at the savepoint every trigger statement runs in, which made bulk inserts about ten times slower.
+    #Rowids of the exercises table only change on VACUUM, after which Database.rebuild_search_index refills it.
+    (7, "exercise search", (
+        "CREATE VIRTUAL TABLE exercise_search USING fts5(name, class_id, prefix='2 3')",
+        "INSERT INTO exercise_search (rowid, name, class_id) SELECT rowid, name, class_id FROM exercises",
+        "CREATE INDEX exercises_id_string ON exercises (class_id, (chapter || '.' || unit || '.' || number))",
+    )),
+    #Number of exercises of each class due on each day at each stage. Triggers keep it current inside whatever
+    #transaction changes the exercises, so due counts across every class are read from a few summary rows.
+    #Rows are removed when their count drops to zero.
+    (8, "due summary", (
+        '''CREATE TABLE due_summary (
+               class_id INTEGER NOT NULL,
+               due_date DAY NOT NULL,
+               stage INTEGER NOT NULL,
+               due_count INTEGER NOT NULL,
+               PRIMARY KEY (class_id, due_date, stage)) WITHOUT ROWID''',
+        '''INSERT INTO due_summary
+           SELECT class_id, due_date, current_stage, COUNT(*) FROM exercises WHERE due_date IS NOT NULL
+           GROUP BY class_id, due_date, current_stage''',
+        '''CREATE TRIGGER exercises_due_insert AFTER INSERT ON exercises WHEN new.due_date IS NOT NULL BEGIN
+               INSERT INTO due_summary VALUES (new.class_id, new.due_date, new.current_stage, 1)
+               ON CONFLICT DO UPDATE SET due_count = due_count + 1;
+           END''',
+        '''CREATE TRIGGER exercises_due_delete AFTER DELETE ON exercises WHEN old.due_date IS NOT NULL BEGIN
+               UPDATE due_summary SET due_count = due_count - 1
+               WHERE class_id = old.class_id AND due_date = old.due_date AND stage = old.current_stage;
+               DELETE FROM due_summary
+               WHERE class_id = old.class_id AND due_date = old.due_date AND stage = old.current_stage AND due_count = 0;
+           END''',
+        '''CREATE TRIGGER exercises_due_update_old AFTER UPDATE OF class_id, current_stage, due_date ON exercises
+           WHEN old.due_date IS NOT NULL BEGIN
+               UPDATE due_summary SET due_count = due_count - 1
+               WHERE class_id = old.class_id AND due_date = old.due_date AND stage = old.current_stage;
+               DELETE FROM due_summary
+               WHERE class_id = old.class_id AND due_date = old.due_date AND stage = old.current_stage AND due_count = 0;
+           END''',
+        '''CREATE TRIGGER exercises_due_update_new AFTER UPDATE OF class_id, current_stage, due_date ON exercises
+           WHEN new.due_date IS NOT NULL BEGIN
+               INSERT INTO due_summary VALUES (new.class_id, new.due_date, new.current_stage, 1)
+               ON CONFLICT DO UPDATE SET due_count = due_count + 1;
+           END''',
+    )),
+    #Incremented by every write to a class, in the same transaction, so a saved snapshot of the class can tell whether
+    #it is still current with one lookup. See src/snapshot.py.
+    (9, "class change counts", (
+        "ALTER TABLE classes ADD COLUMN change_count INTEGER NOT NULL DEFAULT 0",
+    )),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target_version=LATEST_VERSION):
+    #Applies every pending migration up to target_version. Returns the versions applied.
+    #conn must be in autocommit mode. Each migration runs in its own IMMEDIATE transaction together with the
+    #user_version bump, so a failed migration leaves the database at the previous version and another process
+    #opening the same file at the same time waits and then finds the work already done.
+    version = get_version(conn)
+    if version > LATEST_VERSION:
+        raise sqlite3.DatabaseError(f"Database schema version {version} is newer than this program supports ({LATEST_VERSION})")
+    applied = []
+    for migration_version, _, steps in MIGRATIONS:
+        if migration_version <= version or migration_version > target_version:
+            continue
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if get_version(conn) < migration_version:
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(f"PRAGMA user_version = {migration_version}")
+                applied.append(migration_version)
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            cursor.execute("COMMIT")
+        finally:
+            cursor.close()
+    return applied
@@ -0,0 +1,49 @@
+import itertools
+
+#Column headings of exercise listings, matching the columns of BaseExercise.format_line.
+HEADER = f'{"Number":12}{"Name":50}{"Stage":7}{"Last":12}{"Due":12}'
+
+#Listings are formatted and written this many lines at a time, one write call per batch instead of one print per exercise.
+WRITE_BATCH_SIZE = 1000
+
+
+class LineCache:
+    #Formatted listing line of each exercise, kept until its stage or dates change. Entries remember the stage and
+    #dates they were formatted from and are checked against them when used, so a line is never shown stale
+    #however the exercise was changed.
+    def __init__(self) -> None:
+        self._lines = {}
+
+    def get_line(self, exercise):
+        stamp = (exercise.current_stage, exercise.last_review_date, exercise.due_date)
+        cached = self._lines.get(exercise)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        line = exercise.format_line()
+        self._lines[exercise] = (stamp, line)
+        return line
+
+    def discard(self, exercise):
+        self._lines.pop(exercise, None)
+
+    def __len__(self):
+        return len(self._lines)
+
+
+def _format_line(exercise):
+    return exercise.format_line()
+
+
+def iter_batches(items, batch_size):
+    #Yields lists of up to batch_size items from any iterable, without building the whole list.
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+def render_lines(exercises, line_cache=None, header=False):
+    #Returns the listing lines of the exercises as one string ready for a single write.
+    get_line = line_cache.get_line if line_cache is not None else _format_line
+    lines = [HEADER] if header else []
+    lines.extend(get_line(exercise) for exercise in exercises)
+    return "\n".join(lines) + "\n" if lines else ""
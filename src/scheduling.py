@@ -0,0 +1,102 @@
+import datetime
+import functools
+import json
+
+#Days until the next review for each stage an exercise advances into. Exercises advancing to RETIRED_STAGE leave rotation.
+DUE_DATE_MODIFIERS = {1:1, 2:3, 3:7, 4:14, 5:28}
+RETIRED_STAGE = 6
+
+#Problems to work for an exercise reviewed at each stage.
+PROBLEMS_PER_STAGE = {1:5, 2:3, 3:2, 4:1, 5:1}
+
+#SM-2 never lets the ease factor drop below this.
+MIN_EASE_FACTOR = 1.3
+
+
+class Schedule:
+    #A review schedule: the days until the next review for each stage, the problems worked at each stage and the
+    #terminal stage where exercises retire. Compiled once into tuples indexed by stage, so advancing an exercise,
+    #the batched and SQL advance paths, problem counts and forecasts are all plain tuple lookups.
+    __slots__ = ("spec", "terminal_stage", "next_intervals", "next_deltas", "problems", "review_offsets")
+
+    def __init__(self, intervals, problems, spec=None) -> None:
+        #intervals[k] is the days until the next review for an exercise advancing into stage k + 1, like DUE_DATE_MODIFIERS.
+        #problems[k] is the problems worked at stage k + 1. There is one of each per stage before the terminal stage.
+        #spec is the JSON text the schedule is stored as.
+        if not intervals or len(intervals) != len(problems):
+            raise ValueError("A schedule needs one interval and one problem count per stage")
+        if any(interval < 1 for interval in intervals) or any(count < 0 for count in problems):
+            raise ValueError("Intervals must be at least one day and problem counts cannot be negative")
+        self.spec = spec or json.dumps({"type": "fixed", "intervals": list(intervals), "problems": list(problems)})
+        self.terminal_stage = len(intervals) + 1
+        #Indexed by the stage an exercise is advanced from: days until its next review, or None when it retires.
+        self.next_intervals = tuple(intervals) + (None,)
+        self.next_deltas = tuple(None if days is None else datetime.timedelta(days=days) for days in self.next_intervals)
+        #Indexed by stage. Stage 0 and the terminal stage are not reviewed.
+        self.problems = (0,) + tuple(problems) + (0,)
+        self.review_offsets = self._build_review_offsets()
+
+    def _build_review_offsets(self):
+        #For an exercise due at stage s, the (days after that due date, stage) of each review it has left before retiring,
+        #assuming every review is done on its due date. Lets forecasts project an exercise without simulating it day by day.
+        offsets = [()]
+        for stage in range(1, self.terminal_stage):
+            day = 0
+            reviews = []
+            for review_stage in range(stage, self.terminal_stage):
+                reviews.append((day, review_stage))
+                if self.next_intervals[review_stage] is not None:
+                    day += self.next_intervals[review_stage]
+            offsets.append(tuple(reviews))
+        offsets.append(())
+        return tuple(offsets)
+
+    def describe(self):
+        days = "/".join(str(days) for days in self.next_intervals[1:-1])
+        return f"reviews after {days} days, retired at stage {self.terminal_stage}"
+
+    def __repr__(self):
+        return f"Schedule({self.spec})"
+
+
+def fixed_schedule(intervals, problems):
+    return Schedule(intervals, problems)
+
+
+def sm2_schedule(ease_factor=2.5, problems=(5, 3, 2, 1, 1)):
+    #SM-2 style intervals: one day after the first review, six after the second, then each interval is the previous one
+    #times the ease factor. Reviews here are not graded, so the ease factor is set per class rather than adjusted
+    #per exercise. The first interval is never used, since started exercises are due on their start date.
+    if ease_factor < MIN_EASE_FACTOR:
+        raise ValueError(f"The ease factor must be at least {MIN_EASE_FACTOR}")
+    intervals = [1]
+    for stage in range(2, len(problems) + 1):
+        if stage == 2:
+            intervals.append(1)
+        elif stage == 3:
+            intervals.append(6)
+        else:
+            intervals.append(round(intervals[-1] * ease_factor))
+    spec = json.dumps({"type": "sm2", "ease_factor": ease_factor, "problems": list(problems)})
+    return Schedule(intervals, problems, spec)
+
+
+DEFAULT_SCHEDULE = fixed_schedule([DUE_DATE_MODIFIERS[stage] for stage in range(1, RETIRED_STAGE)],
+                                  [PROBLEMS_PER_STAGE[stage] for stage in range(1, RETIRED_STAGE)])
+
+
+@functools.lru_cache(maxsize=64)
+def from_spec(spec):
+    #Returns the compiled schedule for a stored spec, or the default schedule for None.
+    #Cached, so every class with the same schedule shares one compiled copy.
+    if spec is None:
+        return DEFAULT_SCHEDULE
+    try:
+        values = json.loads(spec)
+        if values["type"] == "fixed":
+            return Schedule(values["intervals"], values["problems"], spec)
+        if values["type"] == "sm2":
+            return sm2_schedule(values["ease_factor"], values["problems"])
+    except (KeyError, TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid schedule {spec}") from e
+    raise ValueError(f"Unknown schedule type in {spec}")
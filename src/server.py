@@ -0,0 +1,284 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import datetime
+import json
+import threading
+import urllib.parse
+
+import src.database as database
+import src.math_class as math_class
+
+#Local read-only HTTP service for dashboards and worksheet printers. Loaded classes and rendered responses are cached,
+#so repeated reads never touch SQLite. Run as: python -m src.server [--db PATH] [--port PORT]
+#
+#  GET /classes                          class IDs and names
+#  GET /classes/<id>/due[?date=YYYY-MM-DD] exercises due on or before the date, default today
+#  GET /classes/<id>/status              exercise, stage 0 and due today counts
+#  GET /classes/<id>/histogram           exercises per stage
+
+MAX_REQUEST_LINE = 8192
+MAX_HEADERS = 100
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class CachedClass:
+    #A loaded class and the responses already rendered from it. The lock keeps renders from different threads apart.
+    def __init__(self, current_class) -> None:
+        self.math_class = current_class
+        self.responses = {}
+        self.lock = threading.Lock()
+
+
+class ClassCache:
+    #LRU cache of loaded classes. Entries are dropped when this process writes a class, through the database's
+    #write listeners, and everything is dropped when PRAGMA data_version shows another connection committed.
+    def __init__(self, db_path=database.DEFAULT_DB_PATH, capacity=64) -> None:
+        self.db_path = db_path
+        self.capacity = capacity
+        self.db = database.get_database(db_path)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._classes = None
+        #Bumped by every invalidation, so a load that started before one is not cached after it.
+        self._generation = 0
+        self.db.add_write_listener(self.invalidate)
+
+    def close(self):
+        self.db.remove_write_listener(self.invalidate)
+
+    def invalidate(self, class_ids=None):
+        #Drops the given classes, or everything when class_ids is None. The class list is always refreshed.
+        with self._lock:
+            self._generation += 1
+            self._classes = None
+            if class_ids is None:
+                self._entries.clear()
+            else:
+                for class_id in class_ids:
+                    self._entries.pop(class_id, None)
+
+    def check_data_version(self):
+        #Cheap PRAGMA on the caller's connection. Must always be called from the same thread to be meaningful.
+        version = self.db.data_version()
+        if version != self._data_version:
+            if self._data_version is not None:
+                self.invalidate()
+            self._data_version = version
+
+    def get_classes(self):
+        with self._lock:
+            classes = self._classes
+            generation = self._generation
+        if classes is None:
+            classes = dict(self.db.get_classes())
+            with self._lock:
+                if generation == self._generation:
+                    self._classes = classes
+        return classes
+
+    def get(self, class_id):
+        #Returns the cached entry for a class, loading it on a miss. Blocking, so run it on a worker thread.
+        #A class invalidated while it loads may have been read from before the write, so it is returned uncached.
+        with self._lock:
+            entry = self._entries.get(class_id)
+            if entry is not None:
+                self._entries.move_to_end(class_id)
+                return entry
+            generation = self._generation
+        classes = self.get_classes()
+        if class_id not in classes:
+            raise HTTPError(404, f"class {class_id} not found")
+        current_class = math_class.MathClass(class_id, classes[class_id])
+        current_class.load_exercises_from_database(self.db_path, lazy=True)
+        entry = CachedClass(current_class)
+        with self._lock:
+            if generation != self._generation:
+                return entry
+            entry = self._entries.setdefault(class_id, entry)
+            self._entries.move_to_end(class_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return entry
+
+    def peek_response(self, class_id, response_key):
+        #Returns an already rendered response without blocking, or None.
+        with self._lock:
+            entry = self._entries.get(class_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(class_id)
+            return entry.responses.get(response_key)
+
+
+def _render_due(current_class, due_date):
+    due_exercises = current_class.get_due_exercises(due_date)
+    current_class.load_exercise_details(due_exercises)
+    return {"class_id": current_class.class_id, "date": due_date.isoformat(),
+            "exercises": [{"id": exercise.get_exercise_id_string(), "name": exercise.name, "web_link": exercise.web_link,
+                           "stage": exercise.current_stage, "problems": exercise.get_num_of_exercises(),
+                           "due_date": exercise.due_date.isoformat()} for exercise in due_exercises]}
+
+
+def _render_status(current_class, today):
+    histogram = current_class.get_stage_histogram()
+    return {"class_id": current_class.class_id, "class_name": current_class.class_name,
+            "exercises": len(current_class.exercises), "not_started": histogram[0],
+            "retired": histogram[current_class.schedule.terminal_stage], "due": current_class.count_reviews_to_advance(today)}
+
+
+def _render_histogram(current_class, today):
+    return {"class_id": current_class.class_id, "stages": current_class.get_stage_histogram()}
+
+
+RENDERERS = {"due": _render_due, "status": _render_status, "histogram": _render_histogram}
+
+
+class ReviewServer:
+    def __init__(self, db_path=database.DEFAULT_DB_PATH, cache_size=64, workers=4) -> None:
+        self.cache = ClassCache(db_path, cache_size)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="smr-db")
+        #data_version only reports commits by other connections, so it is always read on this one thread's connection.
+        self.version_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="smr-version")
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=8765):
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+        self.version_executor.shutdown(wait=True)
+        self.cache.close()
+
+    async def _run_blocking(self, function, *args, executor=None):
+        return await asyncio.get_running_loop().run_in_executor(executor or self.executor, function, *args)
+
+    async def _handle_connection(self, reader, writer):
+        #Serves requests on one connection until the client closes it or asks not to keep it alive.
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, keep_alive = request
+                try:
+                    status, body = await self.handle(method, target)
+                except HTTPError as e:
+                    status, body = e.status, json.dumps({"error": e.message}).encode()
+                except Exception as e:
+                    status, body = 500, json.dumps({"error": f"{type(e).__name__}: {e}"}).encode()
+                self._write_response(writer, status, body, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        if len(request_line) > MAX_REQUEST_LINE:
+            raise ConnectionError("request line too long")
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise ConnectionError("malformed request line")
+        method, target, version = parts
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+        if int(headers.get("content-length", "0") or 0):
+            await reader.readexactly(int(headers["content-length"]))
+        connection = headers.get("connection", "")
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        return method, target, keep_alive
+
+    def _write_response(self, writer, status, body, keep_alive):
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}.get(status, "Error")
+        head = (f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+
+    async def handle(self, method, target):
+        #Routes one request. Returns (status, JSON body bytes).
+        if method != "GET":
+            raise HTTPError(405, "only GET is supported")
+        url = urllib.parse.urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        await self._run_blocking(self.cache.check_data_version, executor=self.version_executor)
+
+        if parts == ["classes"]:
+            classes = await self._run_blocking(self.cache.get_classes)
+            return 200, json.dumps([{"class_id": class_id, "class_name": name} for class_id, name in classes.items()]).encode()
+
+        if len(parts) != 3 or parts[0] != "classes" or parts[2] not in RENDERERS or not parts[1].isdigit():
+            raise HTTPError(404, "not found")
+        class_id, view = int(parts[1]), parts[2]
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            day = math_class.parse_date_string(query["date"][0]) if "date" in query else datetime.datetime.today().date()
+        except ValueError as e:
+            raise HTTPError(400, str(e)) from e
+
+        response_key = (view, day)
+        body = self.cache.peek_response(class_id, response_key)
+        if body is None:
+            body = await self._run_blocking(self._render, class_id, response_key)
+        return 200, body
+
+    def _render(self, class_id, response_key):
+        entry = self.cache.get(class_id)
+        with entry.lock:
+            body = entry.responses.get(response_key)
+            if body is None:
+                view, day = response_key
+                body = json.dumps(RENDERERS[view](entry.math_class, day)).encode()
+                entry.responses[response_key] = body
+        return body
+
+
+async def serve(db_path, host, port, cache_size, workers):
+    review_server = ReviewServer(db_path, cache_size, workers)
+    server = await review_server.start(host, port)
+    print(f"Serving {db_path} on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await review_server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.server", description="Serve due lists and class status over HTTP.")
+    parser.add_argument("--db", default=database.DEFAULT_DB_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-size", type=int, default=64, help="classes kept loaded (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=4, help="threads for SQLite work (default: %(default)s)")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.cache_size, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import array
+import contextlib
+import gc
+import os
+import pickle
+import sys
+
+import src.database as database
+import src.instrumentation as instrumentation
+import src.math_class as math_class
+import src.migrations as migrations
+import src.scheduling as scheduling
+
+#Warm start for large classes. A snapshot holds a class's exercises as saved in the database, as typed arrays and
+#lists, pickled to a file next to the database. It records the class's change count from when it was taken, so
+#opening the class checks it with one lookup. A stale snapshot is brought up to date by reading only the rows that
+#were added or changed since, then saved again.
+
+#Bumped whenever the snapshot layout changes, so snapshots written by other versions are rebuilt instead of misread.
+SNAPSHOT_FORMAT = 1
+
+#Day numbers start at 1, so 0 marks a missing date, as in ExerciseTable.
+_NO_DAY = 0
+
+
+def get_snapshot_path(class_id, db_path=database.DEFAULT_DB_PATH):
+    return os.path.join(f"{db_path}.snapshots", f"class-{class_id}.pickle")
+
+
+@contextlib.contextmanager
+def _collection_paused():
+    #Restoring a class creates an object per exercise and frees nothing cyclic, so the collections the allocations
+    #trigger only rescan the growing heap. Pausing them halves the time to open a large class.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _intern(value):
+    #Links and names repeat across a catalog. Sharing one string object also lets pickle write it only once.
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+class ClassSnapshot:
+    #The exercises of one class as of change_count, in (chapter, unit, number) order. Rows are identified by their
+    #rowid in the exercises table, so an exercise deleted and added again is picked up as a change.
+    def __init__(self, class_id, change_count, spec, rows) -> None:
+        #rows are database.SNAPSHOT_COLUMNS rows in (chapter, unit, number) order.
+        self.class_id = class_id
+        self.change_count = change_count
+        self.spec = spec
+        self._set_rows(rows)
+
+    def _set_rows(self, rows):
+        #Rows are turned into columns in one transpose rather than appended one value at a time.
+        rowids, chapters, units, numbers, names, web_links, stages, last_review_days, due_days, versions = \
+            zip(*rows) if rows else [()] * 10
+        self.rowids = array.array('q', rowids)
+        self.chapters = array.array('i', chapters)
+        self.units = array.array('i', units)
+        self.numbers = array.array('i', numbers)
+        self.stages = array.array('b', stages)
+        self.last_review_days = array.array('i', [day or _NO_DAY for day in last_review_days])
+        self.due_days = array.array('i', [day or _NO_DAY for day in due_days])
+        self.versions = array.array('q', versions)
+        self.names = [_intern(name) for name in names]
+        self.web_links = [_intern(web_link) for web_link in web_links]
+
+    def __len__(self):
+        return len(self.rowids)
+
+    def iter_rows(self):
+        #Yields rows like database.SNAPSHOT_COLUMNS, with None for missing dates.
+        for rowid, chapter, unit, number, name, web_link, stage, last_review_day, due_day, version in zip(
+                self.rowids, self.chapters, self.units, self.numbers, self.names, self.web_links, self.stages,
+                self.last_review_days, self.due_days, self.versions):
+            yield (rowid, chapter, unit, number, name, web_link, stage, last_review_day or None, due_day or None, version)
+
+    def get_row_stamps(self):
+        #{rowid: (chapter, unit, number, version)}, what Database.load_snapshot_rows compares the saved rows against.
+        return {rowid: (chapter, unit, number, version) for rowid, chapter, unit, number, version
+                in zip(self.rowids, self.chapters, self.units, self.numbers, self.versions)}
+
+    def apply_changes(self, change_count, spec, rows, gone):
+        #Brings the snapshot up to change_count from the rows added or changed since and the rowids deleted since,
+        #as returned by Database.load_snapshot_rows. Changed rows are overwritten in place. Additions, deletions and rows
+        #whose rowid now holds another exercise rebuild the columns.
+        self.change_count = change_count
+        self.spec = spec
+        positions = {rowid: position for position, rowid in enumerate(self.rowids)}
+        gone = set(gone)
+        added = []
+        for row in rows:
+            position = positions.get(row[0])
+            if position is not None and (self.chapters[position], self.units[position], self.numbers[position]) != row[1:4]:
+                gone.add(row[0])
+                position = None
+            if position is None:
+                added.append(row)
+                continue
+            self.names[position] = _intern(row[4])
+            self.web_links[position] = _intern(row[5])
+            self.stages[position] = row[6]
+            self.last_review_days[position] = row[7] or _NO_DAY
+            self.due_days[position] = row[8] or _NO_DAY
+            self.versions[position] = row[9]
+        if added or gone:
+            kept = [row for row in self.iter_rows() if row[0] not in gone]
+            self._set_rows(sorted(kept + added, key=lambda row: row[1:4]))
+
+    def to_class(self, class_name, storage="table"):
+        #Builds a MathClass holding the snapshot's exercises, all clean, with the class's schedule. Table storage takes
+        #the columns as they are, and its indexes are built from the columns rather than from each row.
+        current_class = math_class.MathClass(self.class_id, class_name, storage, scheduling.from_spec(self.spec))
+        if storage == "table":
+            exercises = current_class.table.load_columns(self.chapters, self.units, self.numbers, self.class_id, self.stages,
+                                                         self.last_review_days, self.due_days, self.versions,
+                                                         self.names, self.web_links)
+            current_class._attach_clean_exercises(exercises, list(zip(self.chapters, self.units, self.numbers)),
+                                                  self.stages, self.due_days)
+            return current_class
+        exercises = []
+        for _, chapter, unit, number, name, web_link, stage, last_review_day, due_day, version in self.iter_rows():
+            exercise = math_class.Exercise(chapter, unit, number, name, web_link, self.class_id, stage, last_review_day,
+                                           due_day, version)
+            exercise.mark_clean()
+            exercises.append(exercise)
+        current_class._attach_clean_exercises(exercises)
+        return current_class
+
+    def save(self, path):
+        #Writes the snapshot to a temporary file and renames it over the old one, so readers never see half a snapshot.
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        state = {"format": SNAPSHOT_FORMAT, "schema_version": migrations.LATEST_VERSION, "class_id": self.class_id,
+                 "change_count": self.change_count, "spec": self.spec,
+                 "columns": (self.rowids, self.chapters, self.units, self.numbers, self.stages, self.last_review_days,
+                             self.due_days, self.versions, self.names, self.web_links)}
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path, class_id):
+        #Returns the snapshot saved at path, or None if there is none or it was written for another class or by
+        #another version of the program.
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return None
+        if (not isinstance(state, dict) or state.get("format") != SNAPSHOT_FORMAT
+                or state.get("schema_version") != migrations.LATEST_VERSION or state.get("class_id") != class_id):
+            return None
+        snapshot = cls.__new__(cls)
+        snapshot.class_id = class_id
+        snapshot.change_count = state["change_count"]
+        snapshot.spec = state["spec"]
+        (snapshot.rowids, snapshot.chapters, snapshot.units, snapshot.numbers, snapshot.stages, snapshot.last_review_days,
+         snapshot.due_days, snapshot.versions, snapshot.names, snapshot.web_links) = state["columns"]
+        return snapshot
+
+
+def _save_if_possible(snapshot, path):
+    #A snapshot that cannot be written, say on a read-only share, only costs the next start a full load.
+    try:
+        snapshot.save(path)
+    except OSError as e:
+        print(f"Could not save the class snapshot: {e}")
+
+
+@instrumentation.instrumented("snapshot.load_class")
+def load_class(class_id, class_name, db_path=database.DEFAULT_DB_PATH, storage="table"):
+    #Opens a class from its snapshot when the snapshot is current, which skips reading and converting every row.
+    #A stale snapshot is updated from just the rows changed since it was taken, and a missing or unreadable one is
+    #built from a full read. Either way the snapshot is saved again for the next start.
+    #The snapshot file is only a cache. Deleting it costs one full load.
+    db = database.get_database(db_path)
+    path = get_snapshot_path(class_id, db_path)
+    with _collection_paused():
+        snapshot = ClassSnapshot.load(path, class_id)
+        if snapshot is not None and snapshot.change_count == db.get_change_count(class_id):
+            instrumentation.increment("snapshot_hits")
+        elif snapshot is not None:
+            instrumentation.increment("snapshot_refreshes")
+            snapshot.apply_changes(*db.load_snapshot_rows(class_id, snapshot.get_row_stamps()))
+            _save_if_possible(snapshot, path)
+        else:
+            instrumentation.increment("snapshot_rebuilds")
+            change_count, spec, rows, _ = db.load_snapshot_rows(class_id)
+            snapshot = ClassSnapshot(class_id, change_count, spec, rows)
+            _save_if_possible(snapshot, path)
+        current_class = snapshot.to_class(class_name, storage)
+    current_class._details_db_path = db_path
+    instrumentation.add_rows(len(snapshot))
+    return current_class
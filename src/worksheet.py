@@ -0,0 +1,127 @@
+import concurrent.futures
+import datetime
+import functools
+import html
+import os
+import string
+
+import src.database as database
+import src.math_class as math_class
+import src.scheduling as scheduling
+
+FILE_EXTENSIONS = {"text": "txt", "html": "html", "markdown": "md"}
+
+#Each format is a header, one item per due exercise and a footer. Values are escaped for the format before substitution.
+_TEMPLATE_SOURCES = {
+    "text": (
+        "Worksheet for $class_name\nReview date: $review_date\n\n",
+        "$exercise_id  $name\n    Stage $stage: $problems problems  $web_link\n",
+        "\n$exercise_count exercises, $problem_total problems in total.\n",
+    ),
+    "html": (
+        "<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Worksheet for $class_name</title></head><body>\n"
+        "<h1>Worksheet for $class_name</h1>\n<p>Review date: $review_date</p>\n"
+        "<table>\n<tr><th>Number</th><th>Name</th><th>Stage</th><th>Problems</th><th>Link</th></tr>\n",
+        "<tr><td>$exercise_id</td><td>$name</td><td>$stage</td><td>$problems</td><td><a href=\"$web_link\">$web_link</a></td></tr>\n",
+        "</table>\n<p>$exercise_count exercises, $problem_total problems in total.</p>\n</body></html>\n",
+    ),
+    "markdown": (
+        "# Worksheet for $class_name\n\nReview date: $review_date\n\n"
+        "| Number | Name | Stage | Problems | Link |\n| --- | --- | --- | --- | --- |\n",
+        "| $exercise_id | $name | $stage | $problems | $web_link |\n",
+        "\n$exercise_count exercises, $problem_total problems in total.\n",
+    ),
+}
+
+_ESCAPES = {
+    "text": str,
+    "html": functools.partial(html.escape, quote=True),
+    "markdown": lambda value: value.replace("|", "\\|").replace("\n", " "),
+}
+
+#Items are written in batches so large worksheets stream to the file without building the whole document in memory.
+WRITE_BATCH_SIZE = 500
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(file_format):
+    #Returns the compiled (header, item, footer) templates and the escape function for a format.
+    if file_format not in _TEMPLATE_SOURCES:
+        raise ValueError(f"Unknown worksheet format {file_format}, expected one of {', '.join(_TEMPLATE_SOURCES)}")
+    header, item, footer = (string.Template(source) for source in _TEMPLATE_SOURCES[file_format])
+    return header, item, footer, _ESCAPES[file_format]
+
+
+def write_worksheet(out, class_name, exercises, review_date, file_format="text", problems_per_stage=None):
+    #Writes a worksheet for the due exercises to an open text file. Returns (exercise count, problem total).
+    #Problems per exercise come from the exercise's stage, as given by Exercise.get_num_of_exercises, or by
+    #problems_per_stage, a schedule's problems, for exercises not attached to their class.
+    header, item, footer, escape = get_template(file_format)
+    out.write(header.substitute(class_name=escape(class_name), review_date=review_date.isoformat()))
+
+    exercise_count = 0
+    problem_total = 0
+    batch = []
+    for exercise in exercises:
+        if problems_per_stage is None:
+            problems = exercise.get_num_of_exercises()
+        else:
+            problems = problems_per_stage[exercise.current_stage]
+        exercise_count += 1
+        problem_total += problems
+        batch.append(item.substitute(exercise_id=exercise.get_exercise_id_string(), name=escape(exercise.name or ""),
+                                     stage=exercise.current_stage, problems=problems, web_link=escape(exercise.web_link or "")))
+        if len(batch) >= WRITE_BATCH_SIZE:
+            out.writelines(batch)
+            batch = []
+    out.writelines(batch)
+
+    out.write(footer.substitute(exercise_count=exercise_count, problem_total=problem_total))
+    return exercise_count, problem_total
+
+
+def default_worksheet_path(class_id, review_date, file_format="text", out_dir="."):
+    return os.path.join(out_dir, f"worksheet-{class_id}-{review_date.isoformat()}.{FILE_EXTENSIONS[file_format]}")
+
+
+def generate_worksheet(current_class, path=None, file_format="text", review_date=None):
+    #Writes the worksheet for the exercises due in a loaded class to a file. Returns (path, exercise count, problem total).
+    if review_date is None:
+        review_date = datetime.datetime.today().date()
+    if path is None:
+        path = default_worksheet_path(current_class.class_id, review_date, file_format)
+    due_exercises = current_class.get_due_exercises(review_date)
+    current_class.load_exercise_details(due_exercises)
+    with open(path, "w", encoding="utf-8") as out:
+        exercise_count, problem_total = write_worksheet(out, current_class.class_name, due_exercises, review_date, file_format)
+    return path, exercise_count, problem_total
+
+
+def _generate_class_worksheet(job):
+    #Process pool worker. Reads only the due rows of one class through the (class_id, due_date) index.
+    #The exercises are not attached to a class, so problem counts come from the class's stored schedule.
+    class_id, class_name, out_dir, file_format, review_date, db_path = job
+    db = database.get_database(db_path)
+    schedule = scheduling.from_spec(db.get_class_schedules([class_id])[class_id])
+    rows = db.load_due_exercises(class_id, review_date)
+    exercises = (math_class.Exercise(*row) for row in rows)
+    path = default_worksheet_path(class_id, review_date, file_format, out_dir)
+    with open(path, "w", encoding="utf-8") as out:
+        exercise_count, problem_total = write_worksheet(out, class_name, exercises, review_date, file_format,
+                                                        schedule.problems)
+    return class_id, path, exercise_count, problem_total
+
+
+def generate_all_worksheets(out_dir, file_format="text", review_date=None, db_path=database.DEFAULT_DB_PATH, processes=None):
+    #Writes a worksheet for every class in the database, spreading the classes across a process pool.
+    #Returns a list of (class_id, path, exercise count, problem total), one per class.
+    if review_date is None:
+        review_date = datetime.datetime.today().date()
+    get_template(file_format)
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(class_id, class_name, out_dir, file_format, review_date, db_path)
+            for class_id, class_name in database.get_database(db_path).get_classes()]
+    if processes == 1 or len(jobs) <= 1:
+        return [_generate_class_worksheet(job) for job in jobs]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_generate_class_worksheet, jobs, chunksize=max(1, len(jobs) // (4 * (processes or os.cpu_count() or 1)))))
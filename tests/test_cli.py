@@ -0,0 +1,155 @@
+import datetime
+import io
+import json
+
+import pytest
+
+import src.database as database
+from src.cli import main
+from src.math_class import MathClass, Exercise
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = (tmp_path / "cli.db").as_posix()
+    db = database.get_database(path)
+    for class_name in ["Algebra", "Geometry"]:
+        class_id = db.create_class(class_name)
+        math_class = MathClass(class_id, class_name)
+        math_class.attach_exercise(Exercise(1, 1, 1, "Due", "http://a", class_id, 2, "2023-01-01", "2023-01-04"))
+        math_class.attach_exercise(Exercise(1, 1, 2, "Later", "", class_id, 1, None, "2023-01-09"))
+        math_class.add_exercise(1, 2, 1, "New A", "")
+        math_class.add_exercise(1, 2, 2, "New B", "")
+        math_class.save_to_db(path)
+    return path
+
+
+def run(*argv):
+    out = io.StringIO()
+    assert main(list(argv), out) == 0
+    return out.getvalue()
+
+
+def test_due_and_status_json(db_path):
+    due = json.loads(run("--db", db_path, "--json", "due", "--all", "--date", "2023-01-05"))
+    assert [(r["class_id"], [e["id"] for e in r["exercises"]]) for r in due] == [(1, ["1.1.1"]), (2, ["1.1.1"])]
+    assert due[0]["exercises"][0]["name"] == "Due"
+
+    status = json.loads(run("--db", db_path, "--json", "status", "2", "--date", "2023-01-05"))
+    assert status == [{"class_id": 2, "class_name": "Geometry", "exercises": 4, "due": 1,
+                       "stages": {"0": 2, "1": 1, "2": 1, "3": 0, "4": 0, "5": 0, "6": 0}}]
+
+
+def test_advance_start_next_and_delete(db_path):
+    advanced = json.loads(run("--db", db_path, "--json", "advance", "1", "2", "--date", "2023-01-05"))
+    assert advanced == [{"class_id": 1, "advanced": 1}, {"class_id": 2, "advanced": 1}]
+
+    started = json.loads(run("--db", db_path, "--json", "start-next", "--all", "-n", "5", "--date", "2023-01-05"))
+    assert started[0] == {"class_id": 1, "started": ["1.2.1", "1.2.2"], "remaining_stage_0": 0}
+
+    assert "Exercise 1.1.2 deleted." in run("--db", db_path, "delete", "1", "1.1.2", "9.9.9")
+
+    math_class = MathClass(1, "Algebra")
+    math_class.load_exercises_from_database(db_path)
+    assert [(e.get_exercise_id_string(), e.current_stage, e.due_date) for e in math_class.exercises] == [
+        ("1.1.1", 3, datetime.date(2023, 1, 12)), ("1.2.1", 1, datetime.date(2023, 1, 5)), ("1.2.2", 1, datetime.date(2023, 1, 5))]
+
+
+def test_import(db_path, tmp_path):
+    csv_path = tmp_path / "more.csv"
+    csv_path.write_text("chapter,unit,number,name\n2,1,1,Imported\n1,1,1,Duplicate\n")
+    result = json.loads(run("--db", db_path, "--json", "import", "2", csv_path.as_posix()))
+    assert (result["imported"], result["rejected"]) == (1, 1)
+
+
+def test_unknown_class_is_an_error(db_path):
+    with pytest.raises(SystemExit):
+        main(["--db", db_path, "status", "42"], io.StringIO())
+
+
+def test_start_next_rejects_a_count_below_one(db_path):
+    with pytest.raises(SystemExit):
+        main(["--db", db_path, "start-next", "1", "-n", "-1"], io.StringIO())
+    math_class = MathClass(1, "Algebra")
+    math_class.load_exercises_from_database(db_path)
+    with pytest.raises(ValueError):
+        math_class.start_next_exercises(-1, datetime.date(2023, 1, 5), db_path)
+    assert math_class.get_stage_histogram()[0] == 2
+
+
+def test_forecast_and_auto_start(db_path):
+    forecast = json.loads(run("--db", db_path, "--json", "forecast", "1", "--days", "5", "--date", "2023-01-04"))
+    assert [(day["reviews"], day["problems"]) for day in forecast[0]["days"]] == [(1, 3), (0, 0), (0, 0), (0, 0), (0, 0)]
+
+    started = json.loads(run("--db", db_path, "--json", "auto-start", "1", "--budget", "8", "--days", "5", "--date", "2023-01-04"))
+    assert started == [{"class_id": 1, "started": ["1.2.1"], "remaining_stage_0": 1}]
+
+    with pytest.raises(SystemExit):
+        main(["--db", db_path, "auto-start", "1", "--budget", "1", "--days", "0"], io.StringIO())
+
+
+def test_reviews_and_compact_reviews(db_path):
+    run("--db", db_path, "advance", "--all", "--date", "2023-01-05")
+    reviews = json.loads(run("--db", db_path, "--json", "reviews", "1", "--days", "30", "--date", "2023-01-10"))
+    assert reviews[0]["days"] == [{"date": "2023-01-05", "reviews": 1, "stages": {"2": 1}}]
+
+    compacted = json.loads(run("--db", db_path, "--json", "compact-reviews", "--keep-days", "1", "--date", "2023-01-10"))
+    assert compacted == {"before": "2023-01-09", "compacted": 2}
+    assert json.loads(run("--db", db_path, "--json", "reviews", "1", "--days", "30", "--date", "2023-01-10")) == reviews
+
+
+def test_schedule(db_path):
+    shown = json.loads(run("--db", db_path, "--json", "schedule", "1"))
+    assert (shown["intervals"], shown["problems"], shown["terminal_stage"]) == ([3, 7, 14, 28], [5, 3, 2, 1, 1], 6)
+
+    changed = json.loads(run("--db", db_path, "--json", "schedule", "1", "--sm2", "2.0"))
+    assert changed["intervals"] == [1, 6, 12, 24] and changed["spec"]["type"] == "sm2"
+    assert json.loads(run("--db", db_path, "--json", "schedule", "1"))["intervals"] == [1, 6, 12, 24]
+    assert json.loads(run("--db", db_path, "--json", "schedule", "1", "--default"))["intervals"] == [3, 7, 14, 28]
+
+
+def test_schedule_change_saves_retired_exercises(db_path):
+    math_class = MathClass(1, "Algebra")
+    math_class.load_exercises_from_database(db_path)
+    for number in range(1, 4):
+        math_class.attach_exercise(Exercise(3, 1, number, "Retired", "", 1, 6, "2023-01-01", None))
+    math_class.save_to_db(db_path)
+
+    run("--db", db_path, "schedule", "1", "--intervals", "1", "2", "4", "--problems", "3", "2", "1")
+    status = json.loads(run("--db", db_path, "--json", "status", "1", "--date", "2023-01-05"))
+    assert (status[0]["stages"]["4"], status[0]["stages"]["6"]) == (3, 0)
+    reloaded = MathClass(1, "Algebra")
+    reloaded.load_exercises_from_database(db_path)
+    assert reloaded.get_stage_histogram()[4] == 3
+
+    status = json.loads(run("--db", db_path, "--json", "status", "1", "--stage", "0", "1", "--limit", "2", "--page", "2"))
+    listing = status[0]["listing"]
+    assert (listing["matching"], listing["offset"]) == (3, 2)
+    assert [e["id"] for e in listing["exercises"]] == ["1.2.2"]
+
+    text = run("--db", db_path, "status", "1", "--list", "--chapter", "1", "--limit", "1")
+    assert "Page 1: exercises 1-1 of 4 matching" in text
+    assert "1.1.1       Due" in text and "1.1.2" not in text
+
+
+def test_search(db_path):
+    found = json.loads(run("--db", db_path, "--json", "search", "2", "new", "b"))
+    assert [e["id"] for e in found["exercises"]] == ["1.2.2"]
+    assert "1.1.1       Due" in run("--db", db_path, "search", "1", "1.1")
+
+
+def test_dashboard_follows_every_kind_of_write(db_path):
+    def dashboard():
+        return [(r["class_id"], r["due"], r["problems"], r["stages"])
+                for r in json.loads(run("--db", db_path, "--json", "dashboard", "--date", "2023-01-05"))]
+
+    assert dashboard() == [(1, 1, 3, {"2": 1}), (2, 1, 3, {"2": 1})]
+    run("--db", db_path, "advance", "1", "--date", "2023-01-05")
+    run("--db", db_path, "start-next", "2", "--date", "2023-01-05")
+    run("--db", db_path, "delete", "2", "1.1.1")
+    run("--db", db_path, "schedule", "2", "--intervals", "1", "1", "1", "1", "1", "--problems", "9", "1", "1", "1", "1")
+    assert dashboard() == [(1, 0, 0, {}), (2, 1, 9, {"1": 1})]
+    # The summary matches counting the exercises directly
+    db = database.get_database(db_path)
+    assert db.execute("SELECT COUNT(*) FROM exercises WHERE due_date IS NOT NULL").fetchone()[0] == \
+        db.execute("SELECT SUM(due_count) FROM due_summary").fetchone()[0]
@@ -0,0 +1,114 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from src.database import Database, get_database
+
+
+def test_connection_is_reused_and_configured(tmp_path):
+    db = Database((tmp_path / "repo.db").as_posix())
+    conn = db.connection
+    assert db.connection is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    db.close()
+
+
+def test_each_thread_gets_its_own_connection(tmp_path):
+    db = Database((tmp_path / "threads.db").as_posix())
+    class_id = db.create_class("Algebra")
+    seen = []
+
+    def worker():
+        seen.append((db.connection, db.get_classes()))
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert seen[0][0] is not db.connection
+    assert seen[0][1] == [(class_id, "Algebra")]
+    db.close()
+
+
+def test_get_database_shares_one_repository_per_path(tmp_path):
+    path = (tmp_path / "shared.db").as_posix()
+    assert get_database(path) is get_database(path)
+    assert get_database(tmp_path / "shared.db") is get_database(path)
+
+
+def test_failed_transaction_rolls_back(tmp_path):
+    db = Database((tmp_path / "rollback.db").as_posix())
+    try:
+        with db.transaction() as cursor:
+            cursor.execute("INSERT INTO classes (class_name) VALUES ('Geometry')")
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+    assert db.get_classes() == []
+    db.close()
+
+
+def test_write_transaction_retries_when_locked(tmp_path, monkeypatch):
+    db = Database((tmp_path / "locked.db").as_posix())
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    attempts = []
+
+    def write(cursor):
+        attempts.append(cursor.execute("INSERT INTO classes (class_name) VALUES ('Algebra')").lastrowid)
+        if len(attempts) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        return attempts[-1]
+
+    assert db.write_transaction(write) == 1
+    assert db.get_classes() == [(1, "Algebra")]
+
+    def broken(cursor):
+        raise sqlite3.OperationalError("no such table: missing")
+
+    with pytest.raises(sqlite3.OperationalError):
+        db.write_transaction(broken)
+    db.close()
+
+
+def test_search_index_follows_saves_and_deletes(tmp_path):
+    from src.math_class import MathClass
+    path = (tmp_path / "search.db").as_posix()
+    db = get_database(path)
+    class_id = db.create_class("Algebra")
+    other_id = db.create_class("Geometry")
+    math_class = MathClass(class_id, "Algebra")
+    for number, name in enumerate(["Adding fractions", "Fraction word problems", "Long division"], start=1):
+        math_class.add_exercise(3, 1, number, name, "")
+    math_class.add_exercise(3, 12, 1, "Decimals", "")
+    math_class.add_exercise(13, 1, 1, "Fractions review", "")
+    math_class.save_to_db(path)
+    other = MathClass(other_id, "Geometry")
+    other.add_exercise(1, 1, 1, "Fraction of a circle", "")
+    other.save_to_db(path)
+
+    # Shorter names where the words make up more of the name rank first
+    assert db.search_exercises(class_id, "fraction") == [(3, 1, 1), (13, 1, 1), (3, 1, 2)]
+    assert db.search_exercises(class_id, "fraction word") == [(3, 1, 2)]
+    assert [exercise.name for exercise in math_class.search_exercises("div", db_path=path)] == ["Long division"]
+    # Exercise ID prefixes, exact match first
+    assert db.search_exercises(class_id, "3.1") == [(3, 1, 1), (3, 1, 2), (3, 1, 3), (3, 12, 1)]
+    assert db.search_exercises(class_id, "3.1.2") == [(3, 1, 2)]
+    assert db.search_exercises(class_id, "13.1.1", limit=1) == [(13, 1, 1)]
+
+    # Deletes leave the index in the same transaction
+    math_class.remove_exercise(3, 1, 2, path)
+    assert db.search_exercises(class_id, "word") == []
+    assert db.execute("SELECT COUNT(*) FROM exercise_search").fetchone()[0] == 5
+    # An insert that conflicts with a saved exercise is not indexed twice
+    stale = MathClass(class_id, "Algebra")
+    stale.add_exercise(3, 1, 1, "Adding fractions", "")
+    stale.add_exercise(3, 1, 2, "Word problems again", "")
+    assert stale.save_to_db(path) == [(3, 1, 1)]
+    assert db.search_exercises(class_id, "word") == [(3, 1, 2)]
+    assert db.execute("SELECT COUNT(*) FROM exercise_search").fetchone()[0] == 6
+    db.rebuild_search_index()
+    assert db.search_exercises(other_id, "fraction") == [(1, 1, 1)]
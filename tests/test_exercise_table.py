@@ -0,0 +1,67 @@
+import datetime
+
+from src.exercise_table import ExerciseRow, ExerciseTable
+from src.math_class import MathClass, Exercise
+
+
+def build_class(storage):
+    math_class = MathClass(0, "Table class", storage=storage)
+    math_class.attach_exercise(Exercise(1, 1, 1, "Exercise 1", "link", 0, 1, None, "2023-01-01"))
+    math_class.attach_exercise(Exercise(1, 1, 2, "Exercise 2", "link", 0, 5, "2022-12-01", "2023-01-02"))
+    math_class.attach_exercise(Exercise(1, 1, 3, "Exercise 3", "link", 0, 2, "2022-12-30", "2023-01-09"))
+    math_class.add_exercise(1, 2, 1, "Exercise 4", "link")
+    return math_class
+
+
+def snapshot(math_class):
+    return [(e.get_key(), e.name, e.current_stage, e.last_review_date, e.due_date) for e in math_class.exercises]
+
+
+def test_row_view_reads_and_writes_columns():
+    table = ExerciseTable()
+    view = table.append(3, 2, 1, "Name", "link", 7, 2, "2023-01-01", None)
+    assert isinstance(view, ExerciseRow)
+    assert view.get_key() == (3, 2, 1)
+    assert view.last_review_date == datetime.date(2023, 1, 1)
+    assert view.due_date is None and view.get_due_day() is None
+
+    view.due_date = datetime.date(2023, 1, 5)
+    assert table.due_days[0] == datetime.date(2023, 1, 5).toordinal()
+    assert view.get_exercise_id_string() == "3.2.1"
+
+
+def test_table_remove_keeps_other_views_valid():
+    table = ExerciseTable()
+    first = table.append(1, 1, 1, "First", "")
+    table.append(1, 1, 2, "Second", "")
+    last = table.append(1, 1, 3, "Third", "")
+    table.remove(first)
+    assert len(table) == 2
+    assert last.name == "Third" and last.get_key() == (1, 1, 3)
+
+
+def test_batched_advance_matches_object_storage():
+    review_date = datetime.date(2023, 1, 2)
+    objects = build_class("objects")
+    table = build_class("table")
+
+    assert objects.advance_due_exercises(review_date) == table.advance_due_exercises(review_date) == 2
+    assert snapshot(objects) == snapshot(table)
+    assert objects.get_stage_histogram() == table.get_stage_histogram()
+    assert [e.get_key() for e in table.get_due_exercises(datetime.date(2023, 1, 5))] == [(1, 1, 1)]
+    assert table.exercises[1].due_date is None  # stage 5 advanced into retirement
+
+
+def test_table_storage_round_trips_through_database(tmp_path):
+    db_path = (tmp_path / "table.db").as_posix()
+    math_class = build_class("table")
+    math_class.save_to_db(db_path=db_path)
+    math_class.advance_due_exercises(datetime.date(2023, 1, 2))
+    math_class.save_to_db(db_path=db_path)
+    math_class._detach_exercise(math_class.get_exercise(1, 1, 3))
+    math_class.delete_exercise_from_db(1, 1, 3, dbpath=db_path)
+
+    loaded = MathClass(0, "Table class", storage="table")
+    loaded.load_exercises_from_database(db_path)
+    assert snapshot(loaded) == snapshot(math_class)
+    assert len(loaded.table) == 3
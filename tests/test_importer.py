@@ -0,0 +1,69 @@
+import json
+import sqlite3
+
+import pytest
+
+from src.importer import detect_format, parse_record
+from src.math_class import MathClass
+
+
+def test_import_csv_rejects_invalid_and_duplicate_rows(tmp_path):
+    db_path = (tmp_path / "import.db").as_posix()
+    csv_path = tmp_path / "catalog.csv"
+    csv_path.write_text("chapter,unit,number,name,web_link\n"
+                        "1,1,2,Second,http://a\n"
+                        "1,1,1,First,\n"
+                        "1,1,1,Duplicate,\n"
+                        "x,1,3,Bad chapter,\n"
+                        "1,2,1,,\n"
+                        "2,1,1,Third,http://b\n")
+    math_class = MathClass(0, "Import class")
+    math_class.add_exercise(2, 1, 1, "Existing", "")
+
+    report = math_class.import_exercises(csv_path.as_posix(), chunk_size=2, db_path=db_path)
+
+    assert (report.rows_read, report.imported, report.rejected) == (6, 2, 4)
+    assert [line for line, _ in report.rejected_rows] == [4, 5, 6, 7]
+    assert [e.get_key() for e in math_class.exercises] == [(1, 1, 1), (1, 1, 2), (2, 1, 1)]
+    assert not math_class._unit_of_work.has_changes()
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM exercises").fetchone()[0] == 3
+    conn.close()
+
+
+def test_import_jsonl(tmp_path):
+    db_path = (tmp_path / "import_jsonl.db").as_posix()
+    jsonl_path = tmp_path / "catalog.jsonl"
+    records = [{"chapter": 1, "unit": 1, "number": n, "name": f"Exercise {n}"} for n in range(1, 6)]
+    jsonl_path.write_text("\n".join(json.dumps(record) for record in records) + "\nnot json\n")
+
+    math_class = MathClass(0, "Import class", storage="table")
+    report = math_class.import_exercises(jsonl_path.as_posix(), db_path=db_path)
+
+    assert (report.imported, report.rejected) == (5, 1)
+    assert math_class.get_stage_histogram()[0] == 5
+    assert "5 of 6 rows" in report.summary()
+
+
+def test_failed_import_keeps_the_class_sorted(tmp_path):
+    db_path = (tmp_path / "import_failed.db").as_posix()
+    csv_path = tmp_path / "catalog.csv"
+    csv_path.write_bytes(b"chapter,unit,number,name\n5,1,1,Late\n1,1,1,Early\n" + b"2,1,1,x" * 2000 + b"\xff\n")
+    math_class = MathClass(0, "Import class")
+
+    with pytest.raises(UnicodeDecodeError):
+        math_class.import_exercises(csv_path.as_posix(), db_path=db_path)
+
+    assert [e.get_key() for e in math_class.exercises] == [(1, 1, 1), (5, 1, 1)]
+    assert not math_class._unit_of_work.has_changes()
+    math_class.remove_exercise(5, 1, 1, db_path)
+    assert [e.get_key() for e in math_class.select_exercises(chapters=[1])] == [(1, 1, 1)]
+
+
+def test_parse_record_and_format_detection():
+    assert parse_record({"chapter": "3", "unit": 2, "number": "1", "name": "A"}) == (3, 2, 1, "A", "")
+    with pytest.raises(ValueError):
+        parse_record({"chapter": -1, "unit": 2, "number": 1, "name": "A"})
+    with pytest.raises(ValueError):
+        detect_format("catalog.txt")
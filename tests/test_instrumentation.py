@@ -0,0 +1,65 @@
+import json
+import pstats
+
+import pytest
+
+import src.instrumentation as instrumentation
+from src.math_class import MathClass
+
+
+@pytest.fixture
+def metrics():
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def build_class(db_path):
+    math_class = MathClass(0, "Metrics class")
+    for number in range(1, 6):
+        math_class.add_exercise(1, 1, number, f"Exercise {number}", "")
+    math_class.save_to_db(db_path)
+    return math_class
+
+
+def test_disabled_records_nothing(tmp_path):
+    instrumentation.reset()
+    build_class((tmp_path / "off.db").as_posix())
+    assert instrumentation.snapshot()["operations"] == {}
+
+
+def test_records_timings_rows_and_statements(tmp_path, metrics):
+    db_path = (tmp_path / "on.db").as_posix()
+    build_class(db_path)
+    loaded = MathClass(0, "Metrics class")
+    loaded.load_exercises_from_database(db_path)
+
+    operations = instrumentation.snapshot()["operations"]
+    save = operations["MathClass.save_to_db"]
+    assert save["calls"] == 1 and save["rows"] == 5 and save["sql_statements"] >= 5
+    load = operations["MathClass.load_exercises_from_database"]
+    assert load["rows"] == 5 and load["seconds"] > 0
+
+
+def test_write_metrics_formats(tmp_path, metrics):
+    with instrumentation.measure("menu.example"):
+        instrumentation.add_rows(3)
+    json_path = tmp_path / "metrics.json"
+    prom_path = tmp_path / "metrics.prom"
+    instrumentation.write_metrics(json_path.as_posix())
+    instrumentation.write_metrics(prom_path.as_posix())
+
+    assert json.loads(json_path.read_text())["operations"]["menu.example"]["rows"] == 3
+    assert 'smr_operation_rows_total{operation="menu.example"} 3' in prom_path.read_text()
+
+
+@pytest.mark.parametrize("mode, filename", [("cprofile", "profile-action.prof"), ("tracemalloc", "profile-action-memory.txt")])
+def test_profile_capture(tmp_path, mode, filename):
+    with instrumentation.profile("action", mode, tmp_path.as_posix()):
+        sorted(range(1000), key=lambda value: -value)
+    output = tmp_path / filename
+    assert output.exists()
+    if mode == "cprofile":
+        assert pstats.Stats(output.as_posix()).total_calls > 0
@@ -2,25 +2,27 @@
 import pytest
 import datetime
 import sqlite3
-from src.math_class import MathClass, Exercise
+import src.database as database
+from src.math_class import MathClass, Exercise, bulk_advance_reviews, parse_date_string
+import src.scheduling as scheduling
 
 # Define the parameter sets
-@pytest.mark.parametrize("exercise_id, name, web_link", [
-    ("ex1", "Addition Basics", "https://www.example.com/addition"),
-    ("ex2", "Subtraction Basics", "https://www.example.com/subtraction"),
-    ("000.000.000", "This is a very long title. It's all about how math exercies are so fascinating. Greebo loves math. Kalyn loves math. We all love math.", "https://www.khanacademy.org/math/pre-algebra")
+@pytest.mark.parametrize("chapter, unit, number, name, web_link", [
+    (1, 1, 1, "Addition Basics", "https://www.example.com/addition"),
+    (1, 1, 2, "Subtraction Basics", "https://www.example.com/subtraction"),
+    (0, 0, 0, "This is a very long title. It's all about how math exercies are so fascinating. Greebo loves math. Kalyn loves math. We all love math.", "https://www.khanacademy.org/math/pre-algebra")
 ])
-def test_add_exercise(exercise_id, name, web_link):
+def test_add_exercise(chapter, unit, number, name, web_link):
     math_class = MathClass(0, "Test math class")
 
     # Add an exercise to the math_class
-    math_class.add_exercise(exercise_id, name, web_link)
+    math_class.add_exercise(chapter, unit, number, name, web_link)
 
     # Check if the exercise was added correctly
     added_exercise = math_class.exercises[-1]  # Access the last added exercise
 
     # Assert that the added exercise has the correct attributes
-    assert added_exercise.exercise_id == exercise_id
+    assert added_exercise.get_key() == (chapter, unit, number)
     assert added_exercise.name == name
     assert added_exercise.web_link == web_link
     assert added_exercise.class_id == 0
@@ -30,11 +32,12 @@ def test_add_exercise(exercise_id, name, web_link):
 def setup_math_class_with_exercises():
     math_class = MathClass(0,"Test math class")
     # Create mock exercises
-    exercise1 = Exercise("001", "Exercise 1", "http://example.com/1", 0, 1, "2023-01-01", "2023-01-02")
-    exercise2 = Exercise("002", "Exercise 2", "http://example.com/2", 0, 2, "2023-01-03", "2023-01-04")
-    exercise3 = Exercise("123.123.123", "Exercise 3", "www.math.org", 1, 6, None, None)
+    exercise1 = Exercise(0, 0, 1, "Exercise 1", "http://example.com/1", 0, 1, "2023-01-01", "2023-01-02")
+    exercise2 = Exercise(0, 0, 2, "Exercise 2", "http://example.com/2", 0, 2, "2023-01-03", "2023-01-04")
+    exercise3 = Exercise(123, 123, 123, "Exercise 3", "www.math.org", 0, 6, None, None)
     # Add mock exercises to MathClass instance
-    math_class.exercises.extend([exercise1, exercise2, exercise3])
+    for exercise in [exercise1, exercise2, exercise3]:
+        math_class.attach_exercise(exercise)
     return math_class
 
 def test_save_to_db(setup_math_class_with_exercises, tmp_path):
@@ -53,11 +56,386 @@ def test_save_to_db(setup_math_class_with_exercises, tmp_path):
 
     # Verify the number of inserted rows and some specific data
     assert len(rows) == 3  # Assuming you added 2 exercises
-    assert rows[0][0] == "001"  # Verify the first exercise's ID
-    assert rows[1][1] == "Exercise 2"  # Verify the second exercise's name
+    assert rows[0][:3] == (0, 0, 1)  # Verify the first exercise's ID
+    assert rows[1][3] == "Exercise 2"  # Verify the second exercise's name
 
     # Clean up by closing the database connection
     conn.close()
 
 
-    
+def test_save_to_db_writes_only_changed_rows(setup_math_class_with_exercises, tmp_path):
+    db_path = (tmp_path / "incremental.db").as_posix()
+    math_class = setup_math_class_with_exercises
+    math_class.save_to_db(db_path=db_path)
+    assert not math_class._unit_of_work.has_changes()
+    assert not any(exercise.is_new or exercise.is_dirty for exercise in math_class.exercises)
+
+    # Advance one exercise and check only that row is queued
+    math_class.exercises[0].advance_stage(datetime.date(2023, 1, 2))
+    assert list(math_class._unit_of_work.dirty) == [(0, 0, 1)]
+
+    statements = []
+    conn = database.get_database(db_path).connection
+    conn.set_trace_callback(statements.append)
+    try:
+        math_class.save_to_db(db_path=db_path)
+    finally:
+        conn.set_trace_callback(None)
+
+    # Each trigger step is traced as a repeat of the statement that fired it
+    assert len({s for s in statements if s.lstrip().startswith("UPDATE exercises")}) == 1
+    assert not any("INTO exercises" in s for s in statements)
+    assert len([s for s in statements if s.lstrip().startswith("INSERT INTO reviews")]) == 1
+
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("SELECT current_stage, due_date FROM exercises WHERE number = 1").fetchone()
+    conn.close()
+    assert row == (2, datetime.date(2023, 1, 5).toordinal())
+
+
+def test_delete_is_queued_with_pending_changes(setup_math_class_with_exercises, tmp_path):
+    db_path = (tmp_path / "delete.db").as_posix()
+    math_class = setup_math_class_with_exercises
+    math_class.save_to_db(db_path=db_path)
+
+    # A new exercise deleted before it is saved never reaches the database
+    math_class.add_exercise(5, 5, 5, "Temporary", "")
+    math_class._unit_of_work.register_deleted((5, 5, 5))
+    assert not math_class._unit_of_work.has_changes()
+
+    math_class.delete_exercise_from_db(0, 0, 2, dbpath=db_path)
+
+    conn = sqlite3.connect(db_path)
+    keys = conn.execute("SELECT chapter, unit, number FROM exercises ORDER BY chapter, unit, number").fetchall()
+    conn.close()
+    assert keys == [(0, 0, 1), (123, 123, 123)]
+
+
+def test_delete_then_re_add_in_one_save_replaces_the_row(tmp_path, capsys):
+    db_path = (tmp_path / "re_add.db").as_posix()
+    math_class = MathClass(1, "Algebra")
+    math_class.add_exercise(1, 1, 1, "old", "")
+    math_class.save_to_db(db_path)
+
+    math_class._detach_exercise(math_class.get_exercise(1, 1, 1))
+    math_class._unit_of_work.register_deleted((1, 1, 1))
+    math_class.add_exercise(1, 1, 1, "new", "")
+    assert math_class.save_to_db(db_path) == []
+    assert "changed by someone else" not in capsys.readouterr().out
+
+    reloaded = MathClass(1, "Algebra")
+    reloaded.load_exercises_from_database(db_path)
+    assert reloaded.get_exercise(1, 1, 1).name == "new"
+
+
+def test_due_index_tracks_advancement():
+    math_class = MathClass(0, "Due index class")
+    for number, due in enumerate(["2023-01-01", "2023-01-03", "2023-01-10", None], start=1):
+        math_class.attach_exercise(Exercise(1, 1, number, f"Exercise {number}", "", 0, 1 if due else 0, None, due))
+
+    review_date = datetime.date(2023, 1, 3)
+    assert math_class.count_reviews_to_advance(review_date) == 2
+    assert [e.number for e in math_class.get_due_exercises(review_date)] == [1, 2]
+
+    # Advancing moves exercises to their new due date bucket
+    for exercise in math_class.get_due_exercises(review_date):
+        exercise.advance_stage(review_date)
+    assert math_class.count_reviews_to_advance(review_date) == 0
+    assert [e.number for e in math_class.get_due_exercises(datetime.date(2023, 1, 10))] == [1, 2, 3]
+
+    # Starting an exercise puts it in the index
+    math_class.exercises[3].start(review_date)
+    assert [e.number for e in math_class.get_due_exercises(review_date)] == [4]
+
+
+def test_database_answers_due_query(setup_math_class_with_exercises, tmp_path):
+    db_path = (tmp_path / "due.db").as_posix()
+    setup_math_class_with_exercises.save_to_db(db_path=db_path)
+    rows = database.get_database(db_path).load_due_exercises(0, datetime.date(2023, 1, 2))
+    assert [row[:3] for row in rows] == [(0, 0, 1)]
+
+
+def test_stage_counts_and_next_exercise_queue(tmp_path):
+    math_class = MathClass(0, "Stage class")
+    for chapter, unit, number in [(2, 1, 1), (1, 2, 1), (1, 1, 3), (1, 1, 2)]:
+        math_class.add_exercise(chapter, unit, number, "", "")
+    db_path = (tmp_path / "stage.db").as_posix()
+    math_class.save_to_db(db_path=db_path)
+    assert math_class.get_stage_histogram()[0] == 4
+    assert math_class._find_next_stage_0_exercise().get_key() == (1, 1, 2)
+
+    start_date = datetime.date(2023, 1, 1)
+    started = math_class.start_next_exercises(3, start_date, db_path=db_path)
+    assert [e.get_key() for e in started] == [(1, 1, 2), (1, 1, 3), (1, 2, 1)]
+    assert math_class._find_number_of_stage_zero_exercises() == 1
+    assert math_class._find_number_of_stage_one_exercises() == 3
+    assert math_class._find_next_stage_0_exercise().get_key() == (2, 1, 1)
+    assert not math_class._unit_of_work.has_changes()
+
+
+def test_exercise_index_keeps_order_and_largest_number():
+    math_class = MathClass(0, "Index class")
+    for chapter, unit, number in [(1, 1, 5), (1, 1, 2), (1, 2, 1), (1, 1, 9)]:
+        math_class.add_exercise(chapter, unit, number, "", "")
+    assert [e.get_key() for e in math_class.exercises] == [(1, 1, 2), (1, 1, 5), (1, 1, 9), (1, 2, 1)]
+    assert math_class.get_largest_exercise_number(1, 1) == 9
+    assert math_class.get_exercise(1, 1, 5).number == 5
+
+    with pytest.raises(ValueError):
+        math_class.add_exercise(1, 1, 5, "Duplicate", "")
+
+    math_class._detach_exercise(math_class.get_exercise(1, 1, 9))
+    assert math_class.get_largest_exercise_number(1, 1) == 5
+    assert math_class.get_exercise(1, 1, 9) is None
+    assert [e.get_key() for e in math_class.exercises] == [(1, 1, 2), (1, 1, 5), (1, 2, 1)]
+
+
+def test_delete_exercise_removes_the_chosen_exercise(monkeypatch, tmp_path):
+    db_path = (tmp_path / "delete_prompt.db").as_posix()
+    math_class = MathClass(0, "Delete class")
+    for number in [1, 2, 3]:
+        math_class.add_exercise(1, 1, number, "", "")
+    math_class.save_to_db(db_path=db_path)
+
+    answers = iter(["1", "1", "2", "y"])
+    monkeypatch.setattr("builtins.input", lambda *args: next(answers))
+    monkeypatch.setattr(MathClass.delete_exercise_from_db, "__defaults__", (db_path,))
+    math_class.delete_exercise()
+
+    assert [e.number for e in math_class.exercises] == [1, 3]
+
+
+@pytest.mark.parametrize("storage", ["objects", "table"])
+def test_lazy_load_fetches_details_on_demand(setup_math_class_with_exercises, tmp_path, storage):
+    db_path = (tmp_path / "lazy.db").as_posix()
+    setup_math_class_with_exercises.save_to_db(db_path=db_path)
+
+    math_class = MathClass(0, "Test math class", storage=storage)
+    math_class.load_exercises_from_database(db_path, lazy=True, chunk_size=2)
+    assert [e.get_key() for e in math_class.exercises] == [(0, 0, 1), (0, 0, 2), (123, 123, 123)]
+    assert not any(e.has_details() for e in math_class.exercises)
+    assert math_class.exercises[1].due_date == datetime.date(2023, 1, 4)
+
+    # A single access fetches one exercise; a batch fetch fills in the rest
+    assert math_class.exercises[2].name == "Exercise 3"
+    assert [e.has_details() for e in math_class.exercises] == [False, False, True]
+    math_class.load_exercise_details(math_class.exercises)
+    assert [e.web_link for e in math_class.exercises] == ["http://example.com/1", "http://example.com/2", "www.math.org"]
+
+    # Saving a lazily loaded exercise does not need its details
+    math_class = MathClass(0, "Test math class", storage=storage)
+    math_class.load_exercises_from_database(db_path, lazy=True)
+    math_class.advance_due_exercises(datetime.date(2023, 1, 4))
+    math_class.save_to_db(db_path=db_path)
+    assert not any(e.has_details() for e in math_class.exercises)
+
+
+def test_parse_date_string_accepts_unpadded_dates():
+    assert parse_date_string("2023-01-02") == datetime.date(2023, 1, 2)
+    assert parse_date_string("2023-1-2") == datetime.date(2023, 1, 2)
+    for date_string in ["01/02/2023", "20230102", "2023-W01-1"]:
+        with pytest.raises(ValueError):
+            parse_date_string(date_string)
+
+
+def test_bulk_advance_matches_per_exercise_advance(tmp_path):
+    db_path = (tmp_path / "bulk.db").as_posix()
+    review_date = datetime.date(2023, 1, 10)
+    classes = {}
+    for class_id in [1, 2, 3]:
+        math_class = MathClass(class_id, f"Class {class_id}")
+        for stage in range(7):
+            due = None if stage in (0, 6) else f"2023-01-{stage + 4:02d}"
+            math_class.attach_exercise(Exercise(1, 1, stage, f"Stage {stage}", "", class_id, stage, None, due))
+        math_class.save_to_db(db_path=db_path)
+        classes[class_id] = math_class
+
+    counts = bulk_advance_reviews(review_date, class_ids=[1, 2], db_path=db_path)
+    assert counts == {1: 5, 2: 5}
+
+    for class_id, math_class in classes.items():
+        expected = MathClass(class_id, math_class.class_name)
+        expected.load_exercises_from_database(db_path)
+        if class_id != 3:
+            math_class.advance_due_exercises(review_date)
+        assert [(e.current_stage, e.last_review_date, e.due_date) for e in expected.exercises] == \
+               [(e.current_stage, e.last_review_date, e.due_date) for e in math_class.exercises]
+
+    assert bulk_advance_reviews(review_date, db_path=db_path) == {3: 5}
+    assert bulk_advance_reviews(review_date, class_ids=[], db_path=db_path) == {}
+
+
+def test_forecast_workload_and_auto_schedule(tmp_path):
+    db_path = (tmp_path / "forecast.db").as_posix()
+    math_class = MathClass(1, "Forecast")
+    math_class.attach_exercise(Exercise(1, 1, 1, "Overdue", "", 1, 2, "2023-01-01", "2023-01-04"))
+    math_class.attach_exercise(Exercise(1, 1, 2, "Tomorrow", "", 1, 1, None, "2023-01-06"))
+    for number in range(3, 8):
+        math_class.add_exercise(1, 1, number, f"New {number}", "")
+    start = datetime.date(2023, 1, 5)
+
+    forecast = math_class.forecast_workload(30, start)
+    assert len(forecast) == 30 and forecast[0][0] == start
+    busy_days = {(date - start).days: (reviews, problems) for date, reviews, problems in forecast if reviews}
+    assert busy_days == {0: (1, 3), 1: (1, 5), 4: (1, 3), 7: (1, 2), 11: (1, 2), 21: (1, 1), 25: (1, 1)}
+
+    assert math_class.plan_new_exercises(12, 30, start) == 1
+    assert math_class.plan_new_exercises(13, 30, start) == 2
+    assert math_class.plan_new_exercises(2, 30, start) == 0
+    with pytest.raises(ValueError):
+        math_class.plan_new_exercises(13, 0, start)
+
+    started = math_class.auto_schedule(13, 30, start, db_path=db_path)
+    assert [e.get_exercise_id_string() for e in started] == ["1.1.3", "1.1.4"]
+    assert max(problems for _, _, problems in math_class.forecast_workload(30, start)) <= 13
+
+
+def test_reviews_are_logged_and_compacted(tmp_path):
+    db_path = (tmp_path / "reviews.db").as_posix()
+    math_class = MathClass(1, "Reviews")
+    math_class.attach_exercise(Exercise(1, 1, 1, "One", "", 1, 1, None, "2023-01-01"))
+    math_class.attach_exercise(Exercise(1, 1, 2, "Two", "", 1, 2, None, "2023-01-01"))
+    math_class.attach_exercise(Exercise(1, 1, 3, "Three", "", 1, 0, None, None))
+    math_class.save_to_db(db_path=db_path)
+
+    math_class.advance_due_exercises(datetime.date(2023, 1, 1))
+    assert len(math_class._unit_of_work.reviews) == 2
+    math_class.save_to_db(db_path=db_path)
+    assert math_class._unit_of_work.reviews == []
+    assert bulk_advance_reviews(datetime.date(2023, 1, 4), db_path=db_path) == {1: 1}
+
+    assert math_class.get_review_history(1, 1, 1, db_path) == [(datetime.date(2023, 1, 1), 1), (datetime.date(2023, 1, 4), 2)]
+    db = database.get_database(db_path)
+    first, last = datetime.date(2023, 1, 1), datetime.date(2023, 12, 31)
+    by_stage = db.count_reviews_per_day(1, first, last)
+    assert by_stage == [(datetime.date(2023, 1, 1), 1, 1), (datetime.date(2023, 1, 1), 2, 1), (datetime.date(2023, 1, 4), 2, 1)]
+
+    assert db.compact_reviews(datetime.date(2023, 1, 2)) == 2
+    assert db.count_reviews_per_day(1, first, last) == by_stage
+    assert math_class.get_reviews_per_day(first, last, db_path) == [(datetime.date(2023, 1, 1), 2), (datetime.date(2023, 1, 4), 1)]
+    assert math_class.get_review_history(1, 1, 1, db_path) == [(datetime.date(2023, 1, 4), 2)]
+
+
+@pytest.mark.parametrize("storage", ["objects", "table"])
+def test_concurrent_saves_report_conflicts_instead_of_overwriting(tmp_path, storage, capsys):
+    db_path = (tmp_path / "concurrent.db").as_posix()
+    setup = MathClass(1, "Shared")
+    for number in range(1, 4):
+        setup.attach_exercise(Exercise(1, 1, number, f"Exercise {number}", "", 1, 1, None, "2023-01-01"))
+    setup.save_to_db(db_path=db_path)
+
+    first, second = MathClass(1, "Shared", storage=storage), MathClass(1, "Shared", storage=storage)
+    first.load_exercises_from_database(db_path)
+    second.load_exercises_from_database(db_path)
+
+    first.get_exercise(1, 1, 1).advance_stage(datetime.date(2023, 1, 1))
+    first.remove_exercise(1, 1, 3, db_path=db_path)
+    first.add_exercise(1, 1, 4, "Added first", "")
+    assert first.save_to_db(db_path=db_path) == []
+    assert first.get_exercise(1, 1, 1).version == 1
+
+    for number in (1, 2, 3):
+        second.get_exercise(1, 1, number).advance_stage(datetime.date(2023, 1, 2))
+    second.add_exercise(1, 1, 4, "Added second", "")
+    assert sorted(second.save_to_db(db_path=db_path)) == [(1, 1, 1), (1, 1, 3), (1, 1, 4)]
+    assert "3 exercises were changed by someone else" in capsys.readouterr().out
+
+    # The other writer's changes win and are reloaded, the exercise without a conflict is saved
+    assert second.get_exercise(1, 1, 3) is None
+    reloaded = second.get_exercise(1, 1, 1)
+    assert (reloaded.current_stage, reloaded.due_date, reloaded.version) == (2, datetime.date(2023, 1, 4), 1)
+    assert second.get_due_exercises(datetime.date(2023, 1, 3)) == []
+    saved = MathClass(1, "Shared")
+    saved.load_exercises_from_database(db_path)
+    assert [(e.get_exercise_id_string(), e.current_stage, e.version, e.name) for e in saved.exercises] == [
+        ("1.1.1", 2, 1, "Exercise 1"), ("1.1.2", 2, 1, "Exercise 2"), ("1.1.4", 0, 0, "Added first")]
+    assert saved.get_review_history(1, 1, 1, db_path) == [(datetime.date(2023, 1, 1), 1)]
+
+
+@pytest.mark.parametrize("storage", ["objects", "table"])
+def test_class_schedule_is_shared_by_every_advance_path(tmp_path, storage):
+    db_path = (tmp_path / "schedules.db").as_posix()
+    db = database.get_database(db_path)
+    short = scheduling.fixed_schedule([1, 2, 4], [3, 2, 1])
+    review_date = datetime.date(2023, 1, 10)
+    for class_name in ["Default", "Short"]:
+        class_id = db.create_class(class_name)
+        math_class = MathClass(class_id, class_name)
+        for stage in range(4):
+            due = None if stage == 0 else "2023-01-05"
+            math_class.attach_exercise(Exercise(1, 1, stage, f"Stage {stage}", "", class_id, stage, None, due))
+        math_class.save_to_db(db_path=db_path)
+    MathClass(2, "Short").set_schedule(short, db_path)
+
+    in_memory = MathClass(2, "Short", storage=storage)
+    in_memory.load_exercises_from_database(db_path)
+    assert in_memory.schedule is scheduling.from_spec(short.spec)
+    assert in_memory.get_stage_histogram() == {0: 1, 1: 1, 2: 1, 3: 1, 4: 0}
+    assert in_memory.get_exercise(1, 1, 2).get_num_of_exercises() == 2
+    in_memory.advance_due_exercises(review_date)
+
+    assert bulk_advance_reviews(review_date, db_path=db_path) == {1: 3, 2: 3}
+    for class_id, expected in [(1, [(1, 13), (2, 17), (3, 24)]), (2, [(1, 12), (2, 14), (3, None)])]:
+        bulk = MathClass(class_id, "")
+        bulk.load_exercises_from_database(db_path)
+        due_days = [(e.current_stage - 1, e.due_date and e.due_date.day) for e in bulk.exercises[1:]]
+        assert due_days == expected
+    assert [(e.current_stage, e.due_date) for e in in_memory.exercises] == [(e.current_stage, e.due_date) for e in bulk.exercises]
+
+    with pytest.raises(ValueError):
+        bulk.set_schedule(scheduling.fixed_schedule([1, 2], [1, 1]), db_path)
+
+
+@pytest.mark.parametrize("storage", ["objects", "table"])
+def test_retired_exercises_follow_a_shorter_schedule(tmp_path, storage):
+    db_path = (tmp_path / "retired.db").as_posix()
+    class_id = database.get_database(db_path).create_class("Retired")
+    math_class = MathClass(class_id, "Retired", storage)
+    for number in range(1, 4):
+        math_class.attach_exercise(Exercise(1, 1, number, "", "", class_id, 6, "2023-01-01", None))
+    math_class.save_to_db(db_path)
+
+    math_class.set_schedule(scheduling.fixed_schedule([1, 2, 4], [3, 2, 1]), db_path)
+    assert math_class.get_stage_histogram() == {0: 0, 1: 0, 2: 0, 3: 0, 4: 3}
+    assert not math_class._unit_of_work.has_changes()
+    reloaded = MathClass(class_id, "Retired", storage)
+    reloaded.load_exercises_from_database(db_path)
+    assert reloaded.get_stage_histogram() == {0: 0, 1: 0, 2: 0, 3: 0, 4: 3}
+    assert [e.version for e in reloaded.exercises] == [e.version for e in math_class.exercises]
+
+
+@pytest.mark.parametrize("storage", ["objects", "table"])
+def test_listing_filters_pages_and_reuses_cached_lines(storage, monkeypatch):
+    import io
+    math_class = MathClass(1, "Listing", storage)
+    for chapter in range(1, 4):
+        for number in range(1, 5):
+            math_class.attach_exercise(Exercise(chapter, 1, number, f"Exercise {chapter}.{number}", "", 1, number % 3,
+                                                None, "2023-01-02" if number % 3 else None))
+
+    out = io.StringIO()
+    math_class.print_all_exercises(stages=[1], chapters=[2, 3], out=out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith("Number")
+    assert [line.split()[0] for line in lines[1:]] == ["2.1.1", "2.1.4", "3.1.1", "3.1.4"]
+
+    out = io.StringIO()
+    math_class.print_all_exercises(limit=5, out=out)
+    assert len(out.getvalue().splitlines()) == 6
+
+    # Pages stop when asked to
+    prompts = []
+    monkeypatch.setattr("builtins.input", lambda prompt: prompts.append(prompt) or "q")
+    out = io.StringIO()
+    math_class.print_all_exercises(page_size=4, out=out)
+    assert len(out.getvalue().splitlines()) == 5 and len(prompts) == 1
+
+    # Only the changed exercise is formatted again
+    exercise = math_class.get_exercise(1, 1, 1)
+    cached_line = math_class._line_cache.get_line(exercise)
+    assert math_class._line_cache.get_line(exercise) is cached_line
+    exercise.advance_stage(datetime.date(2023, 1, 2))
+    out = io.StringIO()
+    math_class.print_due_exercises(chapters=[1], stages=[2], out=out)
+    assert cached_line not in out.getvalue()
+    assert out.getvalue().splitlines()[1].split()[-3:] == ["2", "2023-01-02", "2023-01-05"]
@@ -0,0 +1,64 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import src.migrations as migrations
+from src.database import Database
+
+
+@pytest.fixture
+def unversioned_db(tmp_path):
+    # A database as created before schema versioning: tables exist but user_version is 0
+    path = (tmp_path / "old.db").as_posix()
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE classes (class_id INTEGER PRIMARY KEY, class_name TEXT NOT NULL)")
+    conn.execute('''CREATE TABLE exercises (chapter INTEGER, unit INTEGER, number INTEGER, name TEXT, web_link TEXT,
+                    class_id INTEGER, current_stage INTEGER, last_review_date TEXT, due_date TEXT,
+                    PRIMARY KEY (chapter, unit, number, class_id))''')
+    conn.execute("INSERT INTO classes VALUES (1, 'Algebra')")
+    conn.execute("INSERT INTO exercises VALUES (1, 1, 1, 'Old', '', 1, 2, '2023-01-01', '2023-01-04')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_unversioned_database_is_migrated_once(unversioned_db):
+    db = Database(unversioned_db)
+    assert migrations.get_version(db.connection) == migrations.LATEST_VERSION
+    # Dates are converted to day numbers
+    assert db.load_exercises(1) == [(1, 1, 1, "Old", "", 1, 2, datetime.date(2023, 1, 1).toordinal(),
+                                     datetime.date(2023, 1, 4).toordinal(), 0)]
+    # Existing exercises are added to the search index
+    assert db.search_exercises(1, "old") == [(1, 1, 1)]
+    assert db.load_due_summary(datetime.date(2023, 1, 4)) == {1: {2: 1}}
+    db.close()
+
+    conn = sqlite3.connect(unversioned_db, isolation_level=None)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    assert migrations.migrate(conn) == []
+    assert statements == ["PRAGMA user_version"]
+    conn.close()
+
+
+def test_failed_migration_rolls_back(unversioned_db, monkeypatch):
+    def fail(cursor):
+        raise sqlite3.OperationalError("boom")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [
+        (migrations.LATEST_VERSION + 1, "broken", ("CREATE TABLE half_done (id INTEGER)", fail))])
+    conn = sqlite3.connect(unversioned_db, isolation_level=None)
+    with pytest.raises(sqlite3.OperationalError):
+        migrations.migrate(conn, target_version=migrations.LATEST_VERSION + 1)
+    assert migrations.get_version(conn) == migrations.LATEST_VERSION
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+    conn.close()
+
+
+def test_newer_database_is_refused(tmp_path):
+    conn = sqlite3.connect((tmp_path / "new.db").as_posix(), isolation_level=None)
+    conn.execute(f"PRAGMA user_version = {migrations.LATEST_VERSION + 1}")
+    with pytest.raises(sqlite3.DatabaseError):
+        migrations.migrate(conn)
+    conn.close()
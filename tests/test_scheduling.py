@@ -0,0 +1,35 @@
+import datetime
+
+import pytest
+
+import src.scheduling as scheduling
+
+
+def test_default_schedule_matches_the_stage_tables():
+    schedule = scheduling.DEFAULT_SCHEDULE
+    assert schedule.terminal_stage == scheduling.RETIRED_STAGE
+    assert schedule.next_intervals == (1, 3, 7, 14, 28, None)
+    assert schedule.next_deltas[2] == datetime.timedelta(days=7)
+    assert schedule.problems == (0, 5, 3, 2, 1, 1, 0)
+    assert schedule.review_offsets[3] == ((0, 3), (14, 4), (42, 5))
+
+
+def test_sm2_schedule_grows_by_the_ease_factor():
+    schedule = scheduling.sm2_schedule(2.0, problems=(4, 3, 2, 1, 1, 1))
+    assert schedule.terminal_stage == 7
+    assert schedule.next_intervals == (1, 1, 6, 12, 24, 48, None)
+    with pytest.raises(ValueError):
+        scheduling.sm2_schedule(1.0)
+
+
+def test_specs_round_trip_and_share_compiled_schedules():
+    fixed = scheduling.fixed_schedule([1, 2, 4], [3, 2, 1])
+    assert scheduling.from_spec(fixed.spec).next_intervals == fixed.next_intervals
+    assert scheduling.from_spec(fixed.spec) is scheduling.from_spec(fixed.spec)
+    assert scheduling.from_spec(scheduling.sm2_schedule(2.5).spec).next_intervals == (1, 1, 6, 15, 38, None)
+    assert scheduling.from_spec(None) is scheduling.DEFAULT_SCHEDULE
+    for bad in ['{"type": "fixed", "intervals": [1, 2]}', '{"type": "other"}', "not json"]:
+        with pytest.raises(ValueError):
+            scheduling.from_spec(bad)
+    with pytest.raises(ValueError):
+        scheduling.fixed_schedule([1, 0], [1, 1])
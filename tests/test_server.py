@@ -0,0 +1,130 @@
+import asyncio
+import datetime
+import json
+import sqlite3
+import threading
+
+import src.database as database
+from src.math_class import MathClass, Exercise
+from src.server import ClassCache, ReviewServer
+
+
+def build_database(tmp_path):
+    db_path = (tmp_path / "server.db").as_posix()
+    class_id = database.get_database(db_path).create_class("Algebra")
+    math_class = MathClass(class_id, "Algebra")
+    math_class.attach_exercise(Exercise(1, 1, 1, "Due", "http://a", class_id, 2, "2023-01-01", "2023-01-04"))
+    math_class.attach_exercise(Exercise(1, 1, 2, "Later", "", class_id, 1, None, "2023-01-09"))
+    math_class.add_exercise(1, 2, 1, "New", "")
+    math_class.save_to_db(db_path)
+    return db_path, math_class
+
+
+async def get(port, *paths):
+    #Sends the requests over one keep-alive connection and returns [(status, body)].
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    responses = []
+    for path in paths:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (line := await reader.readline()) != b"\r\n":
+            name, _, value = line.decode().partition(":")
+            headers[name.lower()] = value.strip()
+        responses.append((status, json.loads(await reader.readexactly(int(headers["content-length"])))))
+    writer.close()
+    return responses
+
+
+def run_with_server(db_path, scenario):
+    async def main():
+        review_server = ReviewServer(db_path, cache_size=2, workers=2)
+        server = await review_server.start("127.0.0.1", 0)
+        try:
+            return await scenario(review_server, server.sockets[0].getsockname()[1])
+        finally:
+            await review_server.close()
+    return asyncio.run(main())
+
+
+def test_endpoints(tmp_path):
+    db_path, _ = build_database(tmp_path)
+
+    async def scenario(review_server, port):
+        return await get(port, "/classes", "/classes/1/due?date=2023-01-05", "/classes/1/status?date=2023-01-05",
+                         "/classes/1/histogram", "/classes/9/due", "/classes/1/due?date=nope", "/nothing")
+
+    responses = run_with_server(db_path, scenario)
+    assert responses[0] == (200, [{"class_id": 1, "class_name": "Algebra"}])
+    assert responses[1][1]["exercises"] == [{"id": "1.1.1", "name": "Due", "web_link": "http://a", "stage": 2,
+                                             "problems": 3, "due_date": "2023-01-04"}]
+    assert responses[2][1] == {"class_id": 1, "class_name": "Algebra", "exercises": 3, "not_started": 1, "retired": 0, "due": 1}
+    assert responses[3][1]["stages"] == {"0": 1, "1": 1, "2": 1, "3": 0, "4": 0, "5": 0, "6": 0}
+    assert [status for status, _ in responses[4:]] == [404, 400, 404]
+
+
+def test_sqlite_work_stays_off_the_event_loop(tmp_path):
+    db_path, _ = build_database(tmp_path)
+
+    async def scenario(review_server, port):
+        threads = []
+        data_version = review_server.cache.db.data_version
+
+        def traced_data_version():
+            threads.append(threading.current_thread().name)
+            return data_version()
+
+        review_server.cache.db.data_version = traced_data_version
+        await get(port, "/classes", "/classes/1/status", "/classes/1/histogram")
+        return threads
+
+    threads = run_with_server(db_path, scenario)
+    assert len(threads) == 3 and len(set(threads)) == 1 and threads[0].startswith("smr-version")
+
+
+def test_cache_invalidation(tmp_path):
+    db_path, math_class = build_database(tmp_path)
+
+    async def scenario(review_server, port):
+        results = [await get(port, "/classes/1/due?date=2023-01-10")]
+        assert 1 in review_server.cache._entries
+
+        # A write through this process drops the class from the cache
+        math_class.advance_due_exercises(datetime.date(2023, 1, 10))
+        math_class.save_to_db(db_path)
+        assert 1 not in review_server.cache._entries
+        results.append(await get(port, "/classes/1/due?date=2023-01-10"))
+
+        # A write from another connection is picked up through data_version
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE exercises SET current_stage = 1, due_date = ? WHERE number = 1 AND unit = 2",
+                     (datetime.date(2023, 1, 2).toordinal(),))
+        conn.commit()
+        conn.close()
+        results.append(await get(port, "/classes/1/due?date=2023-01-10"))
+        return results
+
+    first, second, third = [responses[0][1]["exercises"] for responses in run_with_server(db_path, scenario)]
+    assert [e["id"] for e in first] == ["1.1.1", "1.1.2"]
+    assert second == []
+    assert [e["id"] for e in third] == ["1.2.1"]
+
+
+def test_class_invalidated_while_loading_is_not_cached(tmp_path, monkeypatch):
+    db_path, _ = build_database(tmp_path)
+    cache = ClassCache(db_path)
+    load = MathClass.load_exercises_from_database
+
+    def load_then_write(self, *args, **kwargs):
+        # Another writer commits after the rows were read
+        load(self, *args, **kwargs)
+        cache.invalidate([self.class_id])
+
+    monkeypatch.setattr(MathClass, "load_exercises_from_database", load_then_write)
+    assert cache.get(1).math_class.class_id == 1
+    assert 1 not in cache._entries
+    monkeypatch.setattr(MathClass, "load_exercises_from_database", load)
+    cache.get(1)
+    assert 1 in cache._entries
+    cache.close()
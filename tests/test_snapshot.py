@@ -0,0 +1,114 @@
+import datetime
+import os
+
+import pytest
+
+import src.database as database
+import src.instrumentation as instrumentation
+import src.scheduling as scheduling
+import src.snapshot as snapshot
+from src.math_class import MathClass, Exercise
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = (tmp_path / "snapshot.db").as_posix()
+    class_id = database.get_database(path).create_class("Algebra")
+    math_class = MathClass(class_id, "Algebra")
+    math_class.attach_exercise(Exercise(1, 1, 1, "Due", "http://a", class_id, 2, "2023-01-01", "2023-01-04"))
+    math_class.attach_exercise(Exercise(1, 1, 2, "Later", "", class_id, 1, None, "2023-01-09"))
+    for number in range(1, 4):
+        math_class.add_exercise(2, 1, number, f"New {number}", "")
+    math_class.save_to_db(path)
+    instrumentation.reset()
+    instrumentation.enable()
+    yield path
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def state(math_class):
+    return [(e.get_key(), e.name, e.web_link, e.current_stage, e.last_review_date, e.due_date, e.version, e.is_new, e.is_dirty)
+            for e in math_class.exercises]
+
+
+def loaded_from_database(class_id, db_path):
+    math_class = MathClass(class_id, "Algebra")
+    math_class.load_exercises_from_database(db_path)
+    return math_class
+
+
+@pytest.mark.parametrize("storage", ["objects", "table"])
+def test_snapshot_is_built_reused_and_refreshed(db_path, storage):
+    first = snapshot.load_class(1, "Algebra", db_path, storage)
+    assert os.path.exists(snapshot.get_snapshot_path(1, db_path))
+    second = snapshot.load_class(1, "Algebra", db_path, storage)
+    assert state(first) == state(second) == state(loaded_from_database(1, db_path))
+    assert second.get_stage_histogram()[0] == 3
+    assert [e.get_key() for e in second.get_due_exercises(datetime.date(2023, 1, 5))] == [(1, 1, 1)]
+
+    # Changes by another writer: an advance, an add, a delete, a delete and re-add under the same key, and a schedule
+    other = loaded_from_database(1, db_path)
+    other.advance_due_exercises(datetime.date(2023, 1, 5))
+    other.add_exercise(1, 2, 1, "Added", "")
+    other.remove_exercise(2, 1, 1, db_path)
+    other.remove_exercise(2, 1, 2, db_path)
+    other.add_exercise(2, 1, 2, "Replaced", "")
+    other.save_to_db(db_path)
+    other.set_schedule(scheduling.fixed_schedule([1, 2, 3, 4, 5], [5, 3, 2, 1, 1]), db_path)
+
+    refreshed = snapshot.load_class(1, "Algebra", db_path, storage)
+    assert state(refreshed) == state(loaded_from_database(1, db_path))
+    assert refreshed.get_exercise(2, 1, 2).name == "Replaced"
+    assert refreshed.schedule.next_intervals[1] == 2
+    counters = instrumentation.snapshot()["counters"]
+    assert (counters["snapshot_rebuilds"], counters["snapshot_hits"], counters["snapshot_refreshes"]) == (1, 1, 1)
+
+    # The restored class saves like one loaded from the database
+    refreshed.get_exercise(1, 1, 2).advance_stage(datetime.date(2023, 1, 9))
+    assert refreshed.save_to_db(db_path) == []
+    assert state(snapshot.load_class(1, "Algebra", db_path, storage)) == state(loaded_from_database(1, db_path))
+
+
+def test_unreadable_snapshot_is_rebuilt(db_path):
+    path = snapshot.get_snapshot_path(1, db_path)
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(b"not a snapshot")
+    assert len(snapshot.load_class(1, "Algebra", db_path).exercises) == 5
+    assert snapshot.ClassSnapshot.load(path, 1).change_count == database.get_database(db_path).get_change_count(1)
+    assert snapshot.ClassSnapshot.load(path, 2) is None
+
+
+@pytest.mark.parametrize("storage", ["objects", "table"])
+def test_refresh_notices_a_reused_rowid(db_path, storage):
+    # SQLite gives the rowid of a deleted last row to the next row added, which starts again at version 0
+    snapshot.load_class(1, "Algebra", db_path, storage)
+    other = loaded_from_database(1, db_path)
+    other.remove_exercise(2, 1, 3, db_path)
+    other.add_exercise(2, 1, 4, "Corrected", "")
+    other.save_to_db(db_path)
+
+    refreshed = snapshot.load_class(1, "Algebra", db_path, storage)
+    assert state(refreshed) == state(loaded_from_database(1, db_path))
+    assert refreshed.get_exercise(2, 1, 3) is None
+    assert refreshed.get_exercise(2, 1, 4).name == "Corrected"
+
+
+def test_unwritable_snapshot_directory_still_loads(db_path, capsys):
+    # A file where the snapshot directory should be makes every save fail
+    with open(f"{db_path}.snapshots", "w") as f:
+        f.write("")
+    math_class = snapshot.load_class(1, "Algebra", db_path)
+    assert state(math_class) == state(loaded_from_database(1, db_path))
+    assert "Could not save the class snapshot" in capsys.readouterr().out
+
+
+def test_refresh_reads_only_changed_rows(db_path):
+    snapshot.load_class(1, "Algebra", db_path)
+    taken = snapshot.ClassSnapshot.load(snapshot.get_snapshot_path(1, db_path), 1)
+    other = loaded_from_database(1, db_path)
+    other.start_next_exercises(1, datetime.date(2023, 1, 5), db_path)
+
+    _, _, rows, gone = database.get_database(db_path).load_snapshot_rows(1, taken.get_row_stamps())
+    assert [row[1:4] for row in rows] == [(2, 1, 1)] and gone == []
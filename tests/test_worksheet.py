@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+
+import src.database as database
+import src.scheduling as scheduling
+from src.math_class import MathClass, Exercise
+from src.worksheet import generate_all_worksheets, generate_worksheet, get_template
+
+REVIEW_DATE = datetime.date(2023, 1, 5)
+
+
+def build_class(class_id, class_name):
+    math_class = MathClass(class_id, class_name)
+    math_class.attach_exercise(Exercise(1, 1, 1, "Fractions <intro>", "http://a", class_id, 1, None, "2023-01-05"))
+    math_class.attach_exercise(Exercise(1, 1, 2, "Ratios | rates", "http://b", class_id, 3, "2022-12-29", "2023-01-04"))
+    math_class.attach_exercise(Exercise(1, 1, 3, "Not due", "http://c", class_id, 2, "2023-01-04", "2023-01-07"))
+    return math_class
+
+
+@pytest.mark.parametrize("file_format, expected", [
+    ("text", "1.1.2  Ratios | rates\n    Stage 3: 2 problems"),
+    ("html", "<td>Fractions &lt;intro&gt;</td><td>1</td><td>5</td>"),
+    ("markdown", "| 1.1.2 | Ratios \\| rates | 3 | 2 | http://b |"),
+])
+def test_generate_worksheet_formats(tmp_path, file_format, expected):
+    path, exercise_count, problem_total = generate_worksheet(build_class(1, "Algebra"), (tmp_path / "sheet").as_posix(),
+                                                             file_format, REVIEW_DATE)
+    content = open(path, encoding="utf-8").read()
+    assert (exercise_count, problem_total) == (2, 7)
+    assert expected in content
+    assert "Not due" not in content
+    assert "2 exercises, 7 problems in total." in content
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        get_template("pdf")
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_generate_all_worksheets(tmp_path, processes):
+    db_path = (tmp_path / "batch.db").as_posix()
+    db = database.get_database(db_path)
+    for class_name in ["Algebra", "Geometry", "Calculus"]:
+        class_id = db.create_class(class_name)
+        build_class(class_id, class_name).save_to_db(db_path)
+
+    results = generate_all_worksheets((tmp_path / "out").as_posix(), "markdown", REVIEW_DATE, db_path, processes)
+
+    assert [(class_id, count, total) for class_id, _, count, total in results] == [(1, 2, 7), (2, 2, 7), (3, 2, 7)]
+    assert "# Worksheet for Geometry" in open(results[1][1], encoding="utf-8").read()
+
+
+def test_batch_worksheet_uses_class_schedule(tmp_path):
+    db_path = (tmp_path / "schedule.db").as_posix()
+    class_id = database.get_database(db_path).create_class("Algebra")
+    math_class = build_class(class_id, "Algebra")
+    math_class.attach_exercise(Exercise(1, 1, 4, "Late stage", "", class_id, 7, "2023-01-01", "2023-01-05"))
+    math_class.save_to_db(db_path)
+    math_class.set_schedule(scheduling.fixed_schedule([1, 1, 1, 1, 1, 1, 1, 1], [2, 2, 2, 2, 2, 2, 2, 2]), db_path)
+
+    _, count, total = generate_worksheet(math_class, (tmp_path / "single").as_posix(), "text", REVIEW_DATE)
+    [(_, _, batch_count, batch_total)] = generate_all_worksheets((tmp_path / "out").as_posix(), "text", REVIEW_DATE, db_path)
+    assert (count, total) == (batch_count, batch_total) == (3, 6)